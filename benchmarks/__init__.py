@@ -0,0 +1,7 @@
+# encoding: utf-8
+"""
+Performance benchmarks of pylock.
+
+Run with ``python -m benchmarks`` from repository root; results are
+printed (or saved) as JSON, so they can be compared between revisions.
+"""
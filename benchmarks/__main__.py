@@ -0,0 +1,147 @@
+# encoding: utf-8
+"""Runs benchmarks and reports results as JSON
+
+Usage::
+
+    python -m benchmarks --output results.json
+    python -m benchmarks --compare results.json --threshold 0.2
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from . import cases
+from .strategies import available_strategies, default_locations, filesystem_type, \
+    IN_PROCESS
+
+# metric -> whether higher value is better
+METRICS = {'ops_per_sec': True, 'ns_per_op': False,
+           'handoff_p50': False, 'handoff_p99': False}
+
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    args.workers = args.workers or [2, 8]
+    args.mode = args.mode or ['processes', 'threads']
+
+    locations = default_locations()
+    if args.location:
+        locations = dict(location.split('=', 1) for location in args.location)
+    strategies = args.strategy or available_strategies()
+
+    results = []
+    for strategy in strategies:
+        for location, path in sorted(locations.items()):
+            results.extend(run(strategy, location, path, args))
+
+    document = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    output = json.dumps(document, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as stream:
+            stream.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as stream:
+            baseline = json.load(stream)
+        regressions = compare(baseline['results'], results, args.threshold)
+        for regression in regressions:
+            print('regression: {0}'.format(regression), file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+def run(strategy, location, path, args):
+    """Runs all benchmark cases for given strategy and location
+
+    :rtype: list
+    """
+    directory = tempfile.mkdtemp('pylock_bench', dir=path)
+    base = {'strategy': strategy, 'location': location,
+            'filesystem': filesystem_type(directory)}
+    try:
+        measured = [
+            ('uncontended', cases.uncontended(strategy, directory, args.iterations)),
+            ('state_check', cases.state_check(strategy, directory, args.iterations)),
+        ]
+        for mode in args.mode:
+            if mode == 'processes' and strategy in IN_PROCESS:
+                continue
+            for workers in args.workers:
+                measured.append(('contention', cases.contention(
+                    strategy, directory, args.contention_iterations, workers, mode)))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    results = []
+    for name, result in measured:
+        result.update(base, benchmark=name)
+        results.append(result)
+    return results
+
+
+def compare(baseline, results, threshold):
+    """Finds results worse than baseline by more than given fraction
+
+    :rtype: list
+    """
+    def key(result):
+        return tuple(result.get(name) for name in
+                     ('benchmark', 'strategy', 'location', 'mode', 'workers'))
+
+    previous = dict((key(result), result) for result in baseline)
+    regressions = []
+    for result in results:
+        reference = previous.get(key(result))
+        if reference is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = reference.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change < -threshold) if higher_is_better else (change > threshold):
+                regressions.append('{0} {1}: {2:.6g} -> {3:.6g}'.format(
+                    '/'.join(str(part) for part in key(result) if part is not None),
+                    metric, old, new))
+    return regressions
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description='Benchmarks pylock strategies')
+    parser.add_argument('--strategy', action='append',
+                        help='strategy to benchmark (all available by default)')
+    parser.add_argument('--location', action='append', metavar='NAME=DIR',
+                        help='directory to keep locks in '
+                             '(tmpfs and regular disk by default)')
+    parser.add_argument('--iterations', type=int, default=2000,
+                        help='iterations of uncontended and state check cases')
+    parser.add_argument('--contention-iterations', type=int, default=200,
+                        help='acquisitions made by each contending worker')
+    parser.add_argument('--workers', type=int, action='append',
+                        help='number of contending workers (2 and 8 by default)')
+    parser.add_argument('--mode', action='append', choices=('processes', 'threads'),
+                        help='kind of contending workers (both by default)')
+    parser.add_argument('--output', help='file to write results to (stdout by default)')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='results to compare with; exits with 1 on regression')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='tolerated relative slowdown (default: 0.2)')
+    return parser
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+# encoding: utf-8
+"""Benchmark cases; each returns dict of measurements"""
+import multiprocessing
+import os
+import threading
+import time
+
+from pylock import Lock
+from pylock.retry import Exponential
+
+from .strategies import STRATEGIES
+
+try:
+    clock = time.perf_counter
+except AttributeError: # pragma: no cover
+    clock = time.time
+
+
+def uncontended(strategy_name, directory, iterations):
+    """Acquire/release throughput of single lock nobody else competes for"""
+    lock = Lock(STRATEGIES[strategy_name](os.path.join(directory, 'uncontended.pid')))
+
+    started = clock()
+    for _ in range(iterations):
+        lock.acquire()
+        lock.release()
+    elapsed = clock() - started
+
+    return {'iterations': iterations, 'ops_per_sec': iterations / elapsed}
+
+
+def state_check(strategy_name, directory, iterations):
+    """Cost of evaluating state of lock held by other (live) process"""
+    strategy = STRATEGIES[strategy_name](os.path.join(directory, 'state_check.pid'))
+    lock = Lock(strategy)
+    strategy.create(os.getppid())
+    try:
+        started = clock()
+        for _ in range(iterations):
+            state = lock.get_lock_state()
+        elapsed = clock() - started
+    finally:
+        strategy.clean()
+
+    return {'iterations': iterations, 'state': state.name,
+            'ns_per_op': elapsed / iterations * 1e9}
+
+
+def contention(strategy_name, directory, iterations, workers, mode):
+    """Handoff latency (time lock stays free between consecutive holders)
+    and overall throughput of many workers competing for single lock
+
+    :param mode: either 'processes' or 'threads'
+    :type mode: str
+    """
+    path = os.path.join(directory, 'contention.pid')
+    if mode == 'processes':
+        context = _context()
+        start = context.Event()
+        last_release = context.Value('d', 0.0, lock=False)
+        results = context.Queue()
+        spawn = context.Process
+    else:
+        start = threading.Event()
+        last_release = _Value()
+        results = _Results()
+        spawn = threading.Thread
+
+    runners = [spawn(target=_contend,
+                     args=(strategy_name, path, iterations, start, last_release, results))
+               for _ in range(workers)]
+    for runner in runners:
+        runner.start()
+    started = clock()
+    start.set()
+    latencies = []
+    errors = []
+    for _ in runners:
+        error, measured = results.get()
+        if error:
+            errors.append(error)
+        latencies.extend(measured)
+    elapsed = clock() - started
+    for runner in runners:
+        runner.join()
+    if errors:
+        raise RuntimeError('Worker failed: {0}'.format(errors[0]))
+
+    latencies.sort()
+    return {'iterations': iterations, 'workers': workers, 'mode': mode,
+            'ops_per_sec': workers * iterations / elapsed,
+            'handoff_p50': _percentile(latencies, 0.5),
+            'handoff_p99': _percentile(latencies, 0.99)}
+
+
+def _contend(strategy_name, path, iterations, start, last_release, results):
+    lock = Lock(STRATEGIES[strategy_name](path),
+                retry_policy=Exponential(base=0.0005, max_delay=0.01, tries=None))
+    latencies = []
+    start.wait()
+    try:
+        for _ in range(iterations):
+            if not lock.acquire(timeout=-1).is_owner:
+                raise RuntimeError('Could not acquire lock')
+            acquired = time.time()
+            if last_release.value:
+                latencies.append(acquired - last_release.value)
+            last_release.value = time.time()
+            lock.release()
+    except Exception as exc:
+        # parent waits for results of every worker
+        results.put((repr(exc), latencies))
+        return
+    results.put((None, latencies))
+
+
+def _context():
+    try:
+        return multiprocessing.get_context('fork')
+    except (AttributeError, ValueError): # pragma: no cover
+        return multiprocessing
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    return values[int(round(fraction * (len(values) - 1)))]
+
+
+class _Value(object):
+    value = 0.0
+
+
+class _Results(object):
+
+    def __init__(self):
+        self._items = []
+        self._condition = threading.Condition()
+
+    def put(self, item):
+        with self._condition:
+            self._items.append(item)
+            self._condition.notify()
+
+    def get(self):
+        with self._condition:
+            while not self._items:
+                self._condition.wait()
+            return self._items.pop()
@@ -0,0 +1,117 @@
+# encoding: utf-8
+"""Strategies and storage locations benchmarks are run against"""
+import os
+import shutil
+import tempfile
+
+from pylock.strategy.file import File
+
+
+def _file(path):
+    return File(path)
+
+
+def _flock(path):
+    from pylock.strategy.flock import Flock
+    return Flock(path)
+
+
+def _memory(path):
+    from pylock.strategy.memory import Memory
+    return Memory(path)
+
+
+def _shm(path):
+    from pylock.strategy.shm import SharedMemory
+    directory, name = os.path.split(path)
+    return SharedMemory(name, directory)
+
+
+def _table(path):
+    from pylock.strategy.table import LockTable
+    directory, name = os.path.split(path)
+    return LockTable(os.path.join(directory, 'locks.table')).lock(name)
+
+
+def _sqlite(path):
+    from pylock.strategy.sqlite import LockDatabase
+    directory, name = os.path.split(path)
+    return LockDatabase(os.path.join(directory, 'locks.db')).lock(name)
+
+
+# directory -> lock server running in current process and its client
+_servers = {}
+
+
+def _remote(path):
+    from pylock.server import LockServer
+    from pylock.strategy.remote import LockClient
+    directory, name = os.path.split(path)
+    if directory not in _servers:
+        address = os.path.join(directory, 'pylock.sock')
+        _servers[directory] = (LockServer(address).start(), LockClient(address))
+    return _servers[directory][1].lock(name)
+
+
+# name -> factory building strategy for lock at given path
+STRATEGIES = {
+    'file': _file,
+    'flock': _flock,
+    'memory': _memory,
+    'remote': _remote,
+    'shm': _shm,
+    'sqlite': _sqlite,
+    'table': _table,
+}
+
+# strategies whose locks are not visible to other processes
+IN_PROCESS = frozenset(['memory'])
+
+
+def available_strategies():
+    """Returns names of strategies that work on current platform
+
+    :rtype: list
+    """
+    names = []
+    for name, factory in sorted(STRATEGIES.items()):
+        directory = tempfile.mkdtemp('pylock_bench')
+        try:
+            factory(os.path.join(directory, 'probe.pid'))
+        except (ImportError, NotImplementedError):
+            continue
+        finally:
+            shutil.rmtree(directory)
+        names.append(name)
+    return names
+
+
+def default_locations():
+    """Returns directories representing tmpfs and regular disk
+
+    :rtype: dict
+    """
+    locations = {'disk': tempfile.gettempdir()}
+    if os.path.isdir('/dev/shm'):
+        locations['tmpfs'] = '/dev/shm'
+    return locations
+
+
+def filesystem_type(path):
+    """Returns type of filesystem given path is kept on (Linux only)
+
+    :rtype: str
+    """
+    path = os.path.realpath(path)
+    best, fstype = '', None
+    try:
+        with open('/proc/mounts') as mounts:
+            for line in mounts:
+                fields = line.split()
+                mount_point = fields[1]
+                if (path == mount_point or path.startswith(mount_point.rstrip('/') + '/')) \
+                        and len(mount_point) >= len(best):
+                    best, fstype = mount_point, fields[2]
+    except (IOError, OSError):
+        pass
+    return fstype
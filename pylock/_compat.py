@@ -21,14 +21,26 @@ def with_metaclass(meta, *bases):
             return meta(name, bases, d)
     return type.__new__(metaclass, 'temporary_class', (), {})
 
-# try to import "mock" (built-in Py3, external module in Py2)
-try:
-    from unittest import mock as _mock
-    mock = _mock
-except ImportError:
-# mock is required only for tests - it might not be available for regular use
+def _import_mock():
+    # try to import "mock" (built-in Py3, external module in Py2)
     try:
+        from unittest import mock
+    except ImportError:
         import mock
+    return mock
+
+
+if sys.version_info >= (3, 7):
+    # mock is required only for tests - it is imported on first use,
+    # so regular use does not pay for importing unittest and asyncio
+    def __getattr__(name):
+        if name == 'mock':
+            return _import_mock()
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+else:
+    # mock is required only for tests - it might not be available for regular use
+    try:
+        mock = _import_mock()
     except ImportError:
         pass
 
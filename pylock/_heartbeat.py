@@ -0,0 +1,54 @@
+# encoding: utf-8
+"""
+Background thread renewing leases of held locks.
+"""
+import threading
+
+from logging_utils import getLogger
+
+logger = getLogger(__name__)
+
+
+class Heartbeat(object):
+    """Calls given function periodically from a daemon thread,
+    until it returns False"""
+
+    def __init__(self, interval, func):
+        """ Object initialization
+
+        :param interval: delay (seconds) between consecutive calls
+        :type interval: float
+        :param func: function to be called
+        :type func: callable
+        """
+        super(Heartbeat, self).__init__()
+
+        self._interval = interval
+        self._func = func
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='pylock-heartbeat')
+        self._thread.daemon = True
+
+    @property
+    def is_running(self):
+        # thread does not survive fork, so child sees heartbeat as stopped
+        return self._thread.is_alive() and not self._stopped.is_set()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops calling the function and waits for pending call"""
+        self._stopped.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                if self._func() is False:
+                    self._stopped.set()
+                    return
+            except Exception:
+                logger.exception('could not renew lock lease')
@@ -0,0 +1,102 @@
+# encoding: utf-8
+"""
+Minimal inotify(7) bindings used to wait for lock release.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct('iIII')
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+    _libc.inotify_init1
+    _libc.inotify_add_watch
+except (OSError, AttributeError):
+    _libc = None
+
+
+def is_available():
+    return _libc is not None
+
+
+def wait(path, mask, timeout, name=None, ready=None):
+    """Waits for inotify event on given path
+
+    :param path: path to be watched (file or directory)
+    :type path: str
+    :param mask: events to wait for
+    :type mask: int
+    :param timeout: max time to wait (seconds)
+    :type timeout: float
+    :param name: when watching directory - name of file events must concern
+    :type name: str
+    :param ready: callable checked once watch is set up; \
+                    when it returns True waiting is skipped
+    :type ready: callable
+    :returns: True when event occurred (or `ready` returned True), \
+                False on timeout, None when inotify is not available
+    :rtype: bool
+    """
+    if _libc is None:
+        return None
+
+    fd = _libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+    if fd < 0:
+        return None
+
+    try:
+        if _libc.inotify_add_watch(fd, _encode(path), mask) < 0:
+            return None
+        if ready is not None and ready():
+            return True
+        return _wait_for_event(fd, timeout, _encode(name))
+    finally:
+        os.close(fd)
+
+
+def _wait_for_event(fd, timeout, name):
+    deadline = time.time() + timeout
+    remaining = timeout
+    while remaining > 0:
+        try:
+            readable, _, _ = select.select([fd], [], [], remaining)
+        except (OSError, select.error) as exc:
+            if exc.args[0] != errno.EINTR:
+                raise
+            readable = []
+        if readable and _has_event(os.read(fd, 4096), name):
+            return True
+        remaining = deadline - time.time()
+    return False
+
+
+def _has_event(buf, name):
+    if name is None:
+        return True
+    offset = 0
+    while offset + _EVENT.size <= len(buf):
+        _, _, _, length = _EVENT.unpack_from(buf, offset)
+        offset += _EVENT.size
+        if buf[offset:offset + length].rstrip(b'\0') == name:
+            return True
+        offset += length
+    return False
+
+
+def _encode(path):
+    if path is None or isinstance(path, bytes):
+        return path
+    return path.encode('utf-8')
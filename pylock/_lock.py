@@ -0,0 +1,757 @@
+# encoding: utf-8
+"""Module holds lock classes (exported by :mod:`pylock`)"""
+import time
+from collections import Counter
+
+from logging_utils import getLogger
+
+from . import AlreadyLockedError, CouldNotCreateLockError, _registry
+from ._heartbeat import Heartbeat
+from .hooks import chain
+from .states import LockState
+from .pid_owner_client import default_client
+from .retry import Deadline, Fixed
+
+logger = getLogger(__name__)
+
+# how often waiter queued behind others checks whether its turn has come
+_TURN_CHECK_INTERVAL = 0.05
+
+_SHAREABLE_STATES = frozenset([LockState.OWNER, LockState.UNLOCKED,
+                               LockState.ORPHANED, LockState.OUTDATED])
+
+
+class Lock(object):
+    """Class that represents single lock """
+
+    def __init__(self, strategy, max_age=None, tries=3, sleeptime=2,
+                 delay_provider=time.sleep, current_time_provider=time.time,
+                 pid_owner_client=None, retry_policy=None, reentrant=False,
+                 verify_interval=None, lease=None, renew_interval=None,
+                 hooks=None, fencing=False, fair=False):
+        """ Object initialization
+
+        :param strategy: lock strategy that performs locking
+        :type strategy: pylock.strategy.Base
+        :param max_age: Time after which other instance will break lock
+        :type max_age: int
+        :param tries: max number of tries to obtain lock \
+                        (ignored when `retry_policy` is given)
+        :type tries: int
+        :param sleeptime: sleep time between consecutiwe tries to obtain lock \
+                        (ignored when `retry_policy` is given)
+        :type sleeptime: int
+        :param retry_policy: policy deciding how long to wait between tries \
+                        to obtain lock; defaults to fixed `sleeptime` delay \
+                        and `tries` attempts
+        :type retry_policy: pylock.retry.RetryPolicy
+        :param reentrant: whether lock may be acquired many times by its \
+                        owner (and has to be released the same number of \
+                        times); ownership is then remembered in memory and \
+                        confirmed without asking the strategy
+        :type reentrant: bool
+        :param verify_interval: how often (seconds) reentrant lock checks \
+                        that its record has not been replaced; \
+                        None disables the check
+        :type verify_interval: float
+        :param pid_owner_client: client checking whether lock owner is alive; \
+                        defaults to the best one available on current platform
+        :type pid_owner_client: pylock.pid_owner_client.Client
+        :param lease: time (seconds) after which lock is considered \
+                        outdated unless renewed; lock is renewed by \
+                        background thread as long as it is held. Lease is \
+                        stored in lock record, so it takes precedence over \
+                        `max_age` of other contenders (exclusive lock only)
+        :type lease: float
+        :param renew_interval: how often (seconds) lease is renewed; \
+                        defaults to one third of `lease`
+        :type renew_interval: float
+        :param hooks: hooks notified about lock events \
+                        (see :mod:`pylock.hooks`)
+        :type hooks: list
+        :param fencing: whether each acquisition should obtain fencing \
+                        token from strategy (see :attr:`token`); token is \
+                        stored in lock record (exclusive lock only)
+        :type fencing: bool
+        :param fair: whether waiters should be granted lock in order \
+                        of arrival; waiter takes ticket from strategy \
+                        once its first attempt fails and only the first \
+                        live waiter in queue tries to acquire lock, \
+                        so nobody starves. Waiter still gives up \
+                        according to `timeout` or retry policy, \
+                        which should allow for the queue ahead of it
+        :type fair: bool
+        :raises NotImplementedError: fair lock is requested but strategy \
+                        does not keep queue of waiters
+        """
+        super(Lock, self).__init__()
+        if fair and not strategy.queues_waiters:
+            raise NotImplementedError('Strategy does not support fair locks')
+
+        self._strategy = strategy
+        self._max_age = max_age
+        self._retry_policy = retry_policy or Fixed(sleeptime, tries)
+        self._delay_provider = delay_provider
+        self._current_time_provider = current_time_provider
+        self._pid_owner_client = pid_owner_client or default_client()
+        # number of attempts -> number of acquire calls that took them
+        self.attempts = Counter()
+        self.last_attempts = 0
+        self._reentrant = reentrant
+        self._verify_interval = verify_interval
+        self._holds = 0
+        self._fingerprint = None
+        self._verified_at = 0
+        self._generation = _registry.generation()
+        self._identity = None
+        self._identity_pid = None
+        self._lease = lease
+        self._renew_interval = renew_interval or (lease and lease / 3.0)
+        self._heartbeat = None
+        self._hook = chain(hooks)
+        self._acquired_at = None
+        self._fencing = fencing
+        self._token = None
+        self._fair = fair
+        # owners waiting for their turn in queue of fair lock
+        # -> (their ticket, ticket of waiter directly ahead of them)
+        self._queued = {}
+
+    @property
+    def pid(self):
+        return _registry.pid()
+
+    @property
+    def identity(self):
+        """Returns information identifying current process beyond its pid,
+        stored along with lock record
+
+        :rtype: dict
+        """
+        pid = self.pid
+        if self._identity_pid != pid:
+            self._identity = self._pid_owner_client.identify(pid)
+            self._identity_pid = pid
+        return self._identity
+
+    @property
+    def strategy(self):
+        return self._strategy
+
+    @property
+    def token(self):
+        """Fencing token of current acquisition; greater than tokens of all
+        previous owners, so storage written by lock owner can reject writes
+        of former owners that still think they hold the lock.
+        None unless lock is held with fencing enabled.
+
+        :rtype: int
+        """
+        if self._token is not None and self._slot.owner is _registry.current_owner():
+            return self._token
+        return None
+
+    @property
+    def retry_policy(self):
+        return self._retry_policy
+
+    @property
+    def has_lock(self):
+        """Returns information whether lock has been acquired or not
+
+        :rtype: bool
+        """
+        slot = self._slot
+        owner = _registry.current_owner()
+        if slot.is_held_by_other(owner):
+            return False
+        if self._is_trusted_owner(slot, owner):
+            return True
+        return self.get_lock_state().is_owner
+
+    def _is_trusted_owner(self, slot, owner):
+        """ Whether ownership can be confirmed without asking the strategy """
+        if not (self._holds and slot.owner is owner):
+            return False
+
+        if self._verify_interval is None:
+            return True
+
+        now = self._current_time_provider()
+        if now - self._verified_at < self._verify_interval:
+            return True
+
+        if self._strategy.fingerprint() == self._fingerprint:
+            self._verified_at = now
+            return True
+
+        # lock record has been replaced - lock is lost
+        self._holds = 0
+        slot.release(owner)
+        return False
+
+    def _hold(self):
+        """ Remembers ownership of reentrant lock """
+        if not self._reentrant:
+            return
+        if not self._holds and self._verify_interval is not None:
+            self._fingerprint = self._strategy.fingerprint()
+            self._verified_at = self._current_time_provider()
+        self._holds += 1
+
+    @property
+    def _slot(self):
+        generation = _registry.generation()
+        if generation != self._generation:
+            # process has been forked - ownership belongs to parent
+            self._generation = generation
+            self._holds = 0
+        return _registry.slot(self._strategy.key)
+
+    def acquire(self, blocking=True, timeout=None):
+        """ Method acquires lock
+
+        :param blocking: when False lock is tried only once
+        :type blocking: bool
+        :param timeout: max time to wait for the lock (seconds); negative \
+                            value waits forever; when omitted retry policy \
+                            decides how many attempts are made
+        :type timeout: float
+        :returns: lock state information
+        :rtype: pylock.states.LockState
+        :raises CouldNotCreateLockError: when lockfile could not be written
+                                            (but was supposed to)
+        """
+        for state, delay in self._steps(blocking, timeout, sliced=False):
+            if delay is None:
+                return state
+            self._wait(delay)
+
+    def acquire_steps(self, blocking=True, timeout=None):
+        """ Tries to acquire lock step by step, without waiting
+
+        After each attempt a (state, delay) pair is yielded: caller is
+        supposed to wait `delay` seconds before resuming iteration.
+        Waiter of fair lock queued behind others gets delay in short
+        slices, its turn in queue being checked between them.
+        `None` delay marks final attempt. Makes it possible to drive
+        acquisition from a non-blocking framework.
+        Number of attempts is recorded in `attempts` counter.
+
+        :param blocking: when False lock is tried only once
+        :type blocking: bool
+        :param timeout: see :meth:`acquire`
+        :type timeout: float
+        :rtype: iterator
+        :raises CouldNotCreateLockError: when lockfile could not be written
+                                            (but was supposed to)
+        """
+        return self._steps(blocking, timeout, sliced=True)
+
+    def _steps(self, blocking, timeout, sliced):
+        """ Acquisition steps, observed by hook if there is one
+
+        :param sliced: whether delay of waiter queued behind others is \
+                        given in short slices (caller cannot wait for \
+                        waiter ahead to leave queue)
+        :type sliced: bool
+        """
+        steps = self._acquire_steps(blocking, timeout, sliced)
+        if self._hook is None:
+            return steps
+        return self._observe(steps)
+
+    def _observe(self, steps):
+        """ Notifies hook about acquisition steps """
+        hook = self._hook
+        started = self._current_time_provider()
+        hook.acquire_started(self)
+        attempts = 0
+        state = None
+        try:
+            for state, delay in steps:
+                attempts += 1
+                hook.state_decided(self, state)
+                if delay is None:
+                    break
+                yielded_at = self._current_time_provider()
+                yield state, delay
+                hook.waited(self, self._current_time_provider() - yielded_at)
+        except:
+            hook.acquire_finished(self, None, attempts,
+                                  self._current_time_provider() - started)
+            raise
+
+        finished = self._current_time_provider()
+        if state.is_owner and (self._acquired_at is None or self._holds <= 1):
+            self._acquired_at = finished
+        hook.acquire_finished(self, state, attempts, finished - started)
+        yield state, None
+
+    def _acquire_steps(self, blocking, timeout, sliced):
+        slot = self._slot
+        owner = _registry.current_owner()
+        if self.has_lock and slot.reserve(owner):
+            self._hold()
+            self._start_heartbeat()
+            yield LockState.OWNER, None
+            return
+
+        if not blocking:
+            delays = iter(())
+        elif timeout is None:
+            delays = self._retry_policy.delays()
+        else:
+            delays = Deadline(timeout, self._retry_policy,
+                              self._current_time_provider).delays()
+
+        attempts = 0
+        ticket = None
+        # exclusive lock created but still awaiting shared holders
+        pending = False
+        try:
+            while True:
+                attempts += 1
+                state = error = None
+                ahead = None
+                try:
+                    if self._fair:
+                        ahead = self._waiter_ahead(ticket)
+                    if ahead is not None:
+                        state = LockState.LOCKED
+                    else:
+                        state = self._attempt(slot, owner)
+                    pending = state is LockState.SHARED
+                    if state.is_owner:
+                        ticket = self._leave_queue(ticket, owner)
+                        self._hold()
+                        self._start_heartbeat()
+                        self._record_attempts(attempts)
+                        yield state, None
+                        return
+                except CouldNotCreateLockError as exc:
+                    error = exc
+
+                # permanent failure is not retried
+                delay = None if error is not None and error.permanent else next(delays, None)
+                if delay is None:
+                    ticket = self._leave_queue(ticket, owner)
+                    self._record_attempts(attempts)
+                    if pending:
+                        # give up lock waiting for shared holders to release it
+                        pending = self._give_up_pending(slot, owner)
+                    if error is not None:
+                        raise error
+                    yield state, None
+                    return
+                if self._fair:
+                    ticket = self._join_queue(ticket, owner, ahead)
+                # waiter ahead hands lock over rather than releasing it,
+                # so turn in queue is checked often, not once per delay
+                # (last slice takes remainder, so no tiny slice is left)
+                while sliced and ahead is not None and delay >= 2 * _TURN_CHECK_INTERVAL:
+                    yield state, _TURN_CHECK_INTERVAL
+                    delay -= _TURN_CHECK_INTERVAL
+                    if self._waiter_ahead(ticket) is None:
+                        break
+                else:
+                    yield state, delay
+        finally:
+            # acquisition abandoned half way (closed or failed)
+            self._leave_queue(ticket, owner)
+            if pending:
+                self._give_up_pending(slot, owner)
+
+    def _give_up_pending(self, slot, owner):
+        """ Removes exclusive lock still awaiting shared holders """
+        self._strategy.clean()
+        self._token = None
+        slot.release(owner)
+        return False
+
+    def _join_queue(self, ticket, owner, ahead):
+        """ Takes ticket of fair lock (unless already taken) and notes which
+        waiter owner waits behind """
+        if ticket is None:
+            ticket = self._strategy.enqueue(self.pid, self.identity)
+        if ahead is not None:
+            self._queued[owner] = ticket, ahead
+        else:
+            self._queued.pop(owner, None)
+        return ticket
+
+    def _leave_queue(self, ticket, owner):
+        self._queued.pop(owner, None)
+        if ticket is not None:
+            self._strategy.dequeue(ticket)
+        return None
+
+    def _waiter_ahead(self, ticket):
+        """ Returns ticket of live waiter of fair lock queued directly before
+        given ticket (the last one when ticket has not been taken yet),
+        None when there is none; waiters further ahead are not read and
+        tickets of dead ones are removed """
+        while True:
+            ahead = self._strategy.read_ahead(ticket)
+            if ahead is None:
+                return None
+            queued, snapshot = ahead
+            if self._i_own_lock(snapshot) or self._is_pid_owner_working(snapshot):
+                # waiter of current process is alive by definition
+                return queued
+            self._strategy.dequeue(queued)
+            if self._hook is not None:
+                self._hook.cleaned(self, snapshot)
+
+    def _attempt(self, slot, owner):
+        """ Single attempt to acquire lock
+
+        Lock held by other thread of current process is reported as LOCKED
+        without touching the strategy.
+        """
+        if not slot.reserve(owner):
+            return LockState.LOCKED
+
+        try:
+            state = self._do_lock()
+        except:
+            slot.release(owner)
+            raise
+
+        # lock awaiting shared holders is kept, along with reservation
+        if not state.is_owner and state is not LockState.SHARED:
+            slot.release(owner)
+        return state
+
+    def _record_attempts(self, attempts):
+        self.last_attempts = attempts
+        self.attempts[attempts] += 1
+
+    def _wait(self, delay):
+        """ Waits for other thread or lets strategy wait for lock release,
+        falls back to sleeping """
+        if delay <= 0:
+            return
+        turn = self._queued.get(_registry.current_owner())
+        if turn is not None:
+            # lock is going to be granted to waiter ahead, not released to anybody
+            self._wait_for_turn(delay, *turn)
+            return
+        if self._slot.wait(_registry.current_owner(), delay):
+            return
+        if not self._strategy.wait(delay):
+            self._delay_provider(delay)
+
+    def _wait_for_turn(self, delay, ticket, ahead):
+        """ Waits for waiter ahead to leave queue, falls back to sleeping
+        in short slices and checking turn in queue between them """
+        if self._strategy.wait_dequeued(ahead, delay):
+            return
+        while delay >= 2 * _TURN_CHECK_INTERVAL:
+            self._delay_provider(_TURN_CHECK_INTERVAL)
+            delay -= _TURN_CHECK_INTERVAL
+            if self._waiter_ahead(ticket) is None:
+                return
+        self._delay_provider(delay)
+
+    def _do_lock(self):
+        """ Performs current lock validation and obtains new lock if possible
+
+        Once lock is created it is not usable until all shared holders
+        release it. In the meantime lock stays in place, so no new shared
+        holders can join.
+
+        :returns: None
+        :raise CouldNotCreateLockError: lock could not be created but was \
+                                        supposed to
+        """
+        snapshot = self._strategy.read()
+        state = self.get_record_state(snapshot)
+
+        if state.is_owner:
+            # lock created by previous attempt, waiting for shared holders
+            return self._drain_shared_holders()
+
+        if not state.can_acquire:
+            return state
+
+        if state.should_kill_old_process and not self.kill_owner(snapshot):
+            # old owner is still running, taking lock over is not safe
+            return LockState.LOCKED
+
+        if state.should_clean and not self._clean_stale(snapshot):
+            # record has been taken over by other contender in the meantime
+            return LockState.LOCKED
+
+        if not self._strategy.create(self.pid, self._record_meta()):
+            raise CouldNotCreateLockError()
+        if self._fencing:
+            # token is issued once record is held, so owners creating
+            # record later always get greater tokens
+            self._token = self._strategy.issue_token(self.pid)
+            if self._token is None:
+                # record has been broken in the meantime
+                return LockState.LOCKED
+
+        return self._drain_shared_holders()
+
+    def _record_meta(self):
+        if self._lease is None:
+            return self.identity
+        meta = dict(self.identity)
+        meta['lease'] = str(self._lease)
+        return meta
+
+    def _start_heartbeat(self):
+        if self._lease is None or (self._heartbeat and self._heartbeat.is_running):
+            return
+        self._heartbeat = Heartbeat(self._renew_interval, self._renew).start()
+
+    def _stop_heartbeat(self):
+        if self._heartbeat is not None:
+            self._heartbeat.stop()
+            self._heartbeat = None
+
+    def _renew(self):
+        """ Extends lease of lock record owned by current process
+
+        :returns: False once record is not owned any longer \
+                    (heartbeat stops then)
+        :rtype: bool
+        """
+        if not self._i_own_lock(self._strategy.read()):
+            return False
+        fingerprint = self._strategy.fingerprint()
+        self._strategy.renew()
+        if self._fingerprint is not None and self._fingerprint == fingerprint:
+            # renewal is not a replacement of the record
+            self._fingerprint = self._strategy.fingerprint()
+        return True
+
+    def _drain_shared_holders(self):
+        if self._live_shared_holders(self._strategy.read_shared(), clean=True):
+            return LockState.SHARED
+        return LockState.OWNER
+
+    def _live_shared_holders(self, snapshots, clean=False):
+        live = []
+        for snapshot in snapshots:
+            if self._i_own_lock(snapshot):
+                continue
+            if self._is_pid_owner_working(snapshot):
+                live.append(snapshot)
+            elif clean:
+                self._strategy.clean_shared(snapshot.pid)
+                if self._hook is not None:
+                    self._hook.cleaned(self, snapshot)
+        return live
+
+    def get_lock_state(self, snapshot=None):
+        """Method checks whether lock can be acquired.
+
+        :param snapshot: lock record to be evaluated; \
+                            read from strategy when omitted
+        :type snapshot: pylock.strategy.Snapshot
+        :returns: True if lock can be acquired, False if not.
+                    Raises exception if lock has been already acquired
+        :rtype: pylock.states.LockState
+        """
+        state = self.get_record_state(snapshot)
+
+        if state in _SHAREABLE_STATES and \
+                self._live_shared_holders(self._strategy.read_shared()):
+            return LockState.SHARED
+
+        return state
+
+    def get_record_state(self, snapshot=None):
+        """Evaluates exclusive lock record only, ignoring shared holders
+        (see :meth:`get_lock_state`).
+
+        :param snapshot: lock record to be evaluated; \
+                            read from strategy when omitted
+        :type snapshot: pylock.strategy.Snapshot
+        :rtype: pylock.states.LockState
+        """
+
+        if not self._strategy.is_valid():
+            return LockState.INVALID
+
+        if snapshot is None:
+            snapshot = self._strategy.read()
+
+        if not snapshot.exists:
+            return LockState.UNLOCKED
+
+        if self._i_own_lock(snapshot):
+            return LockState.OWNER
+
+        if not self._is_pid_owner_working(snapshot):
+            return LockState.ORPHANED
+
+        if self._is_outdated(snapshot):
+            return LockState.OUTDATED
+
+        return LockState.LOCKED
+
+    def _is_pid_owner_working(self, snapshot):
+        if self._strategy.manages_liveness:
+            # record exists as long as its owner does
+            return True
+        return self._pid_owner_client.is_alive(snapshot.pid, snapshot.meta)
+
+    def _i_own_lock(self, snapshot):
+        if snapshot.pid != self.pid:
+            return False
+        # record might be left by other process with the same pid (e.g. before reboot)
+        return all(snapshot.meta.get(key, value) == value
+                   for key, value in self.identity.items())
+
+    def _is_outdated(self, snapshot):
+        max_age = self._max_age
+        if 'lease' in snapshot.meta:
+            try:
+                max_age = float(snapshot.meta['lease'])
+            except ValueError:
+                pass
+
+        if max_age is None:
+            return False
+
+        return self._current_time_provider() - snapshot.create_date > max_age
+
+    def kill_owner(self, snapshot):
+        """Terminates owner of given lock record; hooks are notified.
+
+        :param snapshot: lock record of the owner
+        :type snapshot: pylock.strategy.Snapshot
+        :returns: whether owner is confirmed to be gone
+        :rtype: bool
+        """
+        confirmed = self._pid_owner_client.terminate(snapshot.pid, snapshot.meta)
+        if self._hook is not None:
+            self._hook.killed(self, snapshot, confirmed)
+        return confirmed
+
+    def _clean_stale(self, snapshot):
+        """ Removes given stale record unless it has been replaced
+
+        Fingerprint is taken before record is read again, so it can only
+        identify the evaluated record, never one created later.
+
+        :returns: False when record has been replaced in the meantime
+        :rtype: bool
+        """
+        fingerprint = self._strategy.fingerprint()
+        current = self._strategy.read()
+        if not current.exists:
+            return True
+        if current != snapshot:
+            return False
+        self._strategy.clean_stale(fingerprint)
+        if self._hook is not None:
+            self._hook.cleaned(self, snapshot)
+        return True
+
+    def release(self):
+        """ Method releases previously acquired lock
+        Does nothing if no lock has been acquired
+
+        :returns: instance of self
+        :rtype: mapnocc.lockfile.Lockfile
+        """
+        slot = self._slot
+        owner = _registry.current_owner()
+        if self._holds and slot.owner is owner:
+            self._holds -= 1
+            if self._holds:
+                return self
+
+        if not slot.is_held_by_other(owner):
+            # lease of lost lock must not be renewed either
+            self._stop_heartbeat()
+        if self.has_lock:
+            self._clean()
+            self._token = None
+            slot.release(owner)
+            if self._hook is not None and self._acquired_at is not None:
+                self._hook.released(self, self._current_time_provider() - self._acquired_at)
+                self._acquired_at = None
+        return self
+
+    def _clean(self):
+        self._strategy.clean()
+
+    def __enter__(self):
+        if not self.acquire().is_owner:
+            raise AlreadyLockedError()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+
+class SharedLock(Lock):
+    """Class that represents lock that may be held by many processes at once
+
+    Shared holders do not block each other. Exclusive :class:`Lock` waits
+    until all of them release the lock, and nobody can join while exclusive
+    lock is held or awaited.
+    """
+
+    def _start_heartbeat(self):
+        # shared holders are verified by liveness of their processes only
+        pass
+
+    def get_lock_state(self, snapshot=None):
+        """Method checks whether shared lock can be acquired.
+
+        :param snapshot: exclusive lock record to be evaluated; \
+                            read from strategy when omitted
+        :type snapshot: pylock.strategy.Snapshot
+        :rtype: pylock.states.LockState
+        """
+        if any(self._i_own_lock(holder) for holder in self._strategy.read_shared()):
+            return LockState.OWNER
+
+        state = self.get_record_state(snapshot)
+
+        if state is LockState.OWNER:
+            # exclusive lock is held by current process - joining is safe
+            return LockState.UNLOCKED
+
+        return state
+
+    def _do_lock(self):
+        """ Registers current process as shared lock holder
+
+        :returns: None
+        :raise CouldNotCreateLockError: lock could not be created but was \
+                                        supposed to
+        """
+        snapshot = self._strategy.read()
+        state = self.get_lock_state(snapshot)
+
+        if not state.can_acquire:
+            return state
+
+        if state.should_kill_old_process and not self.kill_owner(snapshot):
+            # old owner is still running, taking lock over is not safe
+            return LockState.LOCKED
+
+        if state.should_clean:
+            self._clean_stale(snapshot)
+
+        if not self._strategy.create_shared(self.pid, self.identity):
+            raise CouldNotCreateLockError()
+
+        # exclusive lock might have been created in the meantime
+        if self.get_record_state() is LockState.LOCKED:
+            self._strategy.clean_shared(self.pid)
+            return LockState.LOCKED
+
+        return LockState.OWNER
+
+    def _clean(self):
+        self._strategy.clean_shared(self.pid)
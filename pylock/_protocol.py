@@ -0,0 +1,40 @@
+# encoding: utf-8
+"""
+Wire protocol of lock server (see :mod:`pylock.server`).
+
+Requests and responses are JSON objects, one per line. Requests of single
+connection are answered in order, so client may send many of them before
+reading responses (pipelining).
+
+First request of each connection names client session; locks of session
+are released once all its connections are closed.
+"""
+import json
+
+from pylock.strategy import Snapshot
+
+
+def encode(message):
+    """ Serializes message into single line
+
+    :type message: dict
+    :rtype: bytes
+    """
+    return (json.dumps(message, sort_keys=True) + '\n').encode('utf-8')
+
+
+def decode(line):
+    """ Deserializes message read from single line
+
+    :type line: bytes
+    :rtype: dict
+    """
+    return json.loads(line.decode('utf-8'))
+
+
+def dump_snapshot(snapshot):
+    return list(snapshot)
+
+
+def load_snapshot(data):
+    return Snapshot(*data)
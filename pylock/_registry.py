@@ -0,0 +1,148 @@
+# encoding: utf-8
+"""
+Per-process registry of locks held by threads.
+
+Threads of single process share PID, so strategies can not tell them apart.
+Registry keeps in-memory slot for every lock (keyed by strategy key),
+so only one thread at a time may hold it and touch the strategy.
+
+Registry also keeps objects that have to be single per process, such as
+files holding ``fcntl`` locks.
+
+After fork registry is reset: child gets its own PID, no slots, no objects
+and new generation number, so locks may drop ownership state inherited
+from parent.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+_slots = {}
+_objects = {}
+_guard = threading.Lock()
+_local = threading.local()
+_pid = os.getpid()
+_generation = 0
+
+
+class Slot(object):
+    """In-process part of a lock"""
+
+    def __init__(self):
+        super(Slot, self).__init__()
+
+        self._condition = threading.Condition(threading.Lock())
+        self.owner = None
+
+    def is_held_by_other(self, owner):
+        current = self.owner
+        return current is not None and current is not owner
+
+    def reserve(self, owner):
+        """Marks slot as held by given owner
+
+        :returns: False when slot is held by other owner
+        :rtype: bool
+        """
+        with self._condition:
+            if self.is_held_by_other(owner):
+                return False
+            self.owner = owner
+            return True
+
+    def release(self, owner):
+        """Frees slot held by given owner and wakes up waiters"""
+        with self._condition:
+            if self.owner is owner:
+                self.owner = None
+                self._condition.notify_all()
+
+    def wait(self, owner, timeout):
+        """Waits until other owner releases slot
+
+        :returns: False when slot is not held by other owner \
+                    (nothing to wait for)
+        :rtype: bool
+        """
+        with self._condition:
+            if not self.is_held_by_other(owner):
+                return False
+            self._condition.wait(timeout)
+            return True
+
+
+def _after_fork():
+    global _pid, _guard, _generation
+    _pid = os.getpid()
+    _guard = threading.Lock()
+    _slots.clear()
+    _objects.clear()
+    _generation += 1
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+    def _detect_fork():
+        pass
+else:
+    def _detect_fork():
+        if os.getpid() != _pid:
+            _after_fork()
+
+
+def pid():
+    """Returns PID of current process"""
+    _detect_fork()
+    return _pid
+
+
+def generation():
+    """Returns number of forks current process descends from"""
+    _detect_fork()
+    return _generation
+
+
+def slot(key):
+    """Returns slot for given key
+
+    :rtype: pylock._registry.Slot
+    """
+    _detect_fork()
+    try:
+        return _slots[key]
+    except KeyError:
+        with _guard:
+            return _slots.setdefault(key, Slot())
+
+
+def per_process(key, factory):
+    """Returns object of given key, created by factory once per process
+
+    Closing any descriptor of file drops all ``fcntl`` locks of process
+    on it, so files holding such locks are opened once and shared.
+    """
+    _detect_fork()
+    try:
+        return _objects[key]
+    except KeyError:
+        with _guard:
+            if key not in _objects:
+                _objects[key] = factory()
+            return _objects[key]
+
+
+def current_owner():
+    """Returns identity of current lock owner (current thread by default)"""
+    return getattr(_local, 'owner', None) or threading.current_thread()
+
+
+@contextmanager
+def acting_as(owner):
+    """Makes current thread act as given owner within context"""
+    previous = getattr(_local, 'owner', None)
+    _local.owner = owner
+    try:
+        yield
+    finally:
+        _local.owner = previous
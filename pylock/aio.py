@@ -0,0 +1,119 @@
+# encoding: utf-8
+"""Module holds asyncio wrapper around :class:`pylock.Lock` (Python 3.5+)"""
+import asyncio
+import functools
+
+from . import AlreadyLockedError, _registry
+
+# asyncio.Task.current_task is gone since Python 3.9
+_current_task = getattr(asyncio, 'current_task', None) or asyncio.Task.current_task
+
+
+class AsyncLock(object):
+    """Asyncio-friendly lock.
+
+    Strategy I/O is performed in executor, delays between tries
+    are awaited with :func:`asyncio.sleep`, so event loop is never blocked.
+    Lock is owned by task that acquired it, regardless of executor thread
+    that performed the I/O, so tasks sharing AsyncLock exclude each other
+    like threads sharing :class:`pylock.Lock` do.
+    """
+
+    def __init__(self, lock, executor=None):
+        """ Object initialization
+
+        :param lock: lock to be wrapped
+        :type lock: pylock.Lock
+        :param executor: executor to run strategy I/O in \
+                            (loop's default one when omitted)
+        :type executor: concurrent.futures.Executor
+        """
+        super(AsyncLock, self).__init__()
+
+        self._lock = lock
+        self._executor = executor
+
+    @property
+    def lock(self):
+        return self._lock
+
+    async def has_lock(self):
+        """Returns information whether lock has been acquired or not
+
+        :rtype: bool
+        """
+        return await self._run(_owner(self), lambda: self._lock.has_lock)
+
+    async def acquire(self, blocking=True, timeout=None):
+        """ Method acquires lock
+
+        :param blocking: when False lock is tried only once
+        :type blocking: bool
+        :param timeout: see :meth:`pylock.Lock.acquire`
+        :type timeout: float
+        :returns: lock state information
+        :rtype: pylock.states.LockState
+        :raises pylock.CouldNotCreateLockError: when lockfile could not be \
+                                                written (but was supposed to)
+        """
+        owner = _owner(self)
+        steps = self._lock.acquire_steps(blocking, timeout)
+        step = None
+        try:
+            while True:
+                # step keeps running in executor when task gets cancelled,
+                # so its outcome is kept rather than cancelled along
+                step = self._run(owner, next, steps)
+                state, delay = await asyncio.shield(step)
+                if delay is None:
+                    return state
+                step = None
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            await asyncio.shield(self._abandon(owner, step, steps))
+            raise
+
+    async def _abandon(self, owner, step, steps):
+        """ Gives acquisition of cancelled task up; lock obtained by step
+        in flight is released """
+        if step is not None:
+            try:
+                state, _ = await step
+            except Exception:
+                state = None
+            if state is not None and state.is_owner:
+                await self._run(owner, self._lock.release)
+        await self._run(owner, steps.close)
+
+    async def release(self):
+        """ Method releases previously acquired lock
+        Does nothing if no lock has been acquired
+
+        :returns: instance of self
+        :rtype: pylock.aio.AsyncLock
+        """
+        await self._run(_owner(self), self._lock.release)
+        return self
+
+    def _run(self, owner, func, *args):
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self._executor,
+                                    functools.partial(_call, owner, func, *args))
+
+    async def __aenter__(self):
+        if not (await self.acquire()).is_owner:
+            raise AlreadyLockedError()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.release()
+
+
+def _owner(default):
+    """Returns current task (given default outside of any task)"""
+    return _current_task() or default
+
+
+def _call(owner, func, *args):
+    with _registry.acting_as(owner):
+        return func(*args)
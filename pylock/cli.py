@@ -0,0 +1,260 @@
+# encoding: utf-8
+"""Command line interface of pylock"""
+from __future__ import print_function
+
+import argparse
+import sys
+
+# exit codes (sysexits.h and shell conventions); command run under lock
+# exits with its own code, or 128 + signal number when killed
+EXIT_ERROR = 70
+EXIT_LOCKED = 75
+EXIT_NOT_EXECUTABLE = 126
+EXIT_NOT_FOUND = 127
+
+# prctl(2) option setting signal delivered once parent process dies
+PR_SET_PDEATHSIG = 1
+
+
+def main(argv=None):
+    """ Entry point of `pylock` command
+
+    :param argv: command line arguments (without program name)
+    :type argv: list
+    :returns: exit code
+    :rtype: int
+    """
+    args = _parser().parse_args(argv)
+    return args.handler(args)
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='pylock', description='Configurable lock manager')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run = commands.add_parser('run', help='run command while holding lock',
+                              description='Runs COMMAND while holding lock; exits with '
+                              'exit code of COMMAND, {0} when lock is held by other '
+                              'process, {1} when lock could not be created, {2} when '
+                              'COMMAND is not executable and {3} when it is not '
+                              'found'.format(EXIT_LOCKED, EXIT_ERROR,
+                                             EXIT_NOT_EXECUTABLE, EXIT_NOT_FOUND))
+    run.add_argument('--lock', required=True, metavar='PATH', help='path to lockfile')
+    run.add_argument('--strategy', choices=('file', 'flock'), default='file',
+                     help='PID file checked for liveness of its owner, '
+                     'or kernel lock released once its owner dies')
+    run.add_argument('--timeout', type=float, default=-1,
+                     help='max time (seconds) to wait for lock; 0 tries once, '
+                     'negative waits forever (default)')
+    run.add_argument('--max-age', type=float,
+                     help='time (seconds) after which lock held by other process '
+                     'is broken and its owner terminated')
+    run.add_argument('--lease', type=float,
+                     help='keep lock alive by renewing it while COMMAND runs; '
+                     'lock is broken LEASE seconds after renewals stop')
+    run.add_argument('--conflict-exit-code', type=int, default=EXIT_LOCKED,
+                     help='exit code used when lock is held by other process')
+    run.add_argument('--exec', action='store_true', dest='exec_',
+                     help='replace pylock process with COMMAND; lock record is '
+                     'left behind and broken once COMMAND exits (file strategy only)')
+    run.add_argument('command', nargs=argparse.REMAINDER,
+                     help='command to be run (preceded by --)')
+    run.set_defaults(handler=_run)
+
+    sweep = commands.add_parser('sweep', help='remove lockfiles left by crashed processes')
+    sweep.add_argument('directory', help='directory holding lockfiles')
+    sweep.add_argument('--suffix', default='.pid', help='lockfile name suffix')
+    sweep.add_argument('--max-age', type=float,
+                       help='time (seconds) after which lock is outdated')
+    sweep.add_argument('--kill', action='store_true',
+                       help='terminate owners of outdated locks and remove their locks')
+    sweep.add_argument('--interval', type=float,
+                       help='keep running and sweep every INTERVAL seconds')
+    sweep.add_argument('-v', '--verbose', action='store_true',
+                       help='report state of every lock, not only removed ones')
+    sweep.set_defaults(handler=_sweep)
+
+    serve = commands.add_parser('serve', help='run lock server')
+    serve.add_argument('address', type=_address,
+                       help='path of Unix socket or HOST:PORT of TCP socket')
+    serve.set_defaults(handler=_serve)
+
+    return parser
+
+
+def _run(args):
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command:
+        print('pylock run: command is missing', file=sys.stderr)
+        return EXIT_ERROR
+    if args.exec_ and args.strategy != 'file':
+        print('pylock run: --exec requires file strategy', file=sys.stderr)
+        return EXIT_ERROR
+    if args.exec_ and args.lease is not None:
+        # nothing renews lease once command replaces current process,
+        # so contenders would break the lock and terminate command
+        print('pylock run: --exec cannot be combined with --lease', file=sys.stderr)
+        return EXIT_ERROR
+
+    bind_child = None if args.exec_ else _bind_to_parent()
+    if args.max_age is not None and not args.exec_ and bind_child is None:
+        # contenders terminate pylock process once lock gets too old; command
+        # which could outlive it would keep running without the lock
+        print('pylock run: --max-age requires --exec on this platform', file=sys.stderr)
+        return EXIT_ERROR
+
+    from . import CouldNotCreateLockError, Lock
+    from .retry import Exponential
+
+    if args.strategy == 'flock':
+        from .strategy.flock import Flock
+        strategy = Flock(args.lock)
+    else:
+        from .strategy.file import File
+        strategy = File(args.lock)
+
+    lock = Lock(strategy, max_age=args.max_age, lease=args.lease,
+                retry_policy=Exponential(base=0.01, max_delay=1, tries=None))
+    try:
+        state = lock.acquire(blocking=args.timeout != 0,
+                             timeout=args.timeout if args.timeout > 0 else -1)
+    except CouldNotCreateLockError as exc:
+        print('pylock run: {0}'.format(exc), file=sys.stderr)
+        return EXIT_ERROR
+    if not state.is_owner:
+        return args.conflict_exit_code
+
+    if args.exec_:
+        # process keeps its pid, so lock record stays valid while command runs
+        return _exec(command)
+    try:
+        return _supervise(command, bind_child)
+    finally:
+        lock.release()
+
+
+def _exec(command):
+    import os
+    try:
+        os.execvp(command[0], command)
+    except OSError as exc:
+        return _spawn_error(command, exc)
+
+
+def _bind_to_parent():
+    """ Returns function which makes kernel kill process running it once
+    its parent dies, so command never outlives pylock (even SIGKILLed one)
+
+    :returns: function to be run in child process, None when platform \
+              does not support it
+    :rtype: callable
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+
+    import ctypes
+    import os
+    import signal
+
+    try:
+        prctl = ctypes.CDLL(None).prctl
+    except (AttributeError, OSError):
+        return None
+    parent = os.getpid()
+
+    def bind():
+        prctl(PR_SET_PDEATHSIG, signal.SIGKILL)
+        if os.getppid() != parent:
+            # parent has died before the signal was set
+            os.kill(os.getpid(), signal.SIGKILL)
+    return bind
+
+
+def _supervise(command, bind_child=None):
+    """ Runs command, passing termination signals to it
+
+    :param command: command with its arguments
+    :type command: list
+    :param bind_child: function run in child process before command starts
+    :type bind_child: callable
+    :returns: exit code
+    :rtype: int
+    """
+    import signal
+    import subprocess
+
+    try:
+        process = subprocess.Popen(command, preexec_fn=bind_child)
+    except OSError as exc:
+        return _spawn_error(command, exc)
+
+    forward = lambda signum, frame: process.send_signal(signum)
+    handlers = dict((signum, signal.signal(signum, forward))
+                    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP))
+    try:
+        returncode = process.wait()
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    return returncode if returncode >= 0 else 128 - returncode
+
+
+def _spawn_error(command, exc):
+    import errno
+    print('pylock run: {0}: {1}'.format(command[0], exc.strerror), file=sys.stderr)
+    return EXIT_NOT_FOUND if exc.errno == errno.ENOENT else EXIT_NOT_EXECUTABLE
+
+
+def _sweep(args):
+    from .sweeper import Sweeper
+
+    sweeper = Sweeper(args.directory, suffix=args.suffix, max_age=args.max_age,
+                      kill=args.kill)
+    report = lambda result: _print_report(result, args.verbose)
+
+    if args.interval is None:
+        report(sweeper.sweep())
+        return 0
+
+    try:
+        sweeper.run(args.interval, callback=report)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _serve(args):
+    from .server import LockServer
+
+    server = LockServer(args.address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+    return 0
+
+
+def _address(value):
+    host, separator, port = value.rpartition(':')
+    if not separator or '/' in value:
+        return value
+    try:
+        return host, int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid address: {0!r}'.format(value))
+
+
+def _print_report(report, verbose):
+    for name in sorted(report.states):
+        removed = name in report.removed
+        if removed or verbose:
+            print('{0}\t{1}{2}'.format(name, report.states[name].name,
+                                       '\tremoved' if removed else ''))
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+# encoding: utf-8
+"""
+Instrumentation hooks of :class:`pylock.Lock`.
+
+Lock notifies its hooks about acquisition, waiting, state decisions,
+cleanups, kills and releases. Lock without hooks skips instrumentation
+entirely, so it costs nothing when disabled.
+"""
+import bisect
+import threading
+from collections import Counter
+
+from logging_utils import getLogger
+
+logger = getLogger(__name__)
+
+
+class Hook(object):
+    """Base hook - ignores all events"""
+
+    def acquire_started(self, lock):
+        """Called when acquisition of lock starts
+
+        :type lock: pylock.Lock
+        """
+
+    def acquire_finished(self, lock, state, attempts, duration):
+        """Called when acquisition of lock ends (successfully or not)
+
+        :type lock: pylock.Lock
+        :param state: final lock state (None when acquisition failed \
+                        with an error)
+        :type state: pylock.states.LockState
+        :param attempts: number of attempts taken
+        :type attempts: int
+        :param duration: time (seconds) acquisition took
+        :type duration: float
+        """
+
+    def waited(self, lock, delay):
+        """Called after waiting between consecutive attempts
+
+        :type lock: pylock.Lock
+        :param delay: time (seconds) lock has waited for
+        :type delay: float
+        """
+
+    def state_decided(self, lock, state):
+        """Called with outcome of each attempt to acquire lock
+
+        :type lock: pylock.Lock
+        :type state: pylock.states.LockState
+        """
+
+    def cleaned(self, lock, snapshot):
+        """Called when stale lock record has been removed
+
+        :type lock: pylock.Lock
+        :param snapshot: removed lock record
+        :type snapshot: pylock.strategy.Snapshot
+        """
+
+    def killed(self, lock, snapshot, confirmed):
+        """Called after owner of outdated lock has been terminated
+
+        :type lock: pylock.Lock
+        :param snapshot: lock record of terminated owner
+        :type snapshot: pylock.strategy.Snapshot
+        :param confirmed: whether owner is confirmed to be gone
+        :type confirmed: bool
+        """
+
+    def released(self, lock, hold_time):
+        """Called when lock has been released
+
+        :type lock: pylock.Lock
+        :param hold_time: time (seconds) lock has been held for
+        :type hold_time: float
+        """
+
+
+class HookChain(Hook):
+    """Passes events to many hooks"""
+
+    def __init__(self, hooks):
+        super(HookChain, self).__init__()
+
+        self._hooks = tuple(hooks)
+
+    def acquire_started(self, lock):
+        for hook in self._hooks:
+            hook.acquire_started(lock)
+
+    def acquire_finished(self, lock, state, attempts, duration):
+        for hook in self._hooks:
+            hook.acquire_finished(lock, state, attempts, duration)
+
+    def waited(self, lock, delay):
+        for hook in self._hooks:
+            hook.waited(lock, delay)
+
+    def state_decided(self, lock, state):
+        for hook in self._hooks:
+            hook.state_decided(lock, state)
+
+    def cleaned(self, lock, snapshot):
+        for hook in self._hooks:
+            hook.cleaned(lock, snapshot)
+
+    def killed(self, lock, snapshot, confirmed):
+        for hook in self._hooks:
+            hook.killed(lock, snapshot, confirmed)
+
+    def released(self, lock, hold_time):
+        for hook in self._hooks:
+            hook.released(lock, hold_time)
+
+
+def chain(hooks):
+    """Returns single hook passing events to given hooks,
+    None when there are no hooks
+
+    :param hooks: hooks to be notified
+    :type hooks: iterable
+    :rtype: pylock.hooks.Hook
+    """
+    hooks = tuple(hooks or ())
+    if not hooks:
+        return None
+    if len(hooks) == 1:
+        return hooks[0]
+    return HookChain(hooks)
+
+
+class LoggingHook(Hook):
+    """Logs lock events"""
+
+    def acquire_started(self, lock):
+        with logger.context(lock=lock.strategy.key):
+            logger.debug('acquiring lock')
+
+    def acquire_finished(self, lock, state, attempts, duration):
+        with logger.context(lock=lock.strategy.key, state=state and state.name,
+                            attempts=attempts, duration=duration):
+            logger.debug('lock acquisition finished')
+
+    def waited(self, lock, delay):
+        with logger.context(lock=lock.strategy.key, delay=delay):
+            logger.debug('waited for lock')
+
+    def state_decided(self, lock, state):
+        with logger.context(lock=lock.strategy.key, state=state.name):
+            logger.debug('lock state evaluated')
+
+    def cleaned(self, lock, snapshot):
+        with logger.context(lock=lock.strategy.key, pid=snapshot.pid):
+            logger.info('stale lock removed')
+
+    def killed(self, lock, snapshot, confirmed):
+        with logger.context(lock=lock.strategy.key, pid=snapshot.pid, confirmed=confirmed):
+            logger.warning('owner of outdated lock terminated')
+
+    def released(self, lock, hold_time):
+        with logger.context(lock=lock.strategy.key, hold_time=hold_time):
+            logger.debug('lock released')
+
+
+class Histogram(object):
+    """Histogram of observed values; last count holds values above
+    the highest bucket"""
+
+    def __init__(self, buckets):
+        """ Object initialization
+
+        :param buckets: upper bounds of buckets (sorted)
+        :type buckets: tuple
+        """
+        super(Histogram, self).__init__()
+
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+# seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+
+class MetricsHook(Hook):
+    """Collects lock metrics: histograms of acquire latency and hold time,
+    counters of lock states and of cleanups and kills.
+
+    Meant to be exported to monitoring system of choice.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """ Object initialization
+
+        :param buckets: upper bounds (seconds) of histogram buckets
+        :type buckets: tuple
+        """
+        super(MetricsHook, self).__init__()
+
+        self.acquire_latency = Histogram(buckets)
+        self.hold_time = Histogram(buckets)
+        # lock state -> number of attempts that ended in it
+        self.states = Counter()
+        self.cleanups = 0
+        self.kills = 0
+        # hook might be shared by locks used in many threads
+        self._guard = threading.Lock()
+
+    def acquire_finished(self, lock, state, attempts, duration):
+        with self._guard:
+            self.acquire_latency.observe(duration)
+
+    def state_decided(self, lock, state):
+        with self._guard:
+            self.states[state] += 1
+
+    def cleaned(self, lock, snapshot):
+        with self._guard:
+            self.cleanups += 1
+
+    def killed(self, lock, snapshot, confirmed):
+        with self._guard:
+            self.kills += 1
+
+    def released(self, lock, hold_time):
+        with self._guard:
+            self.hold_time.observe(hold_time)
@@ -0,0 +1,181 @@
+# encoding: utf-8
+"""Module holds classes that manage many named locks at once"""
+import os
+import time
+from contextlib import contextmanager
+
+from . import Lock, AlreadyLockedError
+from .pid_owner_client import CachingClient
+from .states import LockState
+from .strategy.file import File
+
+
+class LockManager(object):
+    """Acquires and releases many named locks, all or none of them.
+
+    Locks are acquired one by one, always in the same (sorted) order, so
+    two callers sharing some names can not deadlock each other. When any
+    lock can not be obtained, locks acquired so far are released.
+    Locks are created once per name and share owner liveness cache.
+    """
+
+    def __init__(self, strategy_factory, current_time_provider=time.time,
+                 **lock_options):
+        """ Object initialization
+
+        :param strategy_factory: callable returning strategy for lock name
+        :type strategy_factory: callable
+        :param lock_options: options passed to each :class:`pylock.Lock`; \
+                            unless `pid_owner_client` is given, locks share \
+                            :class:`pylock.pid_owner_client.CachingClient`
+        :type lock_options: dict
+        """
+        super(LockManager, self).__init__()
+
+        self._strategy_factory = strategy_factory
+        self._current_time_provider = current_time_provider
+        lock_options.setdefault('pid_owner_client', CachingClient(
+            current_time_provider=current_time_provider))
+        self._lock_options = lock_options
+        self._locks = {}
+        self._held = set()
+
+    @property
+    def held(self):
+        """Names of locks held by this manager
+
+        :rtype: frozenset
+        """
+        return frozenset(self._held)
+
+    def lock(self, name):
+        """Returns lock for given name
+
+        :param name: lock name
+        :type name: str
+        :rtype: pylock.Lock
+        """
+        try:
+            return self._locks[name]
+        except KeyError:
+            lock = Lock(self._strategy_factory(name),
+                        current_time_provider=self._current_time_provider,
+                        **self._lock_options)
+            self._locks[name] = lock
+            return lock
+
+    def acquire(self, names, blocking=True, timeout=None):
+        """ Acquires all given locks (one by one) or none of them
+
+        :param names: names of locks to be acquired
+        :type names: iterable
+        :param blocking: when False each lock is tried only once
+        :type blocking: bool
+        :param timeout: max time to wait for all locks (seconds); \
+                            see :meth:`pylock.Lock.acquire`
+        :type timeout: float
+        :returns: OWNER when all locks has been acquired, \
+                    state of first lock that could not be obtained otherwise
+        :rtype: pylock.states.LockState
+        :raises CouldNotCreateLockError: when lockfile could not be written
+                                            (but was supposed to)
+        """
+        deadline = None
+        if timeout is not None and timeout >= 0:
+            deadline = self._current_time_provider() + timeout
+
+        acquired = []
+        try:
+            for name in sorted(set(names) - self._held):
+                if deadline is not None:
+                    timeout = max(0, deadline - self._current_time_provider())
+                state = self.lock(name).acquire(blocking, timeout)
+                if not state.is_owner:
+                    self.release(acquired)
+                    return state
+                acquired.append(name)
+                self._held.add(name)
+        except:
+            self.release(acquired)
+            raise
+        return LockState.OWNER
+
+    def release(self, names=None):
+        """ Releases given locks (all held ones by default)
+
+        Locks not held by this manager are ignored.
+
+        :param names: names of locks to be released
+        :type names: iterable
+        :returns: instance of self
+        :rtype: pylock.manager.LockManager
+        """
+        names = self._held if names is None else self._held.intersection(names)
+        for name in sorted(names, reverse=True):
+            self._locks[name].release()
+            self._held.discard(name)
+        return self
+
+    @contextmanager
+    def locked(self, names, blocking=True, timeout=None):
+        """ Holds all given locks within context
+
+        :raises AlreadyLockedError: when any of locks can not be obtained
+        """
+        names = set(names) - self._held
+        if not self.acquire(names, blocking, timeout).is_owner:
+            raise AlreadyLockedError()
+        try:
+            yield self
+        finally:
+            self.release(names)
+
+
+class DirectoryLockManager(LockManager):
+    """Manages file-based locks kept in single directory.
+
+    Directory is opened once and each lockfile is looked up, created
+    and removed relative to it.
+    """
+
+    def __init__(self, directory, atomic_writer=None, suffix='.pid',
+                 **lock_options):
+        """ Object initialization
+
+        :param directory: directory holding lockfiles
+        :type directory: str
+        :param atomic_writer: writer passed to :class:`File` strategy \
+                            (called with `dir_fd` keyword)
+        :type atomic_writer: callable
+        :param suffix: lockfile name suffix
+        :type suffix: str
+        :param lock_options: options passed to each :class:`pylock.Lock`
+        :type lock_options: dict
+        """
+        super(DirectoryLockManager, self).__init__(self._create_strategy,
+                                                   **lock_options)
+
+        self._directory = directory
+        self._atomic_writer = atomic_writer
+        self._suffix = suffix
+        self._dir_fd = os.open(directory, os.O_RDONLY)
+
+    def _create_strategy(self, name):
+        if not name or os.sep in name or name in (os.curdir, os.pardir):
+            raise ValueError('Invalid lock name: {0!r}'.format(name))
+        return File(os.path.join(self._directory, name + self._suffix),
+                    self._atomic_writer, dir_fd=self._dir_fd)
+
+    def close(self):
+        """ Releases all held locks and closes directory """
+        if self._dir_fd is None:
+            return
+        self.release()
+        os.close(self._dir_fd)
+        self._dir_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1,35 +1,160 @@
 # encoding: utf-8
 import abc
+import errno
 import os
-from logging_utils import getLogger, SentinelBuilder
+import select
+import signal
+import threading
+import time
+from logging_utils import getLogger
 
 from ._compat import with_metaclass
 
 logger = getLogger(__name__)
-sentinel = SentinelBuilder(logger)
 
 
 class Client(with_metaclass(abc.ABCMeta)):
 
-    def is_alive(self, pid):
+    def __init__(self, terminate_timeout=5, kill_timeout=1, poll_interval=0.05,
+                 delay_provider=time.sleep, current_time_provider=time.time):
+        """ Object initialization
+
+        :param terminate_timeout: time (seconds) process is given to exit \
+                        gracefully after SIGTERM, before it gets SIGKILL
+        :type terminate_timeout: float
+        :param kill_timeout: time (seconds) to wait for process to \
+                        disappear after SIGKILL
+        :type kill_timeout: float
+        :param poll_interval: delay between consecutive liveness checks \
+                        while waiting for process to exit
+        :type poll_interval: float
+        """
+        super(Client, self).__init__()
+
+        self._terminate_timeout = terminate_timeout
+        self._kill_timeout = kill_timeout
+        self._poll_interval = poll_interval
+        self._delay_provider = delay_provider
+        self._current_time_provider = current_time_provider
+
+    def identify(self, pid):
+        """Returns information identifying process beyond its pid,
+        to be stored along with lock
+
+        :param pid: process id
+        :type pid: int
+        :rtype: dict
+        """
+        return {}
+
+    def is_alive(self, pid, meta=None):
+        """Checks whether process that created lock is still running
+
+        :param pid: process id
+        :type pid: int
+        :param meta: process identity returned by :meth:`identify`
+        :type meta: dict
+        :rtype: bool
+        """
         try:
-            with logger.context(pid=pid), sentinel('Checking pid owner liveness'):
-                return self._is_alive(pid)
+            return self._is_alive(pid) and (not meta or self._is_same_process(pid, meta))
         except:
             return False
 
+    def is_alive_many(self, pids, metas=None):
+        """Checks at once whether processes that created locks are running
+
+        :param pids: process ids
+        :type pids: iterable
+        :param metas: process identities (as returned by :meth:`identify`) \
+                        keyed by pid
+        :type metas: dict
+        :returns: liveness keyed by pid
+        :rtype: dict
+        """
+        pids = frozenset(pids)
+        metas = metas or {}
+        try:
+            running = self._running(pids)
+            return dict((pid, pid in running and self._matches(pid, metas.get(pid)))
+                        for pid in pids)
+        except:
+            return dict.fromkeys(pids, False)
+
     @abc.abstractmethod
     def _is_alive(self, pid):
         pass # pragma: no cover
 
-    def terminate(self, pid):
-        with logger.context(pid=pid), sentinel('Terminating pid owner'):
-            return self._terminate(pid)
+    def _running(self, pids):
+        """Returns subset of given pids that belong to running processes"""
+        running = set()
+        for pid in pids:
+            try:
+                if self._is_alive(pid):
+                    running.add(pid)
+            except:
+                pass
+        return running
+
+    def _matches(self, pid, meta):
+        try:
+            return not meta or self._is_same_process(pid, meta)
+        except:
+            return False
+
+    def _is_same_process(self, pid, meta):
+        return True
+
+    def terminate(self, pid, meta=None):
+        """Terminates process that created lock.
+
+        Process is asked to exit (SIGTERM) first and killed (SIGKILL)
+        only when it does not exit within `terminate_timeout`.
+        Process is left untouched when its pid has been reused.
+
+        :param pid: process id
+        :type pid: int
+        :param meta: process identity returned by :meth:`identify`
+        :type meta: dict
+        :returns: whether process is confirmed to be gone
+        :rtype: bool
+        """
+        if meta and not self.is_alive(pid, meta):
+            # pid belongs to other process
+            return True
+
+        if self._terminate_timeout:
+            self._terminate(pid, signal.SIGTERM)
+            if self._wait_for_exit(pid, meta, self._terminate_timeout):
+                return True
+            with logger.context(pid=pid):
+                logger.warning('pid owner ignored SIGTERM, killing it')
+
+        self._terminate(pid, signal.SIGKILL)
+        if self._wait_for_exit(pid, meta, self._kill_timeout):
+            return True
+        with logger.context(pid=pid):
+            logger.error('pid owner is still running')
+        return False
 
     @abc.abstractmethod
-    def _terminate(self, pid):
+    def _terminate(self, pid, signum):
         pass # pragma: no cover
 
+    def _wait_for_exit(self, pid, meta, timeout):
+        """Waits until process exits
+
+        :returns: False when process is still running after timeout
+        :rtype: bool
+        """
+        deadline = self._current_time_provider() + timeout
+        while self.is_alive(pid, meta):
+            remaining = deadline - self._current_time_provider()
+            if remaining <= 0:
+                return False
+            self._delay_provider(min(self._poll_interval, remaining))
+        return True
+
 
 class SubprocessClient(Client):
 
@@ -37,6 +162,189 @@ class SubprocessClient(Client):
         os.kill(pid, 0)
         return True
 
-    def _terminate(self, pid):
-        os.kill(pid, 9)
+    def _terminate(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError as exc:
+            if exc.errno != errno.ESRCH:
+                raise
+
+    def _wait_for_exit(self, pid, meta, timeout):
+        # pidfd becomes readable as soon as process exits (Linux 5.3+)
+        try:
+            fd = _pidfd_open(pid)
+        except OSError:
+            return True
+        if fd is None:
+            return super(SubprocessClient, self)._wait_for_exit(pid, meta, timeout)
+
+        try:
+            # descriptor might refer to other process that reused pid
+            if not self.is_alive(pid, meta):
+                return True
+            poller = select.poll()
+            poller.register(fd, select.POLLIN)
+            return bool(poller.poll(int(timeout * 1000)))
+        finally:
+            os.close(fd)
+
+
+class ProcfsClient(SubprocessClient):
+    """Client that identifies process by its start time and boot id
+    (Linux procfs), so reused pids are not mistaken for lock owners"""
+
+    def __init__(self, procfs='/proc', **options):
+        """ Object initialization
+
+        :param procfs: procfs mount point
+        :type procfs: str
+        :param options: see :class:`pylock.pid_owner_client.Client`
+        :type options: dict
+        """
+        super(ProcfsClient, self).__init__(**options)
+
+        self._procfs = procfs
+        self._boot_id = None
+
+    def identify(self, pid):
+        try:
+            return {'start_time': self._read_start_time(pid),
+                    'boot_id': self._read_boot_id()}
+        except (IOError, OSError, IndexError):
+            return {}
+
+    def _running(self, pids):
+        # single directory scan instead of syscall per pid
+        listed = set(int(name) for name in os.listdir(self._procfs) if name.isdigit())
+        return listed.intersection(pids)
+
+    def _is_same_process(self, pid, meta):
+        if 'boot_id' in meta and meta['boot_id'] != self._read_boot_id():
+            return False
+        if 'start_time' in meta and meta['start_time'] != self._read_start_time(pid):
+            return False
+        return True
+
+    def _read_start_time(self, pid):
+        with open(os.path.join(self._procfs, str(pid), 'stat'), 'rb') as stream:
+            stat = stream.read()
+        # process name might contain spaces, so fields are counted from its end;
+        # start time is 22nd field, 3rd one follows process name
+        return stat[stat.rindex(b')') + 2:].split()[19].decode('ascii')
+
+    def _read_boot_id(self):
+        if self._boot_id is None:
+            path = os.path.join(self._procfs, 'sys', 'kernel', 'random', 'boot_id')
+            with open(path, 'r') as stream:
+                self._boot_id = stream.read().strip()
+        return self._boot_id
+
+
+class CachingClient(Client):
+    """Client that remembers liveness of processes for a short time.
+
+    Single instance is meant to be shared by many locks (or a sweeper),
+    so owner of each lock is checked at most once per `ttl` seconds.
+    """
+
+    def __init__(self, client=None, ttl=1, current_time_provider=time.time):
+        """ Object initialization
+
+        :param client: client performing the checks \
+                        (best one available on current platform by default)
+        :type client: pylock.pid_owner_client.Client
+        :param ttl: time (seconds) liveness is remembered for
+        :type ttl: float
+        :param current_time_provider: function returning current time
+        :type current_time_provider: callable
+        """
+        super(CachingClient, self).__init__()
+
+        self._client = client or default_client()
+        self._ttl = ttl
+        self._current_time_provider = current_time_provider
+        self._cache = {}
+        self._guard = threading.Lock()
+
+    def identify(self, pid):
+        return self._client.identify(pid)
+
+    def is_alive(self, pid, meta=None):
+        return self.is_alive_many((pid,), {pid: meta} if meta else None)[pid]
+
+    def is_alive_many(self, pids, metas=None):
+        pids = frozenset(pids)
+        metas = metas or {}
+        now = self._current_time_provider()
+        result = {}
+        missing = set()
+        with self._guard:
+            for pid in pids:
+                entry = self._cache.get(self._key(pid, metas.get(pid)))
+                if entry is not None and entry[1] > now:
+                    result[pid] = entry[0]
+                else:
+                    missing.add(pid)
+
+        if missing:
+            checked = self._client.is_alive_many(missing, metas)
+            with self._guard:
+                for key in [key for key, entry in self._cache.items() if entry[1] <= now]:
+                    del self._cache[key]
+                for pid, alive in checked.items():
+                    self._cache[self._key(pid, metas.get(pid))] = (alive, now + self._ttl)
+            result.update(checked)
+        return result
+
+    def terminate(self, pid, meta=None):
+        self.invalidate(pid)
+        return self._client.terminate(pid, meta)
+
+    def invalidate(self, pid=None):
+        """Forgets liveness of given process (or all processes)
+
+        :param pid: process id
+        :type pid: int
+        """
+        with self._guard:
+            if pid is None:
+                self._cache.clear()
+                return
+            for key in [key for key in self._cache if key[0] == pid]:
+                del self._cache[key]
+
+    def _key(self, pid, meta):
+        return pid, frozenset((meta or {}).items())
+
+    def _is_alive(self, pid):
+        pass # pragma: no cover
+
+    def _terminate(self, pid, signum):
+        pass # pragma: no cover
+
+
+def _pidfd_open(pid):
+    """Returns descriptor referring to process, None when not supported
+
+    :raises OSError: when process does not exist
+    """
+    if not hasattr(os, 'pidfd_open'):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except OSError as exc:
+        if exc.errno == errno.ESRCH:
+            raise
+        return None
+
+
+def default_client(**options):
+    """Returns best client available on current platform
 
+    :param options: see :class:`pylock.pid_owner_client.Client`
+    :type options: dict
+    :rtype: pylock.pid_owner_client.Client
+    """
+    if os.path.isdir('/proc/self'):
+        return ProcfsClient(**options)
+    return SubprocessClient(**options)
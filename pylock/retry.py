@@ -0,0 +1,174 @@
+# encoding: utf-8
+"""Module holds policies deciding how long to wait between tries to obtain
+lock"""
+import random
+import time
+
+
+class RetryPolicy(object):
+    """Base class for retry policies"""
+
+    def __init__(self, tries=None):
+        """ Object initialization
+
+        :param tries: max number of tries to obtain lock (None - unlimited)
+        :type tries: int
+        """
+        super(RetryPolicy, self).__init__()
+
+        self._tries = tries
+
+    def delays(self):
+        """Yields delays between consecutive tries to obtain lock.
+        Exhausted iterator means lock should not be tried anymore.
+
+        :rtype: iterator
+        """
+        attempt = 1
+        previous = None
+        while self._tries is None or attempt < self._tries:
+            previous = self._delay(attempt, previous)
+            yield previous
+            attempt += 1
+
+    def _delay(self, attempt, previous):
+        """Returns delay after given attempt
+
+        :param attempt: number of failed attempt (starting from 1)
+        :type attempt: int
+        :param previous: previous delay (None on first attempt)
+        :type previous: float
+        :rtype: float
+        """
+        raise NotImplementedError() # pragma: no cover
+
+
+class Fixed(RetryPolicy):
+    """Every contender waits the same time between tries"""
+
+    def __init__(self, sleeptime=2, tries=3):
+        """ Object initialization
+
+        :param sleeptime: sleep time between consecutive tries to obtain lock
+        :type sleeptime: float
+        :param tries: max number of tries to obtain lock (None - unlimited)
+        :type tries: int
+        """
+        super(Fixed, self).__init__(tries)
+
+        self._sleeptime = sleeptime
+
+    def _delay(self, attempt, previous):
+        return self._sleeptime
+
+
+class Exponential(RetryPolicy):
+    """Delay grows exponentially; with jitter enabled random part of it is
+    used ("full jitter") so contenders do not retry in lockstep"""
+
+    def __init__(self, base=0.05, factor=2, max_delay=5, jitter=True,
+                 tries=None, random_provider=random.random):
+        """ Object initialization
+
+        :param base: delay after first failed attempt
+        :type base: float
+        :param factor: delay multiplier
+        :type factor: float
+        :param max_delay: delay cap
+        :type max_delay: float
+        :param jitter: whether to randomize delay
+        :type jitter: bool
+        :param tries: max number of tries to obtain lock (None - unlimited)
+        :type tries: int
+        """
+        super(Exponential, self).__init__(tries)
+
+        self._base = base
+        self._factor = factor
+        self._max_delay = max_delay
+        self._jitter = jitter
+        self._random_provider = random_provider
+
+    def _delay(self, attempt, previous):
+        try:
+            delay = min(self._max_delay, self._base * float(self._factor) ** (attempt - 1))
+        except OverflowError:
+            # growth is not representable long after the cap has been reached
+            delay = self._max_delay
+        if self._jitter:
+            return delay * self._random_provider()
+        return delay
+
+
+class DecorrelatedJitter(RetryPolicy):
+    """Next delay is picked randomly between base and three times previous
+    delay (capped)"""
+
+    def __init__(self, base=0.05, max_delay=5, tries=None,
+                 random_provider=random.uniform):
+        """ Object initialization
+
+        :param base: minimal delay
+        :type base: float
+        :param max_delay: delay cap
+        :type max_delay: float
+        :param tries: max number of tries to obtain lock (None - unlimited)
+        :type tries: int
+        """
+        super(DecorrelatedJitter, self).__init__(tries)
+
+        self._base = base
+        self._max_delay = max_delay
+        self._random_provider = random_provider
+
+    def _delay(self, attempt, previous):
+        upper = (previous or self._base) * 3
+        return min(self._max_delay, self._random_provider(self._base, upper))
+
+
+class Deadline(RetryPolicy):
+    """Retries until given time passes.
+
+    Delays are taken from wrapped policy and clipped to the time left.
+    Once wrapped policy runs out of tries its last delay is repeated.
+    """
+
+    def __init__(self, timeout, policy=None,
+                 current_time_provider=time.time):
+        """ Object initialization
+
+        :param timeout: max time to wait for the lock (seconds); \
+                            negative value waits forever
+        :type timeout: float
+        :param policy: policy providing delays
+        :type policy: pylock.retry.RetryPolicy
+        """
+        super(Deadline, self).__init__()
+
+        self._timeout = timeout
+        self._policy = policy or Fixed(tries=None)
+        self._current_time_provider = current_time_provider
+
+    def delays(self):
+        if self._timeout < 0:
+            return self._delays(None)
+        return self._delays(self._current_time_provider() + self._timeout)
+
+    def _delays(self, deadline):
+        delays = self._policy.delays()
+        delay = None
+        while True:
+            delay = next(delays, delay)
+            if delay is None:
+                # wrapped policy does not retry at all - use default one
+                delays = Fixed(tries=None).delays()
+                continue
+
+            if deadline is None:
+                yield delay
+                continue
+
+            remaining = deadline - self._current_time_provider()
+            if remaining <= 0:
+                return
+            yield min(delay, remaining)
@@ -0,0 +1,324 @@
+# encoding: utf-8
+"""
+Lock server keeping lock records in memory.
+
+Clients (see :mod:`pylock.strategy.remote`) connect over Unix or TCP
+socket. Locks of client session are released as soon as all its
+connections are closed, so crashed processes never leave stale locks
+behind and nobody has to probe their PIDs.
+"""
+import errno
+import os
+import socket
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError: # pragma: no cover
+    import SocketServer as socketserver
+
+from logging_utils import getLogger
+
+from . import _protocol
+from .strategy import Snapshot
+
+logger = getLogger(__name__)
+
+
+class _Locks(object):
+    """Lock records shared by all connections; each method is a request
+    operation"""
+
+    OPERATIONS = frozenset(['read', 'fingerprint', 'create', 'clean', 'renew',
+                            'read_shared', 'create_shared', 'clean_shared',
+                            'read_queue', 'read_ahead', 'enqueue', 'dequeue',
+                            'issue_token', 'wait', 'wait_dequeued', 'held'])
+
+    def __init__(self, current_time_provider):
+        super(_Locks, self).__init__()
+
+        self._current_time_provider = current_time_provider
+        self._condition = threading.Condition(threading.Lock())
+        # lock name -> (snapshot, sequence number, session)
+        self._records = {}
+        # lock name -> {pid: (snapshot, session)}
+        self._shared = {}
+        # lock name -> {ticket: (snapshot, session)}
+        self._queues = {}
+        # session -> number of its open connections
+        self._sessions = {}
+        self._sequence = 0
+        # lock name -> last fencing token
+        self._tokens = {}
+
+    def connect(self, session):
+        with self._condition:
+            self._sessions[session] = self._sessions.get(session, 0) + 1
+
+    def disconnect(self, session):
+        """ Releases locks of session once its last connection is closed """
+        with self._condition:
+            self._sessions[session] -= 1
+            if self._sessions[session]:
+                return
+            del self._sessions[session]
+
+            for name, record in list(self._records.items()):
+                if record[2] == session:
+                    del self._records[name]
+            for records in (self._shared, self._queues):
+                for name, holders in list(records.items()):
+                    for key, (_, owner) in list(holders.items()):
+                        if owner == session:
+                            del holders[key]
+                    if not holders:
+                        del records[name]
+            self._condition.notify_all()
+
+    def read(self, session, name):
+        with self._condition:
+            record = self._records.get(name)
+            return _protocol.dump_snapshot(record[0] if record else Snapshot())
+
+    def fingerprint(self, session, name):
+        with self._condition:
+            record = self._records.get(name)
+            return record and record[1]
+
+    def create(self, session, name, pid, meta=None):
+        with self._condition:
+            if name in self._records:
+                return False
+            self._sequence += 1
+            self._records[name] = (self._snapshot(pid, meta), self._sequence, session)
+            return True
+
+    def clean(self, session, name):
+        with self._condition:
+            if self._records.pop(name, None) is not None:
+                self._condition.notify_all()
+
+    def renew(self, session, name):
+        with self._condition:
+            record = self._records.get(name)
+            if record is None:
+                return False
+            snapshot, sequence, owner = record
+            self._records[name] = (snapshot._replace(create_date=self._current_time_provider()),
+                                   sequence, owner)
+            return True
+
+    def issue_token(self, session, name, pid):
+        """ Tokens never fall below current time (in microseconds),
+        so they keep growing when server restarts """
+        with self._condition:
+            record = self._records.get(name)
+            if record is None or record[0].pid != pid or record[2] != session:
+                return None
+            snapshot, sequence, owner = record
+            token = max(self._tokens.get(name, 0),
+                        int(self._current_time_provider() * 1000000)) + 1
+            self._tokens[name] = token
+            self._records[name] = (snapshot._replace(meta=dict(snapshot.meta, token=str(token))),
+                                   sequence, owner)
+            return token
+
+    def read_queue(self, session, name):
+        with self._condition:
+            return [(ticket, _protocol.dump_snapshot(snapshot)) for ticket, (snapshot, _)
+                    in sorted(self._queues.get(name, {}).items())]
+
+    def read_ahead(self, session, name, ticket):
+        with self._condition:
+            queue = self._queues.get(name, {})
+            ahead = [queued for queued in queue if ticket is None or queued < ticket]
+            if not ahead:
+                return None
+            return max(ahead), _protocol.dump_snapshot(queue[max(ahead)][0])
+
+    def enqueue(self, session, name, pid, meta=None):
+        with self._condition:
+            self._sequence += 1
+            self._queues.setdefault(name, {})[self._sequence] = (self._snapshot(pid, meta),
+                                                                 session)
+            return self._sequence
+
+    def dequeue(self, session, name, ticket):
+        with self._condition:
+            queue = self._queues.get(name, {})
+            queue.pop(ticket, None)
+            if not queue:
+                self._queues.pop(name, None)
+            self._condition.notify_all()
+
+    def read_shared(self, session, name):
+        with self._condition:
+            return [_protocol.dump_snapshot(snapshot) for snapshot, _ in
+                    self._shared.get(name, {}).values()]
+
+    def create_shared(self, session, name, pid, meta=None):
+        with self._condition:
+            self._shared.setdefault(name, {})[pid] = (self._snapshot(pid, meta), session)
+            return True
+
+    def clean_shared(self, session, name, pid):
+        with self._condition:
+            holders = self._shared.get(name, {})
+            holders.pop(pid, None)
+            if not holders:
+                self._shared.pop(name, None)
+            self._condition.notify_all()
+
+    def wait(self, session, name, timeout):
+        """ Waits until record is removed or shared holder leaves """
+        with self._condition:
+            if name in self._records:
+                self._condition.wait(timeout)
+            return True
+
+    def wait_dequeued(self, session, name, ticket, timeout):
+        """ Waits until waiter holding given ticket leaves the queue """
+        with self._condition:
+            if ticket in self._queues.get(name, {}):
+                self._condition.wait(timeout)
+            return True
+
+    def held(self, session):
+        with self._condition:
+            return dict((name, _protocol.dump_snapshot(record[0]))
+                        for name, record in self._records.items())
+
+    def _snapshot(self, pid, meta):
+        return Snapshot(True, pid, self._current_time_provider(), meta or {})
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        locks = self.server.locks
+        hello = self.rfile.readline()
+        if not hello:
+            return
+        session = _protocol.decode(hello)['session']
+        locks.connect(session)
+        try:
+            self.wfile.write(_protocol.encode({'result': True}))
+            for line in self.rfile:
+                self.wfile.write(_protocol.encode(self._call(locks, session, line)))
+        except (IOError, OSError):
+            # client went away
+            pass
+        finally:
+            locks.disconnect(session)
+
+    @staticmethod
+    def _call(locks, session, line):
+        try:
+            request = _protocol.decode(line)
+            operation = request.pop('op')
+            if operation not in locks.OPERATIONS:
+                raise ValueError('Unknown operation: {0!r}'.format(operation))
+            return {'result': getattr(locks, operation)(session, **request)}
+        except Exception as exc:
+            with logger.context(request=line):
+                logger.warning('invalid request')
+            return {'error': str(exc)}
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LockServer(object):
+    """Serves locks kept in memory to clients connected over socket"""
+
+    def __init__(self, address, current_time_provider=time.time):
+        """ Object initialization
+
+        :param address: path of Unix socket or (host, port) pair of TCP socket
+        :type address: str|tuple
+        :param current_time_provider: function returning current time
+        :type current_time_provider: callable
+        """
+        super(LockServer, self).__init__()
+
+        if isinstance(address, tuple):
+            self._server = _TCPServer(address, _Handler)
+        else:
+            _remove_stale_socket(address)
+            self._server = _UnixServer(address, _Handler)
+        self._server.locks = _Locks(current_time_provider)
+        self._thread = None
+
+    @property
+    def address(self):
+        """Address server listens on (with actual port of TCP socket)
+
+        :rtype: str|tuple
+        """
+        return self._server.server_address
+
+    def serve_forever(self, poll_interval=0.5):
+        """ Handles requests until :meth:`shutdown` is called
+
+        :param poll_interval: how often (seconds) shutdown request is checked
+        :type poll_interval: float
+        """
+        self._server.serve_forever(poll_interval)
+
+    def start(self, poll_interval=0.5):
+        """ Handles requests in background thread
+
+        :param poll_interval: see :meth:`serve_forever`
+        :type poll_interval: float
+        :rtype: pylock.server.LockServer
+        """
+        self._thread = threading.Thread(target=self.serve_forever, args=(poll_interval,),
+                                        name='pylock-server')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def shutdown(self):
+        """Stops handling requests and closes socket"""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        if not isinstance(self.address, tuple):
+            try:
+                os.remove(self.address)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        if self._thread is None:
+            self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+def _remove_stale_socket(path):
+    """ Removes socket left by crashed server; raises when server is running """
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (IOError, OSError) as exc:
+        if exc.errno != errno.ECONNREFUSED:
+            raise
+        os.remove(path)
+    else:
+        raise OSError(errno.EADDRINUSE, 'Lock server is already running', path)
+    finally:
+        probe.close()
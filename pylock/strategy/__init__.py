@@ -1,19 +1,222 @@
 # encoding: utf-8
 
 import abc
+from collections import namedtuple
+
 from pylock._compat import with_metaclass
 
+
+class Snapshot(namedtuple('Snapshot', 'exists pid create_date meta')):
+    """Immutable view of lock record taken at single point in time
+
+    :param exists: whether lock record exists
+    :type exists: bool
+    :param pid: pid of lock owner (None when unknown)
+    :type pid: int
+    :param create_date: timestamp of lock record creation
+    :type create_date: float
+    :param meta: additional information about lock owner
+    :type meta: dict
+    """
+    __slots__ = ()
+
+    def __new__(cls, exists=False, pid=None, create_date=0, meta=None):
+        return super(Snapshot, cls).__new__(cls, exists, pid, create_date,
+                                            meta or {})
+
+
 class Base(with_metaclass(abc.ABCMeta)):
 
     def is_valid(self):
         return True # pragma: no cover
 
+    @property
+    def key(self):
+        """Identity of the lock; strategies pointing to the same lock \
+        should share it.
+
+        :rtype: hashable
+        """
+        return self
+
+    @property
+    def manages_liveness(self):
+        """Whether lock records are removed once their owners are gone, \
+        so liveness of owners need not be checked.
+
+        :rtype: bool
+        """
+        return False
+
+    @property
+    def queues_waiters(self):
+        """Whether strategy keeps queue of waiters (see :meth:`enqueue`), \
+        so it can back fair locks.
+
+        :rtype: bool
+        """
+        return False
+
+    def read(self):
+        """Returns snapshot of current lock record.
+
+        Strategies are encouraged to override this method
+        and gather all information at once.
+
+        :rtype: pylock.strategy.Snapshot
+        """
+        if not self.exists():
+            return Snapshot()
+        return Snapshot(True, self.read_pid(), self.get_create_date())
+
+    def fingerprint(self):
+        """Returns cheap value that changes whenever lock record is replaced.
+
+        :rtype: hashable
+        """
+        snapshot = self.read()
+        return snapshot.pid, snapshot.create_date
+
+    def wait(self, timeout):
+        """Blocks until lock might have been released or timeout passes.
+
+        :param timeout: max time to wait (seconds)
+        :type timeout: float
+        :returns: False when strategy is not able to wait for lock release \
+                    (caller should fall back to sleeping)
+        :rtype: bool
+        """
+        return False
+
+    def clean_stale(self, fingerprint):
+        """Removes stale lock record unless it has been replaced since \
+        given fingerprint was taken.
+
+        Strategies are encouraged to override this method, so contenders
+        taking record over at once never remove each other's new records.
+
+        :param fingerprint: value returned by :meth:`fingerprint`
+        :type fingerprint: hashable
+        """
+        self.clean()
+
+    def renew(self):
+        """Refreshes creation date of lock record (extends its lease).
+
+        :returns: whether lock record has been renewed
+        :rtype: bool
+        """
+        raise NotImplementedError('Strategy does not support leases')
+
+    def issue_token(self, pid):
+        """Issues fencing token greater than any token issued before \
+        for the lock and stores it in lock record of given pid; tokens \
+        outlive lock records.
+
+        Token has to be issued while the record is confirmed to be held \
+        by given pid, so whoever creates the record later gets greater one.
+
+        :param pid: pid of lock owner
+        :type pid: int
+        :returns: token (None when record is not held by given pid)
+        :rtype: int
+        """
+        raise NotImplementedError('Strategy does not support fencing tokens')
+
+    def read_queue(self):
+        """Returns (ticket, snapshot) pairs of waiters queued for fair lock, \
+        ordered by ticket.
+
+        :rtype: tuple
+        """
+        return ()
+
+    def read_ahead(self, ticket):
+        """Returns (ticket, snapshot) pair of waiter queued directly before \
+        given ticket (the last one when ticket is None).
+
+        Strategies are encouraged to override this method, so waiter does
+        not read whole queue.
+
+        :param ticket: ticket returned by :meth:`enqueue`
+        :type ticket: int
+        :returns: None when nobody is queued ahead
+        :rtype: tuple
+        """
+        ahead = None
+        for queued in self.read_queue():
+            if ticket is not None and queued[0] >= ticket:
+                break
+            ahead = queued
+        return ahead
+
+    def wait_dequeued(self, ticket, timeout):
+        """Blocks until waiter holding given ticket leaves fair lock queue \
+        or timeout passes.
+
+        :param ticket: ticket returned by :meth:`enqueue`
+        :type ticket: int
+        :param timeout: max time to wait (seconds)
+        :type timeout: float
+        :returns: False when strategy is not able to wait for it \
+                    (caller should fall back to sleeping)
+        :rtype: bool
+        """
+        return False
+
+    def enqueue(self, pid, meta=None):
+        """Adds given pid to the end of fair lock queue.
+
+        :param pid: pid of waiter
+        :type pid: int
+        :param meta: process identity to be stored along with pid
+        :type meta: dict
+        :returns: ticket greater than tickets of all queued waiters
+        :rtype: int
+        """
+        raise NotImplementedError('Strategy does not support fair locks')
+
+    def dequeue(self, ticket):
+        """Removes waiter holding given ticket from fair lock queue.
+
+        :param ticket: ticket returned by :meth:`enqueue`
+        :type ticket: int
+        """
+        raise NotImplementedError('Strategy does not support fair locks')
+
+    def read_shared(self):
+        """Returns snapshots of shared lock holders (readers).
+
+        :rtype: tuple
+        """
+        return ()
+
+    def create_shared(self, pid, meta=None):
+        """Registers given pid as shared lock holder.
+
+        :param pid: pid to be registered
+        :type pid: int
+        :param meta: process identity to be stored along with pid
+        :type meta: dict
+        :returns: whether pid has been registered
+        :rtype: bool
+        """
+        raise NotImplementedError('Strategy does not support shared locks')
+
+    def clean_shared(self, pid):
+        """Unregisters given pid from shared lock holders.
+
+        :param pid: pid to be unregistered
+        :type pid: int
+        """
+        raise NotImplementedError('Strategy does not support shared locks')
+
     @abc.abstractmethod
     def exists(self):
         pass # pragma: no cover
 
     @abc.abstractmethod
-    def create(self, pid):
+    def create(self, pid, meta=None):
         pass # pragma: no cover
 
     @abc.abstractmethod
@@ -27,4 +230,3 @@ class Base(with_metaclass(abc.ABCMeta)):
     @abc.abstractmethod
     def get_create_date(self, max_age):
         pass # pragma: no cover
-
@@ -3,45 +3,217 @@
 import os
 import errno
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 from logging_utils import getLogger
-from logging_utils.sentinel import SentinelBuilder
 
-from pylock.strategy import Base
+from pylock import CouldNotCreateLockError, _inotify
+from pylock.strategy import Base, Snapshot
+from pylock.strategy.file.writers import atomic_write
 
 logger = getLogger(__name__)
-sentinel = SentinelBuilder(logger, reraise=False, with_traceback=False)
+
+# errors of lockfile creation that retrying does not fix
+_PERMANENT_ERRORS = frozenset([errno.ENOENT, errno.ENOTDIR, errno.EACCES,
+                               errno.EPERM, errno.EROFS])
 
 class File(Base):
-    """Class that represents file-based locking strategy (PID file)"""
+    """Class that represents file-based locking strategy (PID file)
 
-    def __init__(self, path, atomic_writer=None):
+    Shared lock holders are kept as empty files named after their PIDs
+    in "<lockfile>.shared" directory. Waiters of fair locks are kept
+    as files named after their tickets in "<lockfile>.queue" directory.
+    """
+
+    def __init__(self, path, atomic_writer=None, dir_fd=None):
         """ Object initialization
 
         :param path: path to lockfile
         :type path: str
+        :param atomic_writer: function creating lockfile of given path \
+                        and content, failing when lockfile exists; \
+                        :func:`pylock.strategy.file.writers.atomic_write` \
+                        by default; gets `dir_fd` keyword along with \
+                        lockfile name when `dir_fd` is given
+        :type atomic_writer: callable
+        :param dir_fd: descriptor of directory holding lockfile; when given \
+                        lockfile (and its queue, shared holders and token \
+                        counter) is looked up relative to it, which saves \
+                        resolving whole path on every operation
+        :type dir_fd: int
         """
         super(File, self).__init__()
 
         self._path = path
-        self._atomic_writer = atomic_writer
+        self._atomic_writer = atomic_writer or atomic_write
+        if dir_fd is None:
+            self._name, self._at = path, {}
+        else:
+            self._name, self._at = os.path.basename(path), {'dir_fd': dir_fd}
+
+    @property
+    def key(self):
+        return (type(self).__name__, os.path.abspath(self._path))
 
     def exists(self):
-        return os.path.exists(self._path)
+        return self._exists(self._name)
+
+    def read(self):
+        """ Read whole lockfile at once.
+
+        Lockfile holds PID in first line followed by optional
+        "key=value" lines with owner metadata.
+
+        :returns: snapshot of lockfile
+        :rtype: pylock.strategy.Snapshot
+        """
+        try:
+            fd = os.open(self._name, os.O_RDONLY, **self._at)
+        except OSError as exc:
+            if exc.errno == errno.ENOENT:
+                return Snapshot()
+            return Snapshot(True)
+
+        try:
+            return self._read(fd)
+        finally:
+            os.close(fd)
+
+    def _read(self, fd):
+        """ Builds snapshot out of already opened lockfile
+
+        :param fd: lockfile descriptor
+        :type fd: int
+        :rtype: pylock.strategy.Snapshot
+        """
+        try:
+            create_date = os.fstat(fd).st_mtime
+            content = os.read(fd, 4096).decode('utf-8')
+        except (OSError, UnicodeDecodeError):
+            return Snapshot(True)
 
-    def create(self, pid):
+        return _parse(content, create_date)
+
+    def fingerprint(self):
+        """ Returns lockfile inode and modification time.
+
+        :rtype: tuple
+        """
+        try:
+            stat = os.stat(self._name, **self._at)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime
+
+    def wait(self, timeout):
+        """ Wait until lockfile is removed (inotify based, Linux only).
+
+        :param timeout: max time to wait (seconds)
+        :type timeout: float
+        :returns: False when inotify is not available
+        :rtype: bool
+        """
+        directory, name = os.path.split(os.path.abspath(self._path))
+        return _inotify.wait(directory,
+                             _inotify.IN_DELETE | _inotify.IN_MOVED_FROM,
+                             timeout, name=name,
+                             ready=lambda: not self.exists()) is not None
+
+    def create(self, pid, meta=None):
         """ Write the PID in the named PID file.
 
         Get the numeric process ID (“PID”) of the current process
-        and write it to the named file as a line of text.
+        and write it to the named file as a line of text,
+        followed by `key=value` lines of process identity.
 
         :param pid: pid to be written
         :type pid: int
+        :param meta: process identity to be written
+        :type meta: dict
+        :raises pylock.CouldNotCreateLockError: lockfile can never be \
+                    created (e.g. its directory is missing or read-only)
         """
-        with sentinel('Create lockfile'):
-            # sentinel will catch any exception, log message and suppress it
-            self._atomic_writer(self._path, str(pid))
-            return True
-        return False
+        try:
+            self._atomic_writer(self._name, _format(pid, meta), **self._at)
+        except Exception as exc:
+            # any error means lockfile has not been created;
+            # existing lockfile means other process has been faster
+            code = getattr(exc, 'errno', None)
+            if code != errno.EEXIST:
+                with logger.context(pidfile=self._path):
+                    logger.exception('could not create lockfile')
+            if code in _PERMANENT_ERRORS:
+                raise CouldNotCreateLockError(permanent=True)
+            return False
+        return True
+
+    def renew(self):
+        """ Update modification time of the named PID file.
+
+        :returns: whether PID file has been renewed
+        :rtype: bool
+        """
+        try:
+            os.utime(self._name, None, **self._at)
+        except OSError:
+            return False
+        return True
+
+    def issue_token(self, pid):
+        """ Increment counter kept in "<lockfile>.token" file and append
+        the token to lockfile of given pid.
+
+        Counter file is never removed, so tokens grow across lockfiles.
+        Lockfile is confirmed to be in place only after counter has been
+        incremented, so owners of later lockfiles get greater tokens.
+        Lockfile replaced afterwards gets the token written to the removed
+        file only.
+
+        :param pid: pid of lock owner
+        :type pid: int
+        :returns: new fencing token (None when lockfile is not held by pid)
+        :rtype: int
+        """
+        if fcntl is None:
+            raise NotImplementedError('Fencing tokens require fcntl')
+
+        try:
+            fd = os.open(self._name, os.O_RDWR | os.O_APPEND, **self._at)
+        except OSError:
+            return None
+        try:
+            if self._read(fd).pid != pid:
+                return None
+            token = self._next_token()
+            if not os.fstat(fd).st_nlink:
+                # lockfile has been removed in the meantime
+                return None
+            os.write(fd, '\ntoken={0}'.format(token).encode('ascii'))
+        finally:
+            os.close(fd)
+        return token
+
+    def _next_token(self):
+        """ Increments counter kept in "<lockfile>.token" file
+
+        :rtype: int
+        """
+        fd = os.open(self._name + '.token', os.O_RDWR | os.O_CREAT, 0o644, **self._at)
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            content = os.read(fd, 32).strip()
+            token = int(content) + 1 if content else 1
+            # counter never gets shorter, so it is simply overwritten
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, str(token).encode('ascii'))
+            os.fsync(fd)
+        finally:
+            # closing descriptor releases the lock
+            os.close(fd)
+        return token
 
     def clean(self):
         """ Remove the named PID file if it exists.
@@ -49,42 +221,255 @@ class File(Base):
         :returns: None
         :rtype: None
         """
-        with logger.context(pidfile=self._path):
-            try:
-                logger.debug('removing pidfile')
-                os.remove(self._path)
-            except OSError as exc:
-                if exc.errno != errno.ENOENT:
+        try:
+            os.remove(self._name, **self._at)
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                with logger.context(pidfile=self._path):
                     logger.exception('could not remove pidfile')
-                    raise
+                raise
 
-    def read_pid(self):
-        """ Read the PID recorded in the named PID file.
+    @property
+    def queues_waiters(self):
+        return True
 
-        :returns: pid from pidfile
+    def read_queue(self):
+        """ Read waiters queued for fair lock.
+
+        :returns: (ticket, snapshot) pairs ordered by ticket
+        :rtype: tuple
+        """
+        queue = []
+        for ticket in self._tickets():
+            try:
+                fd = os.open(os.path.join(self._queue_name, str(ticket)), os.O_RDONLY,
+                             **self._at)
+            except OSError:
+                # waiter has just left the queue
+                continue
+            try:
+                queue.append((ticket, self._read(fd)))
+            finally:
+                os.close(fd)
+        return tuple(queue)
+
+    def read_ahead(self, ticket):
+        """ Read waiter queued directly before given ticket; ticket files
+        of other waiters are not opened.
+
+        :param ticket: ticket returned by :meth:`enqueue`
+        :type ticket: int
+        :returns: (ticket, snapshot) pair, None when nobody is queued ahead
+        :rtype: tuple
+        """
+        for queued in reversed(self._tickets()):
+            if ticket is not None and queued >= ticket:
+                continue
+            try:
+                fd = os.open(os.path.join(self._queue_name, str(queued)), os.O_RDONLY,
+                             **self._at)
+            except OSError:
+                # waiter has just left the queue
+                continue
+            try:
+                return queued, self._read(fd)
+            finally:
+                os.close(fd)
+        return None
+
+    def wait_dequeued(self, ticket, timeout):
+        """ Wait until ticket file is removed (inotify based, Linux only).
+
+        :param ticket: ticket returned by :meth:`enqueue`
+        :type ticket: int
+        :param timeout: max time to wait (seconds)
+        :type timeout: float
+        :returns: False when inotify is not available
+        :rtype: bool
+        """
+        name = str(ticket)
+        return _inotify.wait(os.path.abspath(self._path + '.queue'),
+                             _inotify.IN_DELETE | _inotify.IN_MOVED_FROM,
+                             timeout, name=name,
+                             ready=lambda: not self._exists(
+                                 os.path.join(self._queue_name, name))) is not None
+
+    def enqueue(self, pid, meta=None):
+        """ Write ticket file following the last one in queue directory.
+
+        Ticket file is created atomically, so waiters taking tickets
+        at the same time end up with different ones.
+
+        :param pid: pid of waiter
+        :type pid: int
+        :param meta: process identity to be written
+        :type meta: dict
+        :returns: ticket
         :rtype: int
         """
+        try:
+            os.mkdir(self._queue_name, 0o777, **self._at)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
 
-        with logger.context(pidfile=self._path):
-            logger.debug('reading pid from pidfile')
+        while True:
+            ticket = max(self._tickets() or [0]) + 1
             try:
-                pidfile = open(self._path, 'r')
-            except IOError:
-                logger.debug('could not read pid from pidfile')
-                return
+                self._atomic_writer(os.path.join(self._queue_name, str(ticket)),
+                                    _format(pid, meta), **self._at)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+            else:
+                return ticket
+
+    def dequeue(self, ticket):
+        """ Remove ticket file from queue directory.
 
-            logger.debug('parsing content from pidfile')
+        :param ticket: ticket returned by :meth:`enqueue`
+        :type ticket: int
+        """
+        try:
+            os.remove(os.path.join(self._queue_name, str(ticket)), **self._at)
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+
+    def _tickets(self):
+        try:
+            names = self._listdir(self._queue_name)
+        except OSError as exc:
+            if exc.errno == errno.ENOENT:
+                return []
+            raise
+        return sorted(int(name) for name in names if name.isdigit())
+
+    @property
+    def _queue_name(self):
+        return self._name + '.queue'
+
+    def _exists(self, name):
+        try:
+            os.stat(name, **self._at)
+        except OSError:
+            return False
+        return True
+
+    def _listdir(self, name):
+        """ Lists directory of given name (relative to `dir_fd` if given)
+
+        :rtype: list
+        """
+        if not self._at:
+            return os.listdir(name)
+        fd = os.open(name, os.O_RDONLY | os.O_DIRECTORY, **self._at)
+        try:
+            return os.listdir(fd)
+        finally:
+            os.close(fd)
+
+    def read_shared(self):
+        """ Read shared lock holders.
+
+        :returns: snapshots of shared lock holders
+        :rtype: tuple
+        """
+        try:
+            names = self._listdir(self._shared_name)
+        except OSError as exc:
+            if exc.errno == errno.ENOENT:
+                return ()
+            raise
+
+        snapshots = []
+        for name in names:
             try:
-                return int(pidfile.readline().strip())
-            except ValueError:
-                logger.exception('could not parse pidfile content')
-                pass
+                pid = int(name)
+                fd = os.open(os.path.join(self._shared_name, name), os.O_RDONLY, **self._at)
+            except (ValueError, OSError):
+                continue
+            try:
+                snapshot = self._read(fd)
             finally:
-                pidfile.close()
+                os.close(fd)
+            snapshots.append(snapshot._replace(pid=pid))
+        return tuple(snapshots)
+
+    def create_shared(self, pid, meta=None):
+        """ Register pid in shared lock holders directory.
+
+        :param pid: pid to be registered
+        :type pid: int
+        :param meta: process identity to be written
+        :type meta: dict
+        :returns: whether pid has been registered
+        :rtype: bool
+        """
+        try:
+            os.mkdir(self._shared_name, 0o777, **self._at)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                return False
+
+        try:
+            fd = os.open(os.path.join(self._shared_name, str(pid)),
+                         os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644, **self._at)
+        except OSError:
+            return False
+        try:
+            os.write(fd, _format(pid, meta).encode('utf-8'))
+        except OSError:
+            return False
+        finally:
+            os.close(fd)
+        return True
+
+    def clean_shared(self, pid):
+        """ Unregister pid from shared lock holders directory.
+
+        :param pid: pid to be unregistered
+        :type pid: int
+        """
+        try:
+            os.remove(os.path.join(self._shared_name, str(pid)), **self._at)
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+
+    @property
+    def _shared_name(self):
+        return self._name + '.shared'
+
+    def read_pid(self):
+        """ Read the PID recorded in the named PID file.
+
+        :returns: pid from pidfile
+        :rtype: int
+        """
+        return self.read().pid
 
     def get_create_date(self):
         try:
-            return os.stat(self._path).st_mtime
+            return os.stat(self._name, **self._at).st_mtime
         except OSError:
             return 0
 
+
+def _format(pid, meta):
+    """Builds lockfile content out of pid and process identity"""
+    lines = [str(pid)]
+    lines.extend('{0}={1}'.format(key, value)
+                 for key, value in sorted((meta or {}).items()))
+    return '\n'.join(lines)
+
+
+def _parse(content, create_date):
+    """Builds snapshot out of lockfile content"""
+    lines = content.splitlines() or ['']
+    try:
+        pid = int(lines[0].strip())
+    except ValueError:
+        pid = None
+    meta = dict(line.split('=', 1) for line in lines[1:] if '=' in line)
+    return Snapshot(True, pid, create_date, meta)
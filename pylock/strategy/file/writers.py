@@ -1,17 +1,131 @@
 # encoding: utf-8
+""" Module holds functions creating lockfiles atomically
 
+Lockfile is written aside and linked into place only once complete, so
+nobody sees partially written lockfile, and linking fails when lockfile
+already exists. Use ``functools.partial(atomic_write, fsync=False)``
+for locks kept on tmpfs, where durability is meaningless.
+"""
 from __future__ import absolute_import
 
-try:
-    from atomicwrites import atomic_write as atomic_write_
-except ImportError:
-    atomic_write_ = None
+import binascii
+import errno
+import os
 
+_O_TMPFILE = getattr(os, 'O_TMPFILE', None)
+# lockfiles are readable to everybody, like regular PID files
+_MODE = 0o644
+# errors telling O_TMPFILE (or linking it through /proc) is not supported
+_UNSUPPORTED = frozenset([errno.EISDIR, errno.EINVAL, errno.EOPNOTSUPP])
 
-def atomic_write(path, data):
-    if atomic_write_ is None:
-        raise NotImplementedError('atomicwrites.atomic_write is missing')
 
-    with atomic_write_(path, overwrite=False) as stream:
-        stream.write(data)
+def atomic_write(path, data, fsync=True, dir_fd=None):
+    """ Creates file holding given data unless file exists
 
+    :param path: path to file
+    :type path: str
+    :param data: file content
+    :type data: str
+    :param fsync: whether file (and its directory) should be flushed \
+                    to disk before function returns
+    :type fsync: bool
+    :param dir_fd: descriptor of directory relative to which `path` \
+                    (and its temporary file) is resolved
+    :type dir_fd: int
+    :raises OSError: EEXIST when file exists
+    """
+    if dir_fd is None:
+        directory, at = os.path.dirname(os.path.abspath(path)), {}
+    else:
+        directory, at = os.path.dirname(path) or os.curdir, {'dir_fd': dir_fd}
+    data = data.encode('utf-8')
+    if not _link_anonymous(directory, path, data, fsync, **at):
+        _link_temporary(directory, path, data, fsync, **at)
+    if fsync:
+        _fsync_directory(directory, **at)
+
+
+def _link_anonymous(directory, path, data, fsync, **at):
+    """ Writes file without name and links it into place (Linux only)
+
+    :returns: False when not supported
+    :rtype: bool
+    """
+    global _O_TMPFILE
+    if _O_TMPFILE is None:
+        return False
+    try:
+        fd = os.open(directory, _O_TMPFILE | os.O_WRONLY, _MODE, **at)
+    except OSError as exc:
+        if exc.errno in _UNSUPPORTED:
+            return False
+        raise
+
+    try:
+        _write(fd, data, fsync)
+        try:
+            os.link('/proc/self/fd/{0}'.format(fd), path, follow_symlinks=True,
+                    dst_dir_fd=at.get('dir_fd'))
+        except OSError as exc:
+            if exc.errno == errno.EXDEV or \
+                    (exc.errno == errno.ENOENT and not os.path.isdir('/proc/self/fd')):
+                # descriptors can not be linked through /proc on this system
+                _O_TMPFILE = None
+                return False
+            raise
+    finally:
+        os.close(fd)
+    return True
+
+
+def _link_temporary(directory, path, data, fsync, **at):
+    """ Writes temporary file and links it into place """
+    fd, temporary = _create_temporary(directory, **at)
+    try:
+        try:
+            os.fchmod(fd, _MODE)
+            _write(fd, data, fsync)
+        finally:
+            os.close(fd)
+        if at:
+            os.link(temporary, path, src_dir_fd=at['dir_fd'], dst_dir_fd=at['dir_fd'])
+        else:
+            os.link(temporary, path)
+    finally:
+        os.remove(temporary, **at)
+
+
+def _create_temporary(directory, **at):
+    """ Creates hidden temporary file in given directory
+
+    Unlike :func:`tempfile.mkstemp` file may be created relative
+    to directory descriptor.
+
+    :returns: descriptor and path of the file
+    :rtype: tuple
+    """
+    while True:
+        name = '.{0}.tmp'.format(binascii.hexlify(os.urandom(6)).decode('ascii'))
+        temporary = os.path.join(directory, name)
+        try:
+            fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600, **at)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        else:
+            return fd, temporary
+
+
+def _write(fd, data, fsync):
+    while data:
+        data = data[os.write(fd, data):]
+    if fsync:
+        os.fsync(fd)
+
+
+def _fsync_directory(directory, **at):
+    fd = os.open(directory, os.O_RDONLY, **at)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
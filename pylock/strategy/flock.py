@@ -0,0 +1,192 @@
+# encoding: utf-8
+""" Module holds kernel-backed (flock) locking strategy """
+import os
+import errno
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from pylock import _inotify
+from pylock.strategy import Base, Snapshot
+from pylock.strategy.file import File, _format
+
+
+class Flock(File):
+    """Class that represents locking strategy backed by ``flock(2)``.
+
+    Lock is held on an open file descriptor, so kernel releases it as soon
+    as owner process dies. PID written to the file is kept for diagnostics
+    only. Lockfile is never removed: removing it would let another process
+    lock a new inode while the old one is still held.
+
+    Descriptor inherited from parent process after fork is never used:
+    releasing it would release parent's lock.
+
+    Kernel lock proves its owner alive, so PID of lock owner is never
+    probed. Shared holders and queued waiters would be kept in files
+    outliving their owners, so shared and fair locks are not supported.
+    """
+
+    def __init__(self, path):
+        """ Object initialization
+
+        :param path: path to lockfile
+        :type path: str
+        """
+        if fcntl is None:
+            raise NotImplementedError('fcntl module is missing')
+
+        super(Flock, self).__init__(path)
+
+        self._fd = None
+        self._fd_pid = None
+
+    @property
+    def manages_liveness(self):
+        return True
+
+    @property
+    def queues_waiters(self):
+        return False
+
+    read_queue = Base.read_queue
+    read_ahead = Base.read_ahead
+    wait_dequeued = Base.wait_dequeued
+    enqueue = Base.enqueue
+    dequeue = Base.dequeue
+    read_shared = Base.read_shared
+    create_shared = Base.create_shared
+    clean_shared = Base.clean_shared
+
+    def exists(self):
+        return self.read().exists
+
+    def read(self):
+        """ Probes kernel lock and reads diagnostic PID of its owner.
+
+        :returns: snapshot of lockfile
+        :rtype: pylock.strategy.Snapshot
+        """
+        if self._holds_lock():
+            return super(Flock, self).read()
+
+        try:
+            fd = os.open(self._name, os.O_RDONLY, **self._at)
+        except OSError as exc:
+            if exc.errno == errno.ENOENT:
+                return Snapshot()
+            return Snapshot(True)
+
+        try:
+            if _flock(fd, fcntl.LOCK_SH):
+                # nobody holds the lock; probe is released along with fd
+                return Snapshot()
+            return self._read(fd)
+        finally:
+            os.close(fd)
+
+    def wait(self, timeout):
+        """ Wait until lock owner closes its descriptor (inotify based).
+
+        Descriptor is closed by kernel also when owner dies.
+
+        :param timeout: max time to wait (seconds)
+        :type timeout: float
+        :returns: False when inotify is not available
+        :rtype: bool
+        """
+        return _inotify.wait(self._path,
+                             _inotify.IN_CLOSE_WRITE | _inotify.IN_DELETE_SELF,
+                             timeout,
+                             ready=lambda: not self.exists()) is not None
+
+    def create(self, pid, meta=None):
+        """ Acquire kernel lock and write the PID to the lockfile.
+
+        :param pid: pid to be written
+        :type pid: int
+        :param meta: process identity to be written
+        :type meta: dict
+        :returns: whether lock has been acquired
+        :rtype: bool
+        """
+        if self._holds_lock():
+            return False
+
+        fd = os.open(self._name, os.O_RDWR | os.O_CREAT, 0o644, **self._at)
+        try:
+            if not _flock(fd, fcntl.LOCK_EX):
+                os.close(fd)
+                return False
+            os.ftruncate(fd, 0)
+            os.write(fd, _format(pid, meta).encode('utf-8'))
+        except OSError:
+            os.close(fd)
+            raise
+
+        self._fd = fd
+        self._fd_pid = os.getpid()
+        return True
+
+    def issue_token(self, pid):
+        """ Increment counter kept in "<lockfile>.token" file and append
+        the token to lockfile held by this instance.
+
+        Lockfile cannot be taken over while kernel lock is held.
+
+        :param pid: pid of lock owner
+        :type pid: int
+        :returns: new fencing token (None when lock is not held)
+        :rtype: int
+        """
+        if not self._holds_lock():
+            return None
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        if self._read(self._fd).pid != pid:
+            return None
+        token = self._next_token()
+        os.lseek(self._fd, 0, os.SEEK_END)
+        os.write(self._fd, '\ntoken={0}'.format(token).encode('ascii'))
+        return token
+
+    def clean(self):
+        """ Release kernel lock held by this instance.
+
+        Does nothing when lock is held by someone else - it will be released
+        by kernel once its owner dies.
+
+        :returns: None
+        :rtype: None
+        """
+        if not self._holds_lock():
+            return
+
+        fd, self._fd = self._fd, None
+        try:
+            os.ftruncate(fd, 0)
+        finally:
+            os.close(fd)
+
+    def _holds_lock(self):
+        if self._fd is not None and self._fd_pid != os.getpid():
+            # inherited from parent; closing our copy keeps parent's lock
+            os.close(self._fd)
+            self._fd = None
+        return self._fd is not None
+
+
+def _flock(fd, operation):
+    """Tries to obtain lock without blocking
+
+    :returns: whether lock has been obtained
+    :rtype: bool
+    """
+    try:
+        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+    except (IOError, OSError) as exc:
+        if exc.errno in (errno.EAGAIN, errno.EACCES):
+            return False
+        raise
+    return True
@@ -0,0 +1,177 @@
+# encoding: utf-8
+""" Module holds in-memory locking strategy """
+import threading
+import time
+
+from pylock.strategy import Base, Snapshot
+
+
+class Store(object):
+    """Holds lock records in memory; locks sharing store see each other"""
+
+    def __init__(self):
+        super(Store, self).__init__()
+
+        self.condition = threading.Condition(threading.Lock())
+        self.records = {}
+        # lock name -> {pid: snapshot of shared holder}
+        self.shared = {}
+        # lock name -> last fencing token
+        self.tokens = {}
+        # lock name -> {ticket: snapshot of waiter}
+        self.queues = {}
+
+
+_default_store = Store()
+
+
+class Memory(Base):
+    """Class that represents locking strategy keeping records in memory.
+
+    Records are visible to current process only, which makes the strategy
+    suitable for tests and single-process tools. Forked child gets its own
+    copy of records.
+    """
+
+    def __init__(self, name, store=None, current_time_provider=time.time):
+        """ Object initialization
+
+        :param name: lock name
+        :type name: str
+        :param store: store holding records (process-wide one by default)
+        :type store: pylock.strategy.memory.Store
+        :param current_time_provider: function returning current time
+        :type current_time_provider: callable
+        """
+        super(Memory, self).__init__()
+
+        self._name = name
+        self._store = store or _default_store
+        self._current_time_provider = current_time_provider
+
+    @property
+    def key(self):
+        return (type(self).__name__, id(self._store), self._name)
+
+    def read(self):
+        with self._store.condition:
+            return self._store.records.get(self._name, Snapshot())
+
+    def exists(self):
+        return self.read().exists
+
+    def read_pid(self):
+        return self.read().pid
+
+    def get_create_date(self):
+        return self.read().create_date
+
+    def create(self, pid, meta=None):
+        """ Store record of given pid unless other record exists
+
+        :param pid: pid to be stored
+        :type pid: int
+        :param meta: process identity to be stored
+        :type meta: dict
+        :returns: whether record has been created
+        :rtype: bool
+        """
+        with self._store.condition:
+            if self._name in self._store.records:
+                return False
+            self._store.records[self._name] = self._snapshot(pid, meta)
+            return True
+
+    def clean(self):
+        with self._store.condition:
+            self._store.records.pop(self._name, None)
+            self._store.condition.notify_all()
+
+    def renew(self):
+        with self._store.condition:
+            snapshot = self._store.records.get(self._name)
+            if snapshot is None:
+                return False
+            self._store.records[self._name] = snapshot._replace(
+                create_date=self._current_time_provider())
+            return True
+
+    def issue_token(self, pid):
+        with self._store.condition:
+            snapshot = self._store.records.get(self._name)
+            if snapshot is None or snapshot.pid != pid:
+                return None
+            token = self._store.tokens.get(self._name, 0) + 1
+            self._store.tokens[self._name] = token
+            self._store.records[self._name] = snapshot._replace(
+                meta=dict(snapshot.meta, token=str(token)))
+            return token
+
+    def wait(self, timeout):
+        """ Wait until record is removed or shared holder leaves
+
+        :param timeout: max time to wait (seconds)
+        :type timeout: float
+        :rtype: bool
+        """
+        with self._store.condition:
+            if self._name in self._store.records:
+                self._store.condition.wait(timeout)
+            return True
+
+    @property
+    def queues_waiters(self):
+        return True
+
+    def read_queue(self):
+        with self._store.condition:
+            return tuple(sorted(self._store.queues.get(self._name, {}).items()))
+
+    def enqueue(self, pid, meta=None):
+        with self._store.condition:
+            queue = self._store.queues.setdefault(self._name, {})
+            ticket = max(queue or [0]) + 1
+            queue[ticket] = self._snapshot(pid, meta)
+            return ticket
+
+    def dequeue(self, ticket):
+        with self._store.condition:
+            queue = self._store.queues.get(self._name, {})
+            queue.pop(ticket, None)
+            if not queue:
+                self._store.queues.pop(self._name, None)
+            self._store.condition.notify_all()
+
+    def wait_dequeued(self, ticket, timeout):
+        """ Wait until waiter holding given ticket leaves the queue
+
+        :param ticket: ticket returned by :meth:`enqueue`
+        :type ticket: int
+        :param timeout: max time to wait (seconds)
+        :type timeout: float
+        :rtype: bool
+        """
+        with self._store.condition:
+            if ticket in self._store.queues.get(self._name, {}):
+                self._store.condition.wait(timeout)
+            return True
+
+    def read_shared(self):
+        with self._store.condition:
+            return tuple(self._store.shared.get(self._name, {}).values())
+
+    def create_shared(self, pid, meta=None):
+        with self._store.condition:
+            self._store.shared.setdefault(self._name, {})[pid] = self._snapshot(pid, meta)
+            return True
+
+    def clean_shared(self, pid):
+        with self._store.condition:
+            holders = self._store.shared.get(self._name, {})
+            holders.pop(pid, None)
+            if not holders:
+                self._store.shared.pop(self._name, None)
+            self._store.condition.notify_all()
+
+    def _snapshot(self, pid, meta):
+        return Snapshot(True, pid, self._current_time_provider(), dict(meta or {}))
@@ -0,0 +1,308 @@
+# encoding: utf-8
+""" Module holds locking strategy backed by lock server """
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+
+from pylock import BaseError, _protocol, _registry
+from pylock.strategy import Base
+
+# operations held by server for as long as their timeout says
+_WAITING_OPERATIONS = frozenset(['wait', 'wait_dequeued'])
+
+# max number of requests sent ahead of their responses; server answers
+# one request at a time, so unbounded batch would fill socket buffers
+# of both sides and deadlock them
+_PIPELINE_DEPTH = 128
+
+
+class RemoteError(BaseError):
+    """Error raised when lock server rejects request"""
+    pass
+
+
+class LockClient(object):
+    """Client of :class:`pylock.server.LockServer`.
+
+    Connections are kept open and reused by consecutive requests. Server
+    releases locks of the client once all its connections are closed,
+    which happens when process exits (or crashes).
+    """
+
+    def __init__(self, address, timeout=5, pool_size=4):
+        """ Object initialization
+
+        :param address: path of Unix socket or (host, port) pair of TCP socket
+        :type address: str|tuple
+        :param timeout: max time (seconds) to wait for connection and for \
+                        each response; wait requests get their own \
+                        timeout on top of it
+        :type timeout: float
+        :param pool_size: max number of idle connections kept open
+        :type pool_size: int
+        """
+        super(LockClient, self).__init__()
+
+        self._address = address
+        self._timeout = timeout
+        self._pool_size = pool_size
+        self._guard = threading.Lock()
+        self._pid = None
+        self._session = None
+        # connection that only keeps session alive, so closing any other
+        # connection never releases locks
+        self._anchor = None
+        self._idle = []
+
+    @property
+    def address(self):
+        return self._address
+
+    def lock(self, name):
+        """Returns strategy of lock with given name
+
+        :param name: lock name
+        :type name: str
+        :rtype: pylock.strategy.remote.Remote
+        """
+        return Remote(self, name)
+
+    def call(self, operation, **arguments):
+        """ Sends single request and returns its result
+
+        :param operation: name of operation
+        :type operation: str
+        :raises pylock.strategy.remote.RemoteError: request has been rejected
+        """
+        return self.call_many([dict(arguments, op=operation)])[0]
+
+    def call_many(self, requests):
+        """ Sends requests in pipelined chunks and reads their results
+
+        :param requests: requests (dicts with operation name under "op")
+        :type requests: list
+        :returns: results in order of requests
+        :rtype: list
+        :raises pylock.strategy.remote.RemoteError: any request has been \
+                                rejected or server has not responded in time
+        """
+        responses = []
+        with self._connection() as (sock, stream):
+            for start in range(0, len(requests), _PIPELINE_DEPTH):
+                chunk = requests[start:start + _PIPELINE_DEPTH]
+                # server holds wait requests for as long as they ask
+                sock.settimeout(self._timeout + sum(
+                    request.get('timeout') or 0 for request in chunk
+                    if request['op'] in _WAITING_OPERATIONS))
+                sock.sendall(b''.join(_protocol.encode(request) for request in chunk))
+                responses.extend(self._receive(stream) for _ in chunk)
+
+        for response in responses:
+            if 'error' in response:
+                raise RemoteError(response['error'])
+        return [response['result'] for response in responses]
+
+    def create_many(self, names, pid, meta=None):
+        """ Creates records of all given locks (pipelined) unless any \
+        of them is held; records created so far are removed then
+
+        :param names: lock names
+        :type names: iterable
+        :param pid: pid to be stored
+        :type pid: int
+        :param meta: process identity to be stored
+        :type meta: dict
+        :returns: whether records have been created
+        :rtype: bool
+        """
+        names = sorted(set(names))
+        results = self.call_many([{'op': 'create', 'name': name, 'pid': pid, 'meta': meta}
+                                  for name in names])
+        if all(results):
+            return True
+        self.clean_many(name for name, created in zip(names, results) if created)
+        return False
+
+    def clean_many(self, names):
+        """ Removes records of all given locks (pipelined)
+
+        :param names: lock names
+        :type names: iterable
+        """
+        requests = [{'op': 'clean', 'name': name} for name in names]
+        if requests:
+            self.call_many(requests)
+
+    def held(self):
+        """Returns all locks held on server
+
+        :returns: snapshots keyed by lock name
+        :rtype: dict
+        """
+        return dict((name, _protocol.load_snapshot(snapshot))
+                    for name, snapshot in self.call('held').items())
+
+    def close(self):
+        """Closes all connections (releasing locks of the client)"""
+        with self._guard:
+            connections = self._idle
+            if self._anchor is not None:
+                connections.append(self._anchor)
+            self._pid = self._session = self._anchor = None
+            self._idle = []
+        for connection in connections:
+            _close(connection)
+
+    @contextmanager
+    def _connection(self):
+        with self._guard:
+            if self._pid != _registry.pid():
+                # connections and session of parent must not be used after fork
+                session = uuid.uuid4().hex
+                self._anchor = self._connect(session)
+                self._pid, self._session, self._idle = _registry.pid(), session, []
+            session = self._session
+            connection = self._idle.pop() if self._idle else None
+
+        if connection is None:
+            connection = self._connect(session)
+
+        try:
+            yield connection
+        except:
+            # connection state is unknown - it is not reused
+            _close(connection)
+            raise
+
+        with self._guard:
+            if session == self._session and len(self._idle) < self._pool_size:
+                self._idle.append(connection)
+                return
+        _close(connection)
+
+    def _connect(self, session):
+        if isinstance(self._address, tuple):
+            sock = socket.create_connection(self._address, self._timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self._timeout)
+            sock.connect(self._address)
+
+        stream = sock.makefile('rb')
+        sock.sendall(_protocol.encode({'session': session}))
+        self._receive(stream)
+        return sock, stream
+
+    @staticmethod
+    def _receive(stream):
+        try:
+            line = stream.readline()
+        except socket.timeout:
+            raise RemoteError('Lock server has not responded in time')
+        if not line:
+            raise RemoteError('Connection closed by lock server')
+        return _protocol.decode(line)
+
+
+def _close(connection):
+    sock, stream = connection
+    stream.close()
+    sock.close()
+
+
+class Remote(Base):
+    """Class that represents locking strategy backed by lock server.
+
+    Server releases lock once its owner disconnects, so liveness of lock
+    owners is not checked.
+    """
+
+    def __init__(self, client, name):
+        """ Object initialization
+
+        :param client: client of lock server
+        :type client: pylock.strategy.remote.LockClient
+        :param name: lock name
+        :type name: str
+        """
+        if not name:
+            raise ValueError('Invalid lock name: {0!r}'.format(name))
+        super(Remote, self).__init__()
+
+        self._client = client
+        self._name = name
+
+    @property
+    def key(self):
+        return (type(self).__name__, self._client.address, self._name)
+
+    @property
+    def manages_liveness(self):
+        return True
+
+    def read(self):
+        return _protocol.load_snapshot(self._call('read'))
+
+    def exists(self):
+        return self.read().exists
+
+    def read_pid(self):
+        return self.read().pid
+
+    def get_create_date(self):
+        return self.read().create_date
+
+    def fingerprint(self):
+        return self._call('fingerprint')
+
+    def create(self, pid, meta=None):
+        return self._call('create', pid=pid, meta=meta)
+
+    def clean(self):
+        self._call('clean')
+
+    def renew(self):
+        return self._call('renew')
+
+    def issue_token(self, pid):
+        return self._call('issue_token', pid=pid)
+
+    def wait(self, timeout):
+        return self._call('wait', timeout=timeout)
+
+    @property
+    def queues_waiters(self):
+        return True
+
+    def read_queue(self):
+        return tuple((ticket, _protocol.load_snapshot(snapshot))
+                     for ticket, snapshot in self._call('read_queue'))
+
+    def read_ahead(self, ticket):
+        ahead = self._call('read_ahead', ticket=ticket)
+        return ahead and (ahead[0], _protocol.load_snapshot(ahead[1]))
+
+    def enqueue(self, pid, meta=None):
+        return self._call('enqueue', pid=pid, meta=meta)
+
+
+    def dequeue(self, ticket):
+        self._call('dequeue', ticket=ticket)
+
+    def wait_dequeued(self, ticket, timeout):
+        return self._call('wait_dequeued', ticket=ticket, timeout=timeout)
+
+    def read_shared(self):
+        return tuple(_protocol.load_snapshot(snapshot)
+                     for snapshot in self._call('read_shared'))
+
+    def create_shared(self, pid, meta=None):
+        return self._call('create_shared', pid=pid, meta=meta)
+
+    def clean_shared(self, pid):
+        self._call('clean_shared', pid=pid)
+
+    def _call(self, operation, **arguments):
+        return self._client.call(operation, name=self._name, **arguments)
@@ -0,0 +1,176 @@
+# encoding: utf-8
+""" Module holds shared-memory locking strategy """
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from pylock import _registry
+from pylock.strategy import Base, Snapshot
+from pylock.strategy.file import _format, _parse
+
+DEFAULT_DIRECTORY = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# sequence number, create date, length of record
+_HEADER = struct.Struct('=QdH')
+SIZE = mmap.PAGESIZE
+# last fencing token is kept at the end of segment
+_TOKEN = struct.Struct('=Q')
+_TOKEN_OFFSET = SIZE - _TOKEN.size
+CAPACITY = _TOKEN_OFFSET - _HEADER.size
+
+
+class SharedMemory(Base):
+    """Class that represents locking strategy keeping record in memory
+    shared by processes of single host.
+
+    Record lives in a memory-mapped file (tmpfs by default), so lock
+    operations do not resolve paths nor write files. Python offers no
+    atomic compare-and-swap on shared memory, so each operation holds
+    short ``fcntl`` lock over the record instead.
+    """
+
+    def __init__(self, name, directory=DEFAULT_DIRECTORY, current_time_provider=time.time):
+        """ Object initialization
+
+        :param name: lock name
+        :type name: str
+        :param directory: directory holding memory-mapped files \
+                            (/dev/shm when available)
+        :type directory: str
+        :param current_time_provider: function returning current time
+        :type current_time_provider: callable
+        """
+        if fcntl is None:
+            raise NotImplementedError('SharedMemory strategy requires fcntl')
+        if not name or os.sep in name:
+            raise ValueError('Invalid lock name: {0!r}'.format(name))
+        super(SharedMemory, self).__init__()
+
+        self._path = os.path.join(directory, 'pylock-' + name)
+        self._current_time_provider = current_time_provider
+
+    @property
+    def key(self):
+        return (type(self).__name__, os.path.abspath(self._path))
+
+    def read(self):
+        segment = _segment(self._path)
+        with segment.locked(fcntl.LOCK_SH):
+            _, create_date, length = _HEADER.unpack_from(segment.map)
+            data = segment.map[_HEADER.size:_HEADER.size + length]
+        if not length:
+            return Snapshot()
+        return _parse(data.decode('utf-8'), create_date)
+
+    def exists(self):
+        return self.read().exists
+
+    def read_pid(self):
+        return self.read().pid
+
+    def get_create_date(self):
+        return self.read().create_date
+
+    def fingerprint(self):
+        """ Returns sequence number, which changes whenever record is replaced
+
+        :rtype: int
+        """
+        segment = _segment(self._path)
+        with segment.locked(fcntl.LOCK_SH):
+            return _HEADER.unpack_from(segment.map)[0]
+
+    def create(self, pid, meta=None):
+        """ Store record of given pid unless other record exists
+
+        :param pid: pid to be stored
+        :type pid: int
+        :param meta: process identity to be stored
+        :type meta: dict
+        :returns: whether record has been created
+        :rtype: bool
+        """
+        data = _format(pid, meta).encode('utf-8')
+        if len(data) > CAPACITY:
+            raise ValueError('Lock record exceeds {0} bytes'.format(CAPACITY))
+
+        segment = _segment(self._path)
+        with segment.locked(fcntl.LOCK_EX):
+            sequence, _, length = _HEADER.unpack_from(segment.map)
+            if length:
+                return False
+            segment.map[_HEADER.size:_HEADER.size + len(data)] = data
+            _HEADER.pack_into(segment.map, 0, sequence + 1,
+                              self._current_time_provider(), len(data))
+            return True
+
+    def clean(self):
+        segment = _segment(self._path)
+        with segment.locked(fcntl.LOCK_EX):
+            sequence = _HEADER.unpack_from(segment.map)[0]
+            _HEADER.pack_into(segment.map, 0, sequence + 1, 0, 0)
+
+    def renew(self):
+        segment = _segment(self._path)
+        with segment.locked(fcntl.LOCK_EX):
+            sequence, _, length = _HEADER.unpack_from(segment.map)
+            if not length:
+                return False
+            _HEADER.pack_into(segment.map, 0, sequence, self._current_time_provider(), length)
+            return True
+
+    def issue_token(self, pid):
+        segment = _segment(self._path)
+        with segment.locked(fcntl.LOCK_EX):
+            sequence, create_date, length = _HEADER.unpack_from(segment.map)
+            data = segment.map[_HEADER.size:_HEADER.size + length]
+            snapshot = _parse(data.decode('utf-8'), create_date) if length else Snapshot()
+            if snapshot.pid != pid:
+                return None
+
+            token = _TOKEN.unpack_from(segment.map, _TOKEN_OFFSET)[0] + 1
+            data = _format(pid, dict(snapshot.meta, token=str(token))).encode('utf-8')
+            if len(data) > CAPACITY:
+                raise ValueError('Lock record exceeds {0} bytes'.format(CAPACITY))
+            _TOKEN.pack_into(segment.map, _TOKEN_OFFSET, token)
+            # record is updated in place, so its fingerprint stays the same
+            segment.map[_HEADER.size:_HEADER.size + len(data)] = data
+            _HEADER.pack_into(segment.map, 0, sequence, create_date, len(data))
+            return token
+
+
+class _Segment(object):
+    """Memory-mapped file shared by all strategies of current process"""
+
+    def __init__(self, path):
+        super(_Segment, self).__init__()
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        # growing file to the same size twice is harmless
+        if os.fstat(self._fd).st_size < SIZE:
+            os.ftruncate(self._fd, SIZE)
+        self.map = mmap.mmap(self._fd, SIZE)
+        # fcntl locks are held by process - threads have to be serialized
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def locked(self, operation):
+        with self._guard:
+            fcntl.lockf(self._fd, operation, SIZE)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, SIZE)
+
+
+def _segment(path):
+    return _registry.per_process((_Segment, path), lambda: _Segment(path))
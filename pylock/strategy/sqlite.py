@@ -0,0 +1,341 @@
+# encoding: utf-8
+""" Module holds locking strategy keeping lock records in SQLite database """
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from pylock import _registry
+from pylock.strategy import Base, Snapshot
+
+_SCHEMA = (
+    # id changes whenever record is replaced, so it serves as fingerprint
+    'CREATE TABLE IF NOT EXISTS locks ('
+    ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+    ' name TEXT NOT NULL UNIQUE,'
+    ' pid INTEGER NOT NULL,'
+    ' create_date REAL NOT NULL,'
+    ' meta TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS locks_pid ON locks (pid)',
+    'CREATE INDEX IF NOT EXISTS locks_create_date ON locks (create_date)',
+    'CREATE TABLE IF NOT EXISTS shared ('
+    ' name TEXT NOT NULL,'
+    ' pid INTEGER NOT NULL,'
+    ' create_date REAL NOT NULL,'
+    ' meta TEXT NOT NULL,'
+    ' PRIMARY KEY (name, pid))',
+    # waiters of fair locks, served in order of ids
+    'CREATE TABLE IF NOT EXISTS queue ('
+    ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+    ' name TEXT NOT NULL,'
+    ' pid INTEGER NOT NULL,'
+    ' create_date REAL NOT NULL,'
+    ' meta TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS queue_name ON queue (name, id)',
+    # fencing tokens outlive lock records
+    'CREATE TABLE IF NOT EXISTS tokens ('
+    ' name TEXT PRIMARY KEY,'
+    ' value INTEGER NOT NULL)',
+)
+
+_COLUMNS = 'name, pid, create_date, meta'
+
+
+class LockDatabase(object):
+    """Named locks kept as rows of SQLite database (in WAL mode).
+
+    Each operation is a single statement or transaction, so creating
+    a lock is one conditional insert. Many locks may be created at once
+    (all or none of them) and held locks may be queried by owner or age.
+
+    Every thread keeps its own connection (new one after fork).
+    """
+
+    def __init__(self, path, timeout=5, current_time_provider=time.time):
+        """ Object initialization
+
+        :param path: path to database file; created when missing
+        :type path: str
+        :param timeout: max time (seconds) to wait for database \
+                        locked by other writer
+        :type timeout: float
+        :param current_time_provider: function returning current time
+        :type current_time_provider: callable
+        """
+        super(LockDatabase, self).__init__()
+
+        self._path = os.path.abspath(path)
+        self._timeout = timeout
+        self._current_time_provider = current_time_provider
+        self._local = threading.local()
+
+    @property
+    def path(self):
+        return self._path
+
+    def lock(self, name):
+        """Returns strategy of lock with given name
+
+        :param name: lock name
+        :type name: str
+        :rtype: pylock.strategy.sqlite.DatabaseRecord
+        """
+        return DatabaseRecord(self, name)
+
+    def create_many(self, names, pid, meta=None, is_stale=None):
+        """ Stores records of given pid for all given locks in single \
+        transaction, unless any of them is held
+
+        Existing records are evaluated inside the transaction, so none \
+        of them is replaced by other writer in the meantime. Stale ones \
+        are taken over, e.g. with \
+        ``is_stale=lambda snapshot: lock.get_record_state(snapshot).should_clean``.
+
+        :param names: lock names
+        :type names: iterable
+        :param pid: pid to be stored
+        :type pid: int
+        :param meta: process identity to be stored
+        :type meta: dict
+        :param is_stale: callable telling whether snapshot of existing \
+                        record may be taken over; called while database \
+                        is locked for writing, so it should be quick; \
+                        existing records are never taken over when omitted
+        :type is_stale: callable
+        :returns: whether records have been created
+        :rtype: bool
+        """
+        create_date = self._current_time_provider()
+        meta = json.dumps(meta or {}, sort_keys=True)
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            for name in sorted(set(names)):
+                row = connection.execute(
+                    'SELECT id, {0} FROM locks WHERE name = ?'.format(_COLUMNS),
+                    (name,)).fetchone()
+                if row is not None:
+                    if is_stale is None or not is_stale(_snapshot(row[1:])):
+                        connection.execute('ROLLBACK')
+                        return False
+                    connection.execute('DELETE FROM locks WHERE id = ?', (row[0],))
+                connection.execute(
+                    'INSERT INTO locks (name, pid, create_date, meta)'
+                    ' VALUES (?, ?, ?, ?)', (name, pid, create_date, meta))
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return True
+
+    def clean_many(self, names):
+        """ Removes records of all given locks in single transaction
+
+        :param names: lock names
+        :type names: iterable
+        """
+        with self._transaction() as connection:
+            connection.executemany('DELETE FROM locks WHERE name = ?',
+                                   [(name,) for name in set(names)])
+
+    def held(self):
+        """Returns all held locks
+
+        :returns: snapshots keyed by lock name
+        :rtype: dict
+        """
+        return self._query('SELECT {0} FROM locks'.format(_COLUMNS))
+
+    def held_by(self, pid):
+        """Returns locks held by given pid
+
+        :type pid: int
+        :returns: snapshots keyed by lock name
+        :rtype: dict
+        """
+        return self._query('SELECT {0} FROM locks WHERE pid = ?'.format(_COLUMNS), (pid,))
+
+    def older_than(self, create_date):
+        """Returns locks created (or renewed) before given time
+
+        :param create_date: timestamp
+        :type create_date: float
+        :returns: snapshots keyed by lock name
+        :rtype: dict
+        """
+        return self._query('SELECT {0} FROM locks WHERE create_date < ?'.format(_COLUMNS),
+                           (create_date,))
+
+    def _query(self, sql, parameters=()):
+        return dict((row[0], _snapshot(row)) for row in
+                    self._connection.execute(sql, parameters))
+
+    @property
+    def _connection(self):
+        pid = _registry.pid()
+        if getattr(self._local, 'pid', None) != pid:
+            # connection must not be used across fork
+            self._local.connection = self._connect()
+            self._local.pid = pid
+        return self._local.connection
+
+    def _connect(self):
+        connection = sqlite3.connect(self._path, timeout=self._timeout,
+                                     isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        with self._transaction(connection):
+            for statement in _SCHEMA:
+                connection.execute(statement)
+        return connection
+
+    @contextmanager
+    def _transaction(self, connection=None):
+        connection = connection or self._connection
+        # write lock is taken upfront, so transactions never deadlock on upgrade
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+
+class DatabaseRecord(Base):
+    """Class that represents locking strategy backed by row
+    of :class:`LockDatabase`"""
+
+    def __init__(self, database, name):
+        """ Object initialization
+
+        :param database: database holding the lock
+        :type database: pylock.strategy.sqlite.LockDatabase
+        :param name: lock name
+        :type name: str
+        """
+        if not name:
+            raise ValueError('Invalid lock name: {0!r}'.format(name))
+        super(DatabaseRecord, self).__init__()
+
+        self._database = database
+        self._name = name
+
+    @property
+    def key(self):
+        return (type(self).__name__, self._database.path, self._name)
+
+    def read(self):
+        row = self._execute('SELECT {0} FROM locks WHERE name = ?'.format(_COLUMNS),
+                            (self._name,)).fetchone()
+        if row is None:
+            return Snapshot()
+        return _snapshot(row)
+
+    def exists(self):
+        return self.read().exists
+
+    def read_pid(self):
+        return self.read().pid
+
+    def get_create_date(self):
+        return self.read().create_date
+
+    def fingerprint(self):
+        row = self._execute('SELECT id FROM locks WHERE name = ?', (self._name,)).fetchone()
+        return row and row[0]
+
+    def create(self, pid, meta=None):
+        """ Store record of given pid unless lock is held
+
+        :param pid: pid to be stored
+        :type pid: int
+        :param meta: process identity to be stored
+        :type meta: dict
+        :returns: whether record has been created
+        :rtype: bool
+        """
+        cursor = self._execute(
+            'INSERT OR IGNORE INTO locks (name, pid, create_date, meta) VALUES (?, ?, ?, ?)',
+            (self._name, pid, self._database._current_time_provider(),
+             json.dumps(meta or {}, sort_keys=True)))
+        return cursor.rowcount == 1
+
+    def clean(self):
+        self._execute('DELETE FROM locks WHERE name = ?', (self._name,))
+
+    def clean_stale(self, fingerprint):
+        self._execute('DELETE FROM locks WHERE id = ?', (fingerprint,))
+
+    def renew(self):
+        cursor = self._execute('UPDATE locks SET create_date = ? WHERE name = ?',
+                               (self._database._current_time_provider(), self._name))
+        return cursor.rowcount == 1
+
+    def issue_token(self, pid):
+        with self._database._transaction() as connection:
+            row = connection.execute('SELECT meta FROM locks WHERE name = ? AND pid = ?',
+                                     (self._name, pid)).fetchone()
+            if row is None:
+                return None
+            connection.execute('INSERT OR IGNORE INTO tokens (name, value) VALUES (?, 0)',
+                               (self._name,))
+            connection.execute('UPDATE tokens SET value = value + 1 WHERE name = ?',
+                               (self._name,))
+            token = connection.execute('SELECT value FROM tokens WHERE name = ?',
+                                       (self._name,)).fetchone()[0]
+            meta = dict(json.loads(row[0]), token=str(token))
+            connection.execute('UPDATE locks SET meta = ? WHERE name = ?',
+                               (json.dumps(meta, sort_keys=True), self._name))
+            return token
+
+    @property
+    def queues_waiters(self):
+        return True
+
+    def read_queue(self):
+        return tuple((row[0], _snapshot(row[1:])) for row in self._execute(
+            'SELECT id, {0} FROM queue WHERE name = ? ORDER BY id'.format(_COLUMNS),
+            (self._name,)))
+
+    def read_ahead(self, ticket):
+        sql = 'SELECT id, {0} FROM queue WHERE name = ?'.format(_COLUMNS)
+        parameters = (self._name,)
+        if ticket is not None:
+            sql += ' AND id < ?'
+            parameters += (ticket,)
+        row = self._execute(sql + ' ORDER BY id DESC LIMIT 1', parameters).fetchone()
+        return row and (row[0], _snapshot(row[1:]))
+
+    def enqueue(self, pid, meta=None):
+        return self._execute(
+            'INSERT INTO queue (name, pid, create_date, meta) VALUES (?, ?, ?, ?)',
+            (self._name, pid, self._database._current_time_provider(),
+             json.dumps(meta or {}, sort_keys=True))).lastrowid
+
+    def dequeue(self, ticket):
+        self._execute('DELETE FROM queue WHERE id = ?', (ticket,))
+
+    def read_shared(self):
+        return tuple(_snapshot(row) for row in self._execute(
+            'SELECT {0} FROM shared WHERE name = ?'.format(_COLUMNS), (self._name,)))
+
+    def create_shared(self, pid, meta=None):
+        self._execute(
+            'INSERT OR REPLACE INTO shared (name, pid, create_date, meta) VALUES (?, ?, ?, ?)',
+            (self._name, pid, self._database._current_time_provider(),
+             json.dumps(meta or {}, sort_keys=True)))
+        return True
+
+    def clean_shared(self, pid):
+        self._execute('DELETE FROM shared WHERE name = ? AND pid = ?', (self._name, pid))
+
+    def _execute(self, sql, parameters):
+        return self._database._connection.execute(sql, parameters)
+
+
+def _snapshot(row):
+    _, pid, create_date, meta = row
+    return Snapshot(True, pid, create_date, json.loads(meta))
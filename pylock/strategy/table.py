@@ -0,0 +1,456 @@
+# encoding: utf-8
+""" Module holds locking strategy keeping many locks in single file """
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from pylock import BaseError, _registry
+from pylock.strategy import Base, Snapshot
+from pylock.strategy.file import _format, _parse
+
+# magic, number of slots, record size
+_HEADER = struct.Struct('=8sII')
+_HEADER_SIZE = 64
+# last fencing token (shared by all locks of table) follows header
+_TOKEN = struct.Struct('=Q')
+# number of slot assignments made so far and number of used slots
+# follow the token
+_COUNTERS = struct.Struct('=QQ')
+_COUNTERS_OFFSET = _HEADER.size + _TOKEN.size
+# share of used slots at which all released locks are reclaimed,
+# so chains of colliding names stay short
+_MAX_LOAD = 0.75
+_MAGIC = b'PYLOCKT1'
+
+# slot state, name length, data length, sequence number, create date
+_RECORD = struct.Struct('=BxHHxxQd')
+_EMPTY, _ASSIGNED = 0, 1
+
+NAME_SIZE = 64
+# threads of single process are serialized by striped locks
+_STRIPES = 64
+
+
+class _NoGuard(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class TableFullError(BaseError):
+    """Error raised when lock table has no free slot for new lock"""
+
+    def __init__(self):
+        super(TableFullError, self).__init__('Lock table is full')
+
+
+class LockTable(object):
+    """Many named locks kept as fixed-size records of single
+    memory-mapped file.
+
+    Lock name is hashed to a slot (colliding names take following slots).
+    Each record holds owner PID, its identity and creation date, and is
+    guarded by ``fcntl`` lock over its byte range only, so locks do not
+    contend with each other.
+
+    Slot stays assigned to its lock once released, so acquiring the lock
+    again takes record lookup and record lock only. Slots are assigned
+    under lock of whole table; slots of released locks met on the way
+    are reclaimed then, so chains of colliding names do not grow.
+    """
+
+    def __init__(self, path, slots=4096, record_size=256, current_time_provider=time.time):
+        """ Object initialization
+
+        :param path: path to table file; created when missing
+        :type path: str
+        :param slots: number of records (ignored when table exists)
+        :type slots: int
+        :param record_size: size of single record in bytes \
+                            (ignored when table exists)
+        :type record_size: int
+        :param current_time_provider: function returning current time
+        :type current_time_provider: callable
+        """
+        if fcntl is None:
+            raise NotImplementedError('LockTable requires fcntl')
+        if record_size < _RECORD.size + NAME_SIZE + 16:
+            raise ValueError('Record size is too small')
+        super(LockTable, self).__init__()
+
+        self._path = os.path.abspath(path)
+        self._geometry = (slots, record_size)
+        self._current_time_provider = current_time_provider
+
+    def lock(self, name):
+        """Returns strategy of lock with given name
+
+        :param name: lock name
+        :type name: str
+        :rtype: pylock.strategy.table.TableRecord
+        """
+        return TableRecord(self, name)
+
+    def held(self):
+        """Returns all held locks, read at once
+
+        :returns: snapshots keyed by lock name
+        :rtype: dict
+        """
+        table = self._file
+        locks = {}
+        with table.all_locked(fcntl.LOCK_SH):
+            for slot in range(table.slots):
+                name, snapshot = table.read_record(slot)
+                if snapshot is not None and snapshot.exists:
+                    locks[name.decode('utf-8')] = snapshot
+        return locks
+
+    @property
+    def _file(self):
+        return _file(self._path, *self._geometry)
+
+
+class TableRecord(Base):
+    """Class that represents locking strategy backed by record
+    of :class:`LockTable`"""
+
+    def __init__(self, table, name):
+        """ Object initialization
+
+        :param table: table holding the lock
+        :type table: pylock.strategy.table.LockTable
+        :param name: lock name
+        :type name: str
+        """
+        encoded = name.encode('utf-8')
+        if not encoded or len(encoded) > NAME_SIZE:
+            raise ValueError('Invalid lock name: {0!r}'.format(name))
+        super(TableRecord, self).__init__()
+
+        self._table = table
+        self._name = encoded
+        self._slot = None
+
+    @property
+    def key(self):
+        return (type(self).__name__, self._table._path, self._name)
+
+    def read(self):
+        with self._record(fcntl.LOCK_SH) as (table, slot):
+            if slot is None:
+                return Snapshot()
+            return table.read_record(slot)[1]
+
+    def exists(self):
+        return self.read().exists
+
+    def read_pid(self):
+        return self.read().pid
+
+    def get_create_date(self):
+        return self.read().create_date
+
+    def fingerprint(self):
+        """ Returns sequence number of record, which changes whenever
+        record is replaced; numbers are unique within the table
+
+        :rtype: int
+        """
+        with self._record(fcntl.LOCK_SH) as (table, slot):
+            if slot is None:
+                return None
+            return table.header_of(slot)[3]
+
+    def create(self, pid, meta=None):
+        """ Store record of given pid unless lock is held
+
+        :param pid: pid to be stored
+        :type pid: int
+        :param meta: process identity to be stored
+        :type meta: dict
+        :returns: whether record has been created
+        :rtype: bool
+        :raises pylock.strategy.table.TableFullError: no slot is left
+        """
+        table = self._table._file
+        data = _format(pid, meta).encode('utf-8')
+        if len(data) > table.data_size:
+            raise ValueError('Lock record exceeds {0} bytes'.format(table.data_size))
+
+        while True:
+            with self._record(fcntl.LOCK_EX) as (table, slot):
+                if slot is not None:
+                    _, _, length, sequence, _ = table.header_of(slot)
+                    if length:
+                        return False
+                    table.write_record(slot, _ASSIGNED, self._name, data, sequence + 1,
+                                       self._table._current_time_provider())
+                    return True
+            # slot is assigned outside of record lock, so it is checked again
+            self._slot = table.assign(self._name)
+
+    def clean(self):
+        with self._record(fcntl.LOCK_EX) as (table, slot):
+            if slot is not None:
+                # slot is kept for the lock, until it is reclaimed
+                sequence = table.header_of(slot)[3]
+                table.write_record(slot, _ASSIGNED, self._name, b'', sequence + 1, 0)
+
+    def renew(self):
+        with self._record(fcntl.LOCK_EX) as (table, slot):
+            if slot is None:
+                return False
+            _, _, length, sequence, _ = table.header_of(slot)
+            if not length:
+                return False
+            _RECORD.pack_into(table.map, table.offset(slot), _ASSIGNED, len(self._name),
+                              length, sequence, self._table._current_time_provider())
+            return True
+
+    def issue_token(self, pid):
+        """ Issues next value of counter shared by all locks of table
+
+        :param pid: pid of lock owner
+        :type pid: int
+        :returns: token (None when record is not held by given pid)
+        :rtype: int
+        """
+        table = self._table._file
+        # header is always locked before records
+        with table.locked(fcntl.LOCK_EX, _HEADER_SIZE, 0, table.header_guard):
+            with self._record(fcntl.LOCK_EX, settled=True) as (table, slot):
+                snapshot = table.read_record(slot)[1] if slot is not None else None
+                if snapshot is None or snapshot.pid != pid:
+                    return None
+
+                token = table.next_token()
+                data = _format(pid, dict(snapshot.meta, token=str(token))).encode('utf-8')
+                if len(data) > table.data_size:
+                    raise ValueError('Lock record exceeds {0} bytes'.format(table.data_size))
+                table.set_token(token)
+                sequence = table.header_of(slot)[3]
+                # record is updated in place, so its fingerprint stays the same
+                table.write_record(slot, _ASSIGNED, self._name, data, sequence,
+                                   snapshot.create_date)
+                return token
+
+    @contextmanager
+    def _record(self, operation, settled=False):
+        """Locks record of the lock; yields table and slot of record
+        (None when lock has no record)
+
+        Caller holding lock of table header passes `settled`, as no record
+        can be moved then.
+        """
+        table = self._table._file
+        slot = self._slot
+        if slot is None or slot >= table.slots:
+            slot = table.find(self._name, settled)
+        while slot is not None:
+            with table.record_locked(slot, operation):
+                if table.is_assigned(slot, self._name):
+                    # slot usually stays the same, so it is not looked up again
+                    self._slot = slot
+                    yield table, slot
+                    return
+            slot = table.find(self._name, settled)
+        yield table, None
+
+
+class _TableFile(object):
+    """Memory-mapped table file shared by all strategies of current process"""
+
+    def __init__(self, path, slots, record_size):
+        super(_TableFile, self).__init__()
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.header_guard = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(_STRIPES)]
+
+        with self.locked(fcntl.LOCK_EX, _HEADER_SIZE, 0, self.header_guard):
+            header = os.read(self._fd, _HEADER.size)
+            if len(header) < _HEADER.size:
+                os.ftruncate(self._fd, _HEADER_SIZE + slots * record_size)
+                os.write(self._fd, _HEADER.pack(_MAGIC, slots, record_size))
+            else:
+                magic, slots, record_size = _HEADER.unpack(header)
+                if magic != _MAGIC:
+                    raise ValueError('{0} is not a lock table'.format(path))
+
+        self.slots = slots
+        self.record_size = record_size
+        self.data_size = record_size - _RECORD.size - NAME_SIZE
+        self.map = mmap.mmap(self._fd, _HEADER_SIZE + slots * record_size)
+
+    @contextmanager
+    def locked(self, operation, length, start, guard):
+        with guard:
+            fcntl.lockf(self._fd, operation, length, start)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+    @contextmanager
+    def all_locked(self, operation):
+        # fcntl locks of single process merge, so no thread of current
+        # process may hold record lock while whole file is locked
+        with self.header_guard:
+            for stripe in self._stripes:
+                stripe.acquire()
+            try:
+                with self.locked(operation, 0, 0, _NoGuard()):
+                    yield
+            finally:
+                for stripe in self._stripes:
+                    stripe.release()
+
+    def record_locked(self, slot, operation):
+        return self.locked(operation, self.record_size, self.offset(slot),
+                           self._stripes[slot % _STRIPES])
+
+    def next_token(self):
+        """Returns token following the last one (header lock has to be held)"""
+        return _TOKEN.unpack_from(self.map, _HEADER.size)[0] + 1
+
+    def set_token(self, token):
+        _TOKEN.pack_into(self.map, _HEADER.size, token)
+
+    def offset(self, slot):
+        return _HEADER_SIZE + slot * self.record_size
+
+    def header_of(self, slot):
+        return _RECORD.unpack_from(self.map, self.offset(slot))
+
+    def name_of(self, slot):
+        start = self.offset(slot) + _RECORD.size
+        return self.map[start:start + self.header_of(slot)[1]]
+
+    def is_assigned(self, slot, name):
+        return self.header_of(slot)[0] == _ASSIGNED and self.name_of(slot) == name
+
+    def read_record(self, slot):
+        """Returns name and snapshot of record (None for unused slot)"""
+        state, name_length, length, _, create_date = self.header_of(slot)
+        if state != _ASSIGNED:
+            return None, None
+        start = self.offset(slot) + _RECORD.size
+        name = self.map[start:start + name_length]
+        if not length:
+            return name, Snapshot()
+        start += NAME_SIZE
+        return name, _parse(self.map[start:start + length].decode('utf-8'), create_date)
+
+    def write_record(self, slot, state, name, data, sequence, create_date):
+        start = self.offset(slot) + _RECORD.size
+        self.map[start:start + len(name)] = name
+        self.map[start + NAME_SIZE:start + NAME_SIZE + len(data)] = data
+        _RECORD.pack_into(self.map, self.offset(slot), state, len(name), len(data),
+                          sequence, create_date)
+
+    def probe(self, name):
+        """Yields slots given name might be kept in"""
+        first = zlib.crc32(name) % self.slots
+        for step in range(self.slots):
+            yield (first + step) % self.slots
+
+    def find(self, name, settled=False):
+        """Returns slot assigned to given name, None when there is none
+
+        :param settled: whether caller holds lock of table header
+        :type settled: bool
+        """
+        slot = self._find(name)
+        if slot is None and not settled:
+            # record might have been moved past the probe by reclamation,
+            # which holds whole table (header included)
+            with self.locked(fcntl.LOCK_SH, _HEADER_SIZE, 0, self.header_guard):
+                slot = self._find(name)
+        return slot
+
+    def _find(self, name):
+        for slot in self.probe(name):
+            with self.record_locked(slot, fcntl.LOCK_SH):
+                if self.header_of(slot)[0] == _EMPTY:
+                    return None
+                if self.name_of(slot) == name:
+                    return slot
+        return None
+
+    def assign(self, name):
+        """Assigns slot to given name
+
+        Slots are assigned under lock of whole table, so single name
+        never takes two slots and records can be moved. Records of released
+        locks met on the way are removed, records following them are
+        shifted back (no tombstones are left).
+        """
+        with self.all_locked(fcntl.LOCK_EX):
+            if self._counters()[1] >= self.slots * _MAX_LOAD:
+                for slot in range(self.slots):
+                    while self._is_released(slot, name):
+                        self._remove(slot)
+
+            slot = zlib.crc32(name) % self.slots
+            for _ in range(self.slots):
+                while self._is_released(slot, name):
+                    self._remove(slot)
+                if self.header_of(slot)[0] == _EMPTY:
+                    assignments, used = self._counters()
+                    self._set_counters(assignments + 1, used + 1)
+                    # sequence numbers of distinct assignments never collide
+                    self.write_record(slot, _ASSIGNED, name, b'', (assignments + 1) << 32, 0)
+                    return slot
+                if self.name_of(slot) == name:
+                    return slot
+                slot = (slot + 1) % self.slots
+            raise TableFullError()
+
+    def _is_released(self, slot, name):
+        """Whether slot is assigned to other lock, which is not held"""
+        state, _, length, _, _ = self.header_of(slot)
+        return state != _EMPTY and not length and self.name_of(slot) != name
+
+    def _counters(self):
+        return _COUNTERS.unpack_from(self.map, _COUNTERS_OFFSET)
+
+    def _set_counters(self, assignments, used):
+        _COUNTERS.pack_into(self.map, _COUNTERS_OFFSET, assignments, max(used, 0))
+
+    def _remove(self, slot):
+        """Empties given slot, moving back records of following slots
+        that would not be found otherwise (whole table has to be locked)"""
+        assignments, used = self._counters()
+        self._set_counters(assignments, used - 1)
+        hole = slot
+        for _ in range(self.slots - 1):
+            slot = (slot + 1) % self.slots
+            if self.header_of(slot)[0] == _EMPTY:
+                break
+            home = zlib.crc32(self.name_of(slot)) % self.slots
+            # record stays when its home lies cyclically within (hole, slot]
+            if (home - hole - 1) % self.slots < (slot - hole) % self.slots:
+                continue
+            start = self.offset(slot)
+            self.map[self.offset(hole):self.offset(hole) + self.record_size] = \
+                self.map[start:start + self.record_size]
+            hole = slot
+        _RECORD.pack_into(self.map, self.offset(hole), _EMPTY, 0, 0, 0, 0)
+
+
+def _file(path, slots, record_size):
+    return _registry.per_process((_TableFile, path),
+                                 lambda: _TableFile(path, slots, record_size))
@@ -0,0 +1,156 @@
+# encoding: utf-8
+"""Module holds garbage collector of lockfiles left by crashed processes"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+from logging_utils import getLogger
+
+from . import Lock
+from .pid_owner_client import CachingClient, default_client
+from .states import LockState
+from .strategy.file import File
+
+logger = getLogger(__name__)
+
+_SHARED_SUFFIX = '.shared'
+
+
+class SweepReport(namedtuple('SweepReport', 'states removed')):
+    """Result of single sweep
+
+    :param states: state of each lock record found, keyed by lock name
+    :type states: dict
+    :param removed: names of locks whose records have been removed
+    :type removed: list
+    """
+    __slots__ = ()
+
+
+class Sweeper(object):
+    """Removes orphaned lockfiles from a lock directory.
+
+    All lockfiles are read first and liveness of their owners is checked
+    in a single batch, so contenders do not have to clean up after
+    crashed processes on their own.
+    """
+
+    def __init__(self, directory, suffix='.pid', max_age=None, kill=False,
+                 pid_owner_client=None, current_time_provider=time.time):
+        """ Object initialization
+
+        :param directory: directory holding lockfiles
+        :type directory: str
+        :param suffix: lockfile name suffix
+        :type suffix: str
+        :param max_age: see :class:`pylock.Lock`
+        :type max_age: int
+        :param kill: whether owners of outdated locks should be terminated \
+                        and their locks removed; outdated locks are only \
+                        reported otherwise
+        :type kill: bool
+        :param pid_owner_client: client checking whether lock owner is alive
+        :type pid_owner_client: pylock.pid_owner_client.Client
+        """
+        super(Sweeper, self).__init__()
+
+        self._directory = directory
+        self._suffix = suffix
+        self._max_age = max_age
+        self._kill = kill
+        self._pid_owner_client = pid_owner_client or default_client()
+        self._current_time_provider = current_time_provider
+
+    def sweep(self):
+        """ Evaluates every lock in directory and removes orphaned ones
+
+        :rtype: pylock.sweeper.SweepReport
+        """
+        records = [self._read(name) for name in self._names()]
+        records = [record for record in records if record is not None]
+
+        # liveness of all owners is checked at once and remembered for the sweep
+        client = CachingClient(self._pid_owner_client, ttl=float('inf'),
+                               current_time_provider=self._current_time_provider)
+        snapshots = [snapshot for _, _, _, snapshot, readers in records
+                     for snapshot in (snapshot,) + readers
+                     if snapshot.pid is not None]
+        client.is_alive_many([snapshot.pid for snapshot in snapshots],
+                             dict((snapshot.pid, snapshot.meta) for snapshot in snapshots))
+
+        states = {}
+        removed = []
+        for name, strategy, fingerprint, snapshot, readers in records:
+            lock = Lock(strategy, max_age=self._max_age, pid_owner_client=client,
+                        current_time_provider=self._current_time_provider)
+            with logger.context(lock=name):
+                if snapshot.exists:
+                    states[name] = lock.get_record_state(snapshot)
+                    if self._remove(lock, strategy, fingerprint, snapshot, states[name]):
+                        removed.append(name)
+
+                for reader in readers:
+                    if not client.is_alive(reader.pid, reader.meta):
+                        with logger.context(pid=reader.pid):
+                            logger.info('removing orphaned shared holder')
+                        strategy.clean_shared(reader.pid)
+        return SweepReport(states, removed)
+
+    def run(self, interval, stop=None, callback=None):
+        """ Sweeps directory periodically until stopped
+
+        :param interval: delay (seconds) between consecutive sweeps
+        :type interval: float
+        :param stop: event stopping the loop once set
+        :type stop: threading.Event
+        :param callback: function called with report of each sweep
+        :type callback: callable
+        """
+        stop = stop or threading.Event()
+        while True:
+            try:
+                report = self.sweep()
+            except Exception:
+                logger.exception('could not sweep lock directory')
+            else:
+                if callback is not None:
+                    callback(report)
+            if stop.wait(interval):
+                return
+
+    def _names(self):
+        names = set()
+        shared_suffix = self._suffix + _SHARED_SUFFIX
+        for entry in os.listdir(self._directory):
+            if entry.endswith(self._suffix):
+                names.add(entry[:-len(self._suffix)])
+            elif entry.endswith(shared_suffix):
+                names.add(entry[:-len(shared_suffix)])
+        return sorted(names)
+
+    def _read(self, name):
+        path = os.path.join(self._directory, name + self._suffix)
+        if os.path.exists(path) and not os.path.isfile(path):
+            return None
+        strategy = File(path)
+        fingerprint = strategy.fingerprint()
+        snapshot = strategy.read()
+        return name, strategy, fingerprint, snapshot, tuple(strategy.read_shared())
+
+    def _remove(self, lock, strategy, fingerprint, snapshot, state):
+        if state is not LockState.ORPHANED:
+            # lock owner is still running
+            if not (state.should_clean and self._kill):
+                return False
+            if not lock.kill_owner(snapshot):
+                return False
+
+        if strategy.fingerprint() != fingerprint:
+            # lock has been taken over in the meantime
+            return False
+
+        with logger.context(state=state.name):
+            logger.info('removing lock')
+        strategy.clean()
+        return True
@@ -29,6 +29,9 @@ setup(
     packages = ['pylock', 'pylock.strategy', 'pylock.strategy.file'],
     license = "MIT",
     package_dir = {'pylock': 'pylock'},
+    entry_points = {
+        'console_scripts': ['pylock = pylock.cli:main'],
+    },
     install_requires = [],
     dependency_links = [],
     zip_safe = True,
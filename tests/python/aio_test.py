@@ -0,0 +1,155 @@
+# encoding: utf-8
+""" Tests for pylock.aio module """
+from pylock._compat import mock
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pylock import Lock, AlreadyLockedError, CouldNotCreateLockError
+from pylock.aio import AsyncLock
+from pylock.strategy import Base, Snapshot
+from pylock.strategy.file import File
+from pylock.states import LockState
+from pylock.pid_owner_client import Client
+from pylock.retry import Fixed
+
+
+class AsyncLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.strategy = mock.MagicMock(Base)
+        self.strategy.is_valid.return_value = True
+        self.strategy.manages_liveness = False
+        self.strategy.create.return_value = True
+        self.strategy.read.return_value = Snapshot()
+        self.delay_provider = mock.MagicMock()
+        self.pid_owner_client = mock.MagicMock(spec=Client, **{'identify.return_value': {}})
+        self.current_time_provider = mock.MagicMock(return_value=123)
+        self.lock = Lock(self.strategy, delay_provider=self.delay_provider,
+                         current_time_provider=self.current_time_provider,
+                         pid_owner_client=self.pid_owner_client,
+                         retry_policy=Fixed(0.001, tries=3))
+        self.async_lock = AsyncLock(self.lock)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_acquire_obtains_lock(self):
+        self.assertTrue(self.run_async(self.async_lock.acquire()).is_owner)
+        self.strategy.create.assert_called_once_with(self.lock.pid, {})
+
+    def test_acquire_retries_without_blocking_event_loop(self):
+        self.strategy.read.return_value = Snapshot(True, 99, 123)
+
+        self.assertEqual(LockState.LOCKED,
+                         self.run_async(self.async_lock.acquire()))
+
+        self.assertEqual(0, self.delay_provider.call_count)
+        self.assertEqual(0, self.strategy.wait.call_count)
+        self.assertEqual(3, self.lock.last_attempts)
+
+    def test_acquire_returns_once_lock_is_released(self):
+        self.strategy.read.side_effect = [Snapshot(True, 99, 123)] * 2 + [Snapshot()] * 2
+
+        self.assertTrue(self.run_async(self.async_lock.acquire(timeout=1)).is_owner)
+
+    def test_acquire_raises_exception_when_lock_could_not_be_created(self):
+        self.strategy.create.return_value = False
+        with self.assertRaises(CouldNotCreateLockError):
+            self.run_async(self.async_lock.acquire())
+
+    def test_release_removes_lock(self):
+        self.strategy.read.return_value = Snapshot(True, self.lock.pid, 123)
+
+        self.assertIs(self.async_lock, self.run_async(self.async_lock.release()))
+
+        self.strategy.clean.assert_called_once_with()
+
+    def test_AsyncLock_acts_as_async_context_manager(self):
+        async def use_lock():
+            async with self.async_lock as lock:
+                self.strategy.read.return_value = Snapshot(True, self.lock.pid, 123)
+                return await lock.has_lock()
+
+        self.assertTrue(self.run_async(use_lock()))
+        self.strategy.clean.assert_called_once_with()
+
+    def test_AlreadyLockedError_is_raised_when_lock_can_not_be_obtained(self):
+        self.strategy.read.return_value = Snapshot(True, 99, 123)
+
+        async def use_lock():
+            async with self.async_lock:
+                pass # pragma: no cover
+
+        with self.assertRaises(AlreadyLockedError):
+            self.run_async(use_lock())
+
+    def test_lock_obtained_by_cancelled_acquisition_is_released(self):
+        def create(pid, meta=None):
+            # task gets cancelled while record is being created
+            time.sleep(0.2)
+            self.strategy.read.return_value = Snapshot(True, pid, 123)
+            return True
+        self.strategy.create.side_effect = create
+        self.strategy.clean.side_effect = lambda: setattr(
+            self.strategy.read, 'return_value', Snapshot())
+
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_async(asyncio.wait_for(self.async_lock.acquire(), 0.05))
+
+        self.strategy.clean.assert_called_once_with()
+        self.assertFalse(self.lock.has_lock)
+
+    def test_cancelled_acquisition_gives_pending_lock_up(self):
+        self.strategy.read_shared.return_value = (Snapshot(True, 99, 123),)
+        self.strategy.create.side_effect = lambda pid, meta=None: setattr(
+            self.strategy.read, 'return_value', Snapshot(True, pid, 123)) or True
+        lock = AsyncLock(Lock(self.strategy, pid_owner_client=self.pid_owner_client,
+                              retry_policy=Fixed(5, tries=3)))
+
+        with self.assertRaises(asyncio.TimeoutError):
+            self.run_async(asyncio.wait_for(lock.acquire(), 0.05))
+
+        self.strategy.clean.assert_called_once_with()
+
+
+class AsyncLockTasksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.directory = tempfile.mkdtemp('pylock_test_aio')
+        self.path = os.path.join(self.directory, 'a.pid')
+        self.async_lock = AsyncLock(Lock(File(self.path), retry_policy=Fixed(0.01, tries=None)))
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.directory)
+
+    def test_tasks_sharing_lock_exclude_each_other(self):
+        holders = []
+        peak = []
+
+        async def use_lock(start):
+            await asyncio.sleep(start)
+            async with self.async_lock:
+                holders.append(start)
+                peak.append(len(holders))
+                await asyncio.sleep(0.2)
+                # lockfile is kept until the last holder leaves
+                self.assertTrue(os.path.exists(self.path))
+                holders.remove(start)
+
+        async def use_lock_twice():
+            await asyncio.gather(use_lock(0), use_lock(0.1))
+
+        self.loop.run_until_complete(use_lock_twice())
+
+        self.assertEqual([1, 1], peak)
+        self.assertFalse(os.path.exists(self.path))
@@ -0,0 +1,223 @@
+# encoding: utf-8
+""" Tests for pylock.cli module """
+from pylock._compat import mock
+import os
+import select
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pylock import cli
+from pylock.states import LockState
+from pylock.sweeper import SweepReport
+
+
+class ImportTest(unittest.TestCase):
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'lazy imports require Python 3.7+')
+    def test_command_line_interface_does_not_import_lock_machinery(self):
+        script = ('import sys, pylock.cli; '
+                  'print(sorted(set(sys.modules) & {"logging_utils", "pylock._lock"}))')
+
+        output = subprocess.check_output([sys.executable, '-c', script])
+
+        self.assertEqual(b'[]', output.strip())
+
+
+class SweepCommandTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('pylock_test_cli')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sweep_removes_orphaned_locks(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        with open(os.path.join(self.directory, 'a.pid'), 'w') as stream:
+            stream.write(str(process.pid))
+
+        with mock.patch('sys.stdout') as stdout:
+            self.assertEqual(0, cli.main(['sweep', self.directory]))
+
+        self.assertEqual([], os.listdir(self.directory))
+        stdout.write.assert_any_call('a\tORPHANED\tremoved')
+
+    @mock.patch('pylock.sweeper.Sweeper')
+    def test_sweep_runs_as_daemon_when_interval_is_given(self, sweeper_mock):
+        sweeper_mock.return_value.run.side_effect = KeyboardInterrupt()
+
+        self.assertEqual(0, cli.main(['sweep', self.directory, '--interval', '5',
+                                      '--max-age', '60', '--kill']))
+
+        sweeper_mock.assert_called_once_with(self.directory, suffix='.pid',
+                                             max_age=60, kill=True)
+        self.assertEqual(5, sweeper_mock.return_value.run.call_args[0][0])
+
+    def test_verbose_report_lists_every_lock(self):
+        report = SweepReport({'a': LockState.LOCKED, 'b': LockState.ORPHANED}, ['b'])
+
+        with mock.patch('sys.stdout') as stdout:
+            cli._print_report(report, verbose=True)
+
+        stdout.write.assert_any_call('a\tLOCKED')
+        stdout.write.assert_any_call('b\tORPHANED\tremoved')
+
+
+class ServeCommandTest(unittest.TestCase):
+
+    @mock.patch('pylock.server.LockServer')
+    def test_serve_runs_server_on_unix_socket(self, server_mock):
+        server_mock.return_value.serve_forever.side_effect = KeyboardInterrupt()
+
+        self.assertEqual(0, cli.main(['serve', '/run/pylock.sock']))
+
+        server_mock.assert_called_once_with('/run/pylock.sock')
+        server_mock.return_value.shutdown.assert_called_once_with()
+
+    @mock.patch('pylock.server.LockServer')
+    def test_serve_runs_server_on_tcp_socket(self, server_mock):
+        server_mock.return_value.serve_forever.side_effect = KeyboardInterrupt()
+
+        cli.main(['serve', '127.0.0.1:7777'])
+
+        server_mock.assert_called_once_with(('127.0.0.1', 7777))
+
+    def test_invalid_port_is_rejected(self):
+        with mock.patch('sys.stderr'):
+            self.assertRaises(SystemExit, cli.main, ['serve', 'localhost:http'])
+
+
+class RunCommandTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('pylock_test_cli')
+        self.path = os.path.join(self.directory, 'a.pid')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_exit_code_of_command_is_returned(self):
+        self.assertEqual(3, cli.main(['run', '--lock', self.path, '--',
+                                      sys.executable, '-c', 'exit(3)']))
+
+    def test_lock_is_held_while_command_runs(self):
+        script = 'import os; exit(0 if os.path.exists({0!r}) else 1)'.format(self.path)
+
+        self.assertEqual(0, cli.main(['run', '--lock', self.path, '--',
+                                      sys.executable, '-c', script]))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_conflict_exit_code_is_returned_when_lock_is_held(self):
+        with open(self.path, 'w') as stream:
+            stream.write(str(os.getppid()))
+
+        self.assertEqual(cli.EXIT_LOCKED, cli.main(['run', '--lock', self.path,
+                                                    '--timeout', '0', 'true']))
+        self.assertEqual(9, cli.main(['run', '--lock', self.path, '--timeout', '0',
+                                      '--conflict-exit-code', '9', 'true']))
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_conflict_exit_code_is_returned_when_kernel_lock_is_held(self):
+        # holder has not written its pid yet
+        script = ('import fcntl, os, sys; fd = os.open({0!r}, os.O_RDWR | os.O_CREAT); '
+                  'fcntl.flock(fd, fcntl.LOCK_EX); print(); sys.stdout.flush(); '
+                  'sys.stdin.read()').format(self.path)
+        holder = subprocess.Popen([sys.executable, '-c', script],
+                                  stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            holder.stdout.readline()
+            self.assertEqual(cli.EXIT_LOCKED, cli.main(['run', '--lock', self.path,
+                                                        '--strategy', 'flock',
+                                                        '--timeout', '0', 'true']))
+        finally:
+            holder.stdin.close()
+            holder.wait()
+
+    def test_missing_command_is_reported(self):
+        with mock.patch('sys.stderr'):
+            self.assertEqual(cli.EXIT_NOT_FOUND, cli.main(
+                ['run', '--lock', self.path, '--', os.path.join(self.directory, 'missing')]))
+            self.assertEqual(cli.EXIT_ERROR, cli.main(['run', '--lock', self.path]))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_killed_command_exits_with_shell_code(self):
+        script = 'import os, signal; os.kill(os.getpid(), signal.SIGKILL)'
+
+        self.assertEqual(137, cli.main(['run', '--lock', self.path, '--strategy', 'flock',
+                                        '--', sys.executable, '-c', script]))
+
+    def test_lock_which_can_never_be_created_is_reported(self):
+        path = os.path.join(self.directory, 'missing', 'a.pid')
+
+        with mock.patch('sys.stderr'):
+            self.assertEqual(cli.EXIT_ERROR, cli.main(['run', '--lock', path, '--', 'true']))
+
+    def test_command_waits_for_lock_held_for_long(self):
+        with open(self.path, 'w') as stream:
+            stream.write(str(os.getppid()))
+        waits = []
+
+        def wait(lock, delay):
+            # far more retries than exponential growth of delay can represent
+            waits.append(delay)
+            if len(waits) == 1200:
+                os.remove(self.path)
+
+        with mock.patch('pylock._lock.Lock._wait', wait):
+            self.assertEqual(0, cli.main(['run', '--lock', self.path, '--', 'true']))
+        self.assertEqual(1200, len(waits))
+        self.assertLessEqual(max(waits), 1)
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'requires prctl(2)')
+    def test_command_does_not_outlive_killed_pylock(self):
+        script = 'import os, time; print(os.getpid()); time.sleep(60)'
+        wrapper = subprocess.Popen([sys.executable, '-m', 'pylock.cli', 'run',
+                                    '--lock', self.path, '--max-age', '60', '--',
+                                    sys.executable, '-c', script],
+                                   stdout=subprocess.PIPE)
+        pid = int(wrapper.stdout.readline())
+        try:
+            # the way contenders break lock whose owner does not terminate
+            wrapper.send_signal(signal.SIGKILL)
+            wrapper.wait()
+
+            # output is closed once command exits too
+            self.assertTrue(select.select([wrapper.stdout], [], [], 10)[0])
+            self.assertEqual(b'', wrapper.stdout.read())
+        finally:
+            wrapper.stdout.close()
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+    @mock.patch('os.execvp')
+    def test_max_age_requires_exec_when_command_cannot_be_bound(self, execvp_mock):
+        with mock.patch('sys.platform', 'darwin'), mock.patch('sys.stderr'):
+            self.assertEqual(cli.EXIT_ERROR, cli.main(['run', '--lock', self.path,
+                                                       '--max-age', '60', '--', 'true']))
+            self.assertFalse(os.path.exists(self.path))
+            self.assertEqual(0, cli.main(['run', '--lock', self.path, '--', 'true']))
+
+            cli.main(['run', '--lock', self.path, '--max-age', '60', '--exec', '--', 'true'])
+        execvp_mock.assert_called_once_with('true', ['true'])
+
+    @mock.patch('os.execvp')
+    def test_exec_is_not_combined_with_lease(self, execvp_mock):
+        with mock.patch('sys.stderr'):
+            self.assertEqual(cli.EXIT_ERROR, cli.main(['run', '--lock', self.path, '--exec',
+                                                       '--lease', '5', '--', 'true']))
+        self.assertEqual(0, execvp_mock.call_count)
+        self.assertFalse(os.path.exists(self.path))
+
+    @mock.patch('os.execvp')
+    def test_exec_replaces_process_keeping_lock(self, execvp_mock):
+        cli.main(['run', '--lock', self.path, '--exec', '--', 'true', '-x'])
+
+        execvp_mock.assert_called_once_with('true', ['true', '-x'])
+        self.assertTrue(os.path.exists(self.path))
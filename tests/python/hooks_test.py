@@ -0,0 +1,69 @@
+# encoding: utf-8
+""" Tests for pylock.hooks module """
+from pylock._compat import mock
+import unittest
+
+from pylock.hooks import chain, Hook, HookChain, Histogram, MetricsHook
+from pylock.states import LockState
+from pylock.strategy import Snapshot
+
+
+class ChainTest(unittest.TestCase):
+
+    def test_chain_of_no_hooks_is_None(self):
+        self.assertIsNone(chain(None))
+        self.assertIsNone(chain([]))
+
+    def test_chain_of_single_hook_is_the_hook(self):
+        hook = Hook()
+        self.assertIs(hook, chain([hook]))
+
+    def test_chain_passes_events_to_all_hooks(self):
+        hooks = [mock.MagicMock(Hook), mock.MagicMock(Hook)]
+        hook = chain(hooks)
+        self.assertIsInstance(hook, HookChain)
+
+        hook.acquire_started('lock')
+        hook.acquire_finished('lock', LockState.OWNER, 1, 0.5)
+        hook.waited('lock', 0.1)
+        hook.state_decided('lock', LockState.LOCKED)
+        hook.cleaned('lock', Snapshot())
+        hook.killed('lock', Snapshot(), True)
+        hook.released('lock', 2)
+
+        for inner in hooks:
+            self.assertEqual(['acquire_started', 'acquire_finished', 'waited',
+                              'state_decided', 'cleaned', 'killed', 'released'],
+                             [name for name, _, _ in inner.method_calls])
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_observe_counts_values_in_buckets(self):
+        histogram = Histogram((1, 5))
+
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value)
+
+        self.assertEqual([2, 1, 1], histogram.counts)
+        self.assertEqual(4, histogram.count)
+        self.assertEqual(14.5, histogram.sum)
+
+
+class MetricsHookTest(unittest.TestCase):
+
+    def test_metrics_are_collected(self):
+        hook = MetricsHook(buckets=(1,))
+
+        hook.state_decided(None, LockState.LOCKED)
+        hook.state_decided(None, LockState.OWNER)
+        hook.acquire_finished(None, LockState.OWNER, 2, 0.5)
+        hook.cleaned(None, Snapshot())
+        hook.killed(None, Snapshot(), True)
+        hook.released(None, 3)
+
+        self.assertEqual({LockState.LOCKED: 1, LockState.OWNER: 1}, dict(hook.states))
+        self.assertEqual([1, 0], hook.acquire_latency.counts)
+        self.assertEqual([0, 1], hook.hold_time.counts)
+        self.assertEqual(1, hook.cleanups)
+        self.assertEqual(1, hook.kills)
@@ -0,0 +1,181 @@
+# encoding: utf-8
+""" Tests for pylock.manager module """
+from pylock._compat import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylock import AlreadyLockedError, CouldNotCreateLockError
+from pylock.manager import LockManager, DirectoryLockManager
+from pylock.pid_owner_client import Client, CachingClient
+from pylock.states import LockState
+from pylock.strategy import Base, Snapshot
+
+
+def write_exclusively(path, data, **at):
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644, **at)
+    try:
+        os.write(fd, data.encode('utf-8'))
+    finally:
+        os.close(fd)
+
+
+class LockManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.strategies = {}
+        self.calls = []
+        self.manager = LockManager(self.strategy_factory,
+                                   current_time_provider=mock.MagicMock(return_value=123),
+                                   delay_provider=mock.MagicMock(),
+                                   pid_owner_client=mock.MagicMock(spec=Client, **{'identify.return_value': {}}))
+
+    def strategy_factory(self, name):
+        strategy = mock.MagicMock(Base)
+        strategy.is_valid.return_value = True
+        strategy.manages_liveness = False
+        strategy.create.side_effect = lambda pid, meta=None: self.calls.append(('create', name)) or True
+        strategy.clean.side_effect = lambda: self.calls.append(('clean', name))
+        strategy.read.return_value = Snapshot()
+        strategy.wait.return_value = True
+        self.strategies[name] = strategy
+        return strategy
+
+    def own(self, name):
+        self.strategies[name].read.return_value = Snapshot(True, os.getpid(), 123)
+
+    def test_lock_returns_the_same_lock_for_given_name(self):
+        self.assertIs(self.manager.lock('a'), self.manager.lock('a'))
+        self.assertIsNot(self.manager.lock('a'), self.manager.lock('b'))
+
+    def test_locks_share_liveness_cache_by_default(self):
+        manager = LockManager(self.strategy_factory)
+        client = manager.lock('a')._pid_owner_client
+
+        self.assertIsInstance(client, CachingClient)
+        self.assertIs(client, manager.lock('b')._pid_owner_client)
+
+    def test_acquire_obtains_locks_in_sorted_order(self):
+        self.assertEqual(LockState.OWNER, self.manager.acquire(['c', 'a', 'b', 'a']))
+
+        self.assertEqual([('create', 'a'), ('create', 'b'), ('create', 'c')], self.calls)
+        self.assertEqual(frozenset('abc'), self.manager.held)
+
+    def test_acquire_skips_locks_already_held(self):
+        self.manager.acquire(['a'])
+        self.manager.acquire(['a', 'b'])
+
+        self.assertEqual([('create', 'a'), ('create', 'b')], self.calls)
+
+    def test_rollback_keeps_locks_held_before_batch(self):
+        self.manager.acquire(['a'])
+        self.own('a')
+        self.manager.lock('b')
+        self.strategies['b'].read.return_value = Snapshot(True, 99, 123)
+
+        self.assertEqual(LockState.LOCKED, self.manager.acquire(['a', 'b'], blocking=False))
+
+        self.assertEqual(frozenset('a'), self.manager.held)
+        self.assertEqual(0, self.strategies['a'].clean.call_count)
+
+    def test_acquire_releases_obtained_locks_when_next_one_could_not_be_obtained(self):
+        self.manager.lock('a')
+        self.manager.lock('b')
+        self.strategies['b'].read.return_value = Snapshot(True, 99, 123)
+        self.strategies['a'].create.side_effect = lambda pid, meta=None: self.own('a') or True
+
+        self.assertEqual(LockState.LOCKED, self.manager.acquire(['a', 'b'], blocking=False))
+
+        self.strategies['a'].clean.assert_called_once_with()
+        self.assertEqual(frozenset(), self.manager.held)
+
+    def test_acquire_releases_obtained_locks_on_error(self):
+        self.manager.lock('a')
+        self.manager.lock('b')
+        self.strategies['a'].create.side_effect = lambda pid, meta=None: self.own('a') or True
+        self.strategies['b'].create.side_effect = None
+        self.strategies['b'].create.return_value = False
+
+        self.assertRaises(CouldNotCreateLockError, self.manager.acquire, ['a', 'b'])
+
+        self.strategies['a'].clean.assert_called_once_with()
+        self.assertEqual(frozenset(), self.manager.held)
+
+    def test_release_releases_held_locks_in_reverse_order(self):
+        self.manager.acquire(['a', 'b'])
+        self.own('a')
+        self.own('b')
+        self.calls = []
+
+        self.manager.release()
+
+        self.assertEqual([('clean', 'b'), ('clean', 'a')], self.calls)
+        self.assertEqual(frozenset(), self.manager.held)
+
+    def test_release_ignores_locks_not_held(self):
+        self.manager.lock('a')
+        self.manager.release(['a', 'b'])
+        self.assertEqual(0, self.strategies['a'].read.call_count)
+
+    def test_locked_holds_locks_within_context(self):
+        with self.manager.locked(['a', 'b']) as manager:
+            self.assertEqual(frozenset('ab'), manager.held)
+            self.own('a')
+            self.own('b')
+        self.assertEqual(frozenset(), self.manager.held)
+
+    def test_locked_raises_AlreadyLockedError_when_locks_can_not_be_obtained(self):
+        self.manager.lock('a')
+        self.strategies['a'].read.return_value = Snapshot(True, 99, 123)
+
+        with self.assertRaises(AlreadyLockedError):
+            with self.manager.locked(['a'], blocking=False):
+                pass # pragma: no cover
+
+
+class DirectoryLockManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('pylock_test_manager')
+        self.manager = DirectoryLockManager(self.directory, write_exclusively)
+
+    def tearDown(self):
+        self.manager.close()
+        shutil.rmtree(self.directory)
+
+    def test_locks_are_kept_in_directory(self):
+        self.assertTrue(self.manager.acquire(['a', 'b']).is_owner)
+        self.assertEqual(['a.pid', 'b.pid'], sorted(os.listdir(self.directory)))
+
+        self.manager.release()
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_lock_held_by_other_process_is_respected(self):
+        write_exclusively(os.path.join(self.directory, 'b.pid'), str(os.getppid()))
+
+        self.assertEqual(LockState.LOCKED, self.manager.acquire(['a', 'b'], blocking=False))
+        self.assertEqual(['b.pid'], os.listdir(self.directory))
+
+    def test_invalid_lock_names_are_rejected(self):
+        self.assertRaises(ValueError, self.manager.lock, '../a')
+        self.assertRaises(ValueError, self.manager.lock, '')
+
+    def test_close_releases_held_locks(self):
+        self.manager.acquire(['a'])
+        self.manager.close()
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_locks_are_created_through_directory_handle(self):
+        manager = DirectoryLockManager(self.directory)
+        # path of directory is not resolved again once it has been opened
+        moved = self.directory + '.moved'
+        os.rename(self.directory, moved)
+        try:
+            self.assertTrue(manager.acquire(['a', 'b']).is_owner)
+            self.assertEqual(['a.pid', 'b.pid'], sorted(os.listdir(moved)))
+
+            manager.close()
+            self.assertEqual([], os.listdir(moved))
+        finally:
+            os.rename(moved, self.directory)
@@ -0,0 +1,252 @@
+# encoding: utf-8
+""" Tests for pylock.pid_owner_client module """
+from pylock._compat import mock
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+from pylock.pid_owner_client import Client, SubprocessClient, ProcfsClient, CachingClient
+
+
+class FakeClient(Client):
+
+    def __init__(self, **options):
+        super(FakeClient, self).__init__(**options)
+
+        self.alive = True
+        self.same_process = True
+        self.ignored_signals = ()
+        self.terminated = []
+
+    def _is_alive(self, pid):
+        return self.alive
+
+    def _is_same_process(self, pid, meta):
+        return self.same_process
+
+    def _terminate(self, pid, signum):
+        self.terminated.append((pid, signum))
+        if signum not in self.ignored_signals:
+            self.alive = False
+
+
+class ClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient()
+
+    def test_is_alive_ignores_identity_when_not_given(self):
+        self.client.same_process = False
+        self.assertTrue(self.client.is_alive(1))
+        self.assertTrue(self.client.is_alive(1, {}))
+
+    def test_is_alive_compares_identity(self):
+        self.client.same_process = False
+        self.assertFalse(self.client.is_alive(1, {'start_time': '42'}))
+
+    def test_is_alive_returns_False_on_error(self):
+        self.client._is_alive = mock.MagicMock(side_effect=OSError())
+        self.assertFalse(self.client.is_alive(1))
+
+    def test_terminate_kills_process_with_matching_identity(self):
+        self.assertTrue(self.client.terminate(1, {'start_time': '42'}))
+        self.assertEqual([(1, signal.SIGTERM)], self.client.terminated)
+
+    def test_terminate_does_not_kill_process_that_reused_pid(self):
+        self.client.same_process = False
+        self.assertTrue(self.client.terminate(1, {'start_time': '42'}))
+        self.assertEqual([], self.client.terminated)
+
+
+class TerminateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [100]
+        self.client = FakeClient(terminate_timeout=5, kill_timeout=1, poll_interval=2,
+                                 delay_provider=self.sleep,
+                                 current_time_provider=lambda: self.now[0])
+        self.client.ignored_signals = (signal.SIGTERM,)
+
+    def sleep(self, delay):
+        self.now[0] += delay
+
+    def test_terminate_kills_process_ignoring_SIGTERM_after_timeout(self):
+        self.assertTrue(self.client.terminate(1))
+
+        self.assertEqual([(1, signal.SIGTERM), (1, signal.SIGKILL)], self.client.terminated)
+        self.assertEqual(105, self.now[0])
+
+    def test_terminate_reports_process_that_could_not_be_killed(self):
+        self.client.ignored_signals = (signal.SIGTERM, signal.SIGKILL)
+
+        self.assertFalse(self.client.terminate(1))
+        self.assertEqual(106, self.now[0])
+
+    def test_terminate_without_timeout_kills_process_at_once(self):
+        self.client._terminate_timeout = 0
+
+        self.assertTrue(self.client.terminate(1))
+        self.assertEqual([(1, signal.SIGKILL)], self.client.terminated)
+
+
+class SubprocessClientTest(unittest.TestCase):
+
+    def test_current_process_is_alive(self):
+        self.assertTrue(SubprocessClient().is_alive(os.getpid()))
+
+    def test_identify_returns_no_identity(self):
+        self.assertEqual({}, SubprocessClient().identify(os.getpid()))
+
+    def spawn(self, code):
+        process = subprocess.Popen([sys.executable, '-c',
+                                    code + '\nprint("ready")\nimport time\ntime.sleep(30)'],
+                                   stdout=subprocess.PIPE)
+        self.addCleanup(process.stdout.close)
+        process.stdout.readline()
+        # reap the child, so it does not linger as zombie
+        reaper = threading.Thread(target=process.wait)
+        reaper.daemon = True
+        reaper.start()
+        return process
+
+    def test_terminate_stops_process_gracefully(self):
+        process = self.spawn('')
+        client = SubprocessClient(terminate_timeout=5)
+
+        self.assertTrue(client.terminate(process.pid))
+        self.assertEqual(-signal.SIGTERM, process.wait())
+
+    def test_terminate_kills_process_ignoring_SIGTERM(self):
+        process = self.spawn('import signal\n'
+                             'signal.signal(signal.SIGTERM, signal.SIG_IGN)')
+        client = SubprocessClient(terminate_timeout=0.2)
+
+        self.assertTrue(client.terminate(process.pid))
+        self.assertEqual(-signal.SIGKILL, process.wait())
+
+    def test_terminate_confirms_process_that_is_already_gone(self):
+        process = self.spawn('')
+        process.kill()
+        process.wait()
+
+        self.assertTrue(SubprocessClient().terminate(process.pid))
+
+
+class ProcfsClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.procfs = tempfile.mkdtemp('pylock_test_procfs')
+        self.write('sys/kernel/random/boot_id', 'boot-1\n')
+        self.write('{0}/stat'.format(os.getpid()),
+                   '{0} (my (odd) name) S 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 '
+                   '16 17 18 4242 20 21\n'.format(os.getpid()))
+        self.client = ProcfsClient(self.procfs)
+
+    def tearDown(self):
+        shutil.rmtree(self.procfs)
+
+    def write(self, name, content):
+        path = os.path.join(self.procfs, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as stream:
+            stream.write(content)
+
+    def test_identify_returns_start_time_and_boot_id(self):
+        self.assertEqual({'start_time': '4242', 'boot_id': 'boot-1'},
+                         self.client.identify(os.getpid()))
+
+    def test_identify_returns_no_identity_for_missing_process(self):
+        self.assertEqual({}, self.client.identify(os.getpid() + 1))
+
+    def test_is_alive_accepts_matching_identity(self):
+        meta = self.client.identify(os.getpid())
+        self.assertTrue(self.client.is_alive(os.getpid(), meta))
+
+    def test_is_alive_rejects_process_started_at_other_time(self):
+        meta = {'start_time': '1', 'boot_id': 'boot-1'}
+        self.assertFalse(self.client.is_alive(os.getpid(), meta))
+
+    def test_is_alive_rejects_process_from_other_boot(self):
+        meta = {'start_time': '4242', 'boot_id': 'boot-0'}
+        self.assertFalse(self.client.is_alive(os.getpid(), meta))
+
+    @unittest.skipUnless(os.path.isdir('/proc/self'), 'procfs is required')
+    def test_identify_reads_real_procfs(self):
+        client = ProcfsClient()
+        meta = client.identify(os.getpid())
+
+        self.assertEqual(['boot_id', 'start_time'], sorted(meta))
+        self.assertTrue(client.is_alive(os.getpid(), meta))
+
+
+class IsAliveManyTest(unittest.TestCase):
+
+    def test_is_alive_many_returns_liveness_keyed_by_pid(self):
+        client = FakeClient()
+        client._is_alive = lambda pid: pid != 2
+        client._is_same_process = lambda pid, meta: meta['start_time'] == '42'
+
+        self.assertEqual({1: True, 2: False, 3: False},
+                         client.is_alive_many([1, 2, 3], {3: {'start_time': '7'}}))
+
+    def test_is_alive_many_treats_errors_as_dead_processes(self):
+        client = FakeClient()
+        client._is_alive = mock.MagicMock(side_effect=OSError())
+
+        self.assertEqual({1: False}, client.is_alive_many([1]))
+
+    def test_procfs_client_scans_process_list_once(self):
+        procfs = tempfile.mkdtemp('pylock_test_procfs')
+        self.addCleanup(shutil.rmtree, procfs)
+        os.mkdir(os.path.join(procfs, '1'))
+        os.mkdir(os.path.join(procfs, '3'))
+        os.mkdir(os.path.join(procfs, 'self'))
+        client = ProcfsClient(procfs)
+        client._is_alive = mock.MagicMock()
+
+        self.assertEqual({1: True, 2: False, 3: True}, client.is_alive_many([1, 2, 3]))
+        self.assertEqual(0, client._is_alive.call_count)
+
+
+class CachingClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = mock.MagicMock(spec=Client)
+        self.client.is_alive_many.side_effect = lambda pids, metas: dict.fromkeys(pids, True)
+        self.current_time_provider = mock.MagicMock(return_value=100)
+        self.caching = CachingClient(self.client, ttl=1,
+                                     current_time_provider=self.current_time_provider)
+
+    def test_liveness_is_remembered_for_ttl(self):
+        self.assertTrue(self.caching.is_alive(1))
+        self.assertEqual({1: True, 2: True}, self.caching.is_alive_many([1, 2]))
+
+        self.assertEqual([mock.call(frozenset([1]), {}), mock.call(set([2]), {})],
+                         self.client.is_alive_many.call_args_list)
+
+    def test_liveness_is_checked_again_after_ttl(self):
+        self.caching.is_alive(1)
+        self.current_time_provider.return_value = 101
+        self.caching.is_alive(1)
+
+        self.assertEqual(2, self.client.is_alive_many.call_count)
+
+    def test_liveness_is_remembered_per_identity(self):
+        self.caching.is_alive(1, {'start_time': '42'})
+        self.caching.is_alive(1, {'start_time': '7'})
+
+        self.assertEqual(2, self.client.is_alive_many.call_count)
+
+    def test_terminate_forgets_liveness_of_process(self):
+        self.caching.is_alive(1)
+        self.caching.terminate(1, {})
+        self.caching.is_alive(1)
+
+        self.client.terminate.assert_called_once_with(1, {})
+        self.assertEqual(2, self.client.is_alive_many.call_count)
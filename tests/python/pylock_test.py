@@ -1,12 +1,18 @@
 # encoding: utf-8
 """ Tests for pylock.__init__ module """
 from pylock._compat import mock
+import os
+import threading
+import time
 import unittest
 
-from pylock import Lock, AlreadyLockedError, CouldNotCreateLockError
-from pylock.strategy import Base
+from pylock import Lock, SharedLock, AlreadyLockedError, CouldNotCreateLockError
+from pylock.strategy import Base, Snapshot
+from pylock.strategy.memory import Memory, Store
 from pylock.states import LockState
 from pylock.pid_owner_client import Client
+from pylock.retry import RetryPolicy, Fixed
+from pylock.hooks import Hook
 
 class LockTest(unittest.TestCase):
 
@@ -14,10 +20,12 @@ class LockTest(unittest.TestCase):
         self.lockfile = '/tmp/lockfile'
         self.strategy = mock.MagicMock(Base)
         self.strategy.is_valid.return_value = True
+        self.strategy.manages_liveness = False
         self.strategy.create.return_value = True
-        self.strategy.exists.return_value = False
+        self.strategy.read.return_value = Snapshot()
+        self.strategy.read_shared.return_value = ()
         self.delay_provider = mock.MagicMock()
-        self.pid_owner_client = mock.MagicMock(spec=Client)
+        self.pid_owner_client = mock.MagicMock(spec=Client, **{'identify.return_value': {}})
         self.current_time_provider = mock.MagicMock()
         self.max_age = 10
 
@@ -34,23 +42,17 @@ class LockTest(unittest.TestCase):
     def test_acquire_called_multiple_times_locks_only_once(self):
         lock = self.lock
         self.assertTrue(lock.acquire().is_owner)
-        # lock exists
-        self.strategy.exists.return_value = True
         # current app owns lock
-        self.strategy.read_pid.return_value = lock.pid
+        self.strategy.read.return_value = Snapshot(True, lock.pid, 123)
         self.assertTrue(lock.acquire().is_owner)
 
-        self.strategy.create.assert_called_once_with(lock.pid)
+        self.strategy.create.assert_called_once_with(lock.pid, {})
 
     def test_acquire_returns_LockState_indicating_failed_lock_when_lock_can_not_be_obtained(self):
         lock = self.lock
-        # lock exists
-        self.strategy.exists.return_value = True
-        # other app owns lock
-        self.strategy.read_pid.return_value = lock.pid + 1
-        # lock is not outdated
+        # other app owns lock, but lock is not outdated
         self.current_time_provider.return_value = 123
-        self.strategy.get_create_date.return_value = 123 - self.max_age // 2
+        self.strategy.read.return_value = Snapshot(True, lock.pid + 1, 123 - self.max_age // 2)
 
         self.assertFalse(lock.acquire().is_owner)
         self.assertFalse(lock.acquire().can_acquire)
@@ -60,62 +62,119 @@ class LockTest(unittest.TestCase):
         self.strategy.create.return_value = False
         self.assertRaises(CouldNotCreateLockError, self.lock.acquire)
 
+    def test_acquire_does_not_retry_lock_which_can_never_be_created(self):
+        self.strategy.create.side_effect = CouldNotCreateLockError(permanent=True)
+        lock = Lock(self.strategy, retry_policy=Fixed(0.1, tries=None),
+                    delay_provider=self.delay_provider,
+                    current_time_provider=self.current_time_provider,
+                    pid_owner_client=self.pid_owner_client)
+
+        self.assertRaises(CouldNotCreateLockError, lock.acquire, timeout=-1)
+        self.strategy.create.assert_called_once_with(lock.pid, {})
+        self.assertEqual(0, self.delay_provider.call_count)
+
     def test_acquire_breaks_outdated_lock_and_kills_lock_owner(self):
         fake_pid = 99999999
-        # lock exists
-        self.strategy.exists.return_value = True
-        # other app owns lock
-        self.strategy.read_pid.return_value = fake_pid
-
-        # but lock is outdated
+        # other app owns lock, but lock is outdated
         self.current_time_provider.return_value = 123
-        self.strategy.get_create_date.return_value = 123 - self.max_age * 2
+        self.strategy.read.return_value = Snapshot(True, fake_pid, 123 - self.max_age * 2)
 
         self.assertTrue(self.lock.acquire().is_owner)
-        self.strategy.clean.assert_called_once_with()
+        self.strategy.clean_stale.assert_called_once_with(self.strategy.fingerprint.return_value)
 
         self.assertGreater(self.pid_owner_client.is_alive.call_count, 0)
-        self.pid_owner_client.terminate.assert_called_once_with(fake_pid)
+        self.pid_owner_client.terminate.assert_called_once_with(fake_pid, {})
 
     def test_acquire_with_max_age_not_set_assumes_lock_always_active(self):
         self.max_age = None
         fake_pid = 99999999
 
-        # lock exists
-        self.strategy.exists.return_value = True
-        # other app owns lock
-        self.strategy.read_pid.return_value = fake_pid
-
-        # but lock is outdated
+        # other app owns lock, but lock is outdated
         self.current_time_provider.return_value = 123
-        self.strategy.get_create_date.return_value = 12
+        self.strategy.read.return_value = Snapshot(True, fake_pid, 12)
 
         self.assertFalse(self.lock.acquire().is_owner)
         self.assertEqual(0, self.strategy.clean.call_count)
 
+    def test_acquire_does_not_take_over_lock_when_owner_could_not_be_terminated(self):
+        self.current_time_provider.return_value = 123
+        self.strategy.read.return_value = Snapshot(True, 99, 123 - self.max_age * 2)
+        self.pid_owner_client.terminate.return_value = False
+
+        self.assertEqual(LockState.LOCKED, self.lock.acquire(blocking=False))
+        self.assertEqual(0, self.strategy.clean.call_count)
+        self.assertEqual(0, self.strategy.create.call_count)
+
     def test_acquire_breaks_invalid_lock_and_kills_its_owner(self):
         self.strategy.is_valid.return_value = False
+        self.strategy.read.return_value = Snapshot(True, 99, 123)
         self.assertTrue(self.lock.acquire().is_owner)
 
-        self.strategy.clean.assert_called_once_with()
+        self.strategy.clean_stale.assert_called_once_with(self.strategy.fingerprint.return_value)
+
+        self.pid_owner_client.terminate.assert_called_once_with(99, {})
+
+    def test_acquire_checks_lock_owner_by_identity_stored_in_lock(self):
+        self.current_time_provider.return_value = 123
+        self.strategy.read.return_value = Snapshot(True, 99, 123, {'start_time': '42'})
+        self.pid_owner_client.is_alive.return_value = True
+
+        self.assertFalse(self.lock.acquire(blocking=False).is_owner)
+        self.pid_owner_client.is_alive.assert_called_with(99, {'start_time': '42'})
+
+    def test_acquire_stores_identity_of_current_process(self):
+        self.pid_owner_client.identify.return_value = {'start_time': '42'}
+        lock = self.lock
 
-        self.pid_owner_client.terminate.assert_called_once_with(self.strategy.read_pid.return_value)
+        lock.acquire()
+
+        self.strategy.create.assert_called_once_with(lock.pid, {'start_time': '42'})
+        self.pid_owner_client.identify.assert_called_once_with(lock.pid)
+
+    def test_lock_with_own_pid_but_other_identity_is_not_owned(self):
+        self.pid_owner_client.identify.return_value = {'start_time': '42'}
+        self.pid_owner_client.is_alive.return_value = True
+        self.current_time_provider.return_value = 123
+        lock = self.lock
+        self.strategy.read.return_value = Snapshot(True, lock.pid, 123, {'start_time': '7'})
+
+        self.assertEqual(LockState.LOCKED, lock.get_lock_state())
+
+        self.strategy.read.return_value = Snapshot(True, lock.pid, 123, {'start_time': '42'})
+        self.assertEqual(LockState.OWNER, lock.get_lock_state())
 
     def test_acquire_breaks_locks_from_non_existent_processes(self):
-        # lock exists
-        self.strategy.exists.return_value = True
         # other app owns lock
-        self.strategy.read_pid.return_value = self.lock.pid + 1
+        self.strategy.read.return_value = Snapshot(True, self.lock.pid + 1, 123)
         # but this app does not exist
         self.pid_owner_client.is_alive.return_value = False
         self.assertTrue(self.lock.acquire().is_owner)
-        self.strategy.clean.assert_called_once_with()
+        self.strategy.clean_stale.assert_called_once_with(self.strategy.fingerprint.return_value)
+
+    def test_stale_lock_taken_over_by_other_process_in_the_meantime_is_kept(self):
+        self.current_time_provider.return_value = 123
+        dead = Snapshot(True, self.lock.pid + 1, 123)
+        self.strategy.read.side_effect = [dead, Snapshot(True, self.lock.pid + 2, 124)]
+        self.pid_owner_client.is_alive.side_effect = lambda pid, meta=None: pid != dead.pid
+
+        self.assertEqual(LockState.LOCKED, self.lock.acquire(blocking=False))
+        self.assertFalse(self.strategy.clean_stale.called)
+        self.assertFalse(self.strategy.create.called)
+
+    def test_owner_liveness_is_not_checked_when_strategy_manages_it(self):
+        self.strategy.manages_liveness = True
+        self.current_time_provider.return_value = 123
+        self.strategy.read.return_value = Snapshot(True, self.lock.pid + 1, 123)
+        self.pid_owner_client.is_alive.return_value = False
+
+        self.assertEqual(LockState.LOCKED, self.lock.acquire(blocking=False))
+        self.assertFalse(self.pid_owner_client.is_alive.called)
+        self.assertFalse(self.strategy.clean.called)
+        self.assertFalse(self.strategy.clean_stale.called)
 
     def test_release_removes_lock(self):
-        # lock exists
-        self.strategy.exists.return_value = True
         # current app owns lock
-        self.strategy.read_pid.return_value = self.lock.pid
+        self.strategy.read.return_value = Snapshot(True, self.lock.pid, 123)
 
         self.assertIsInstance(self.lock.release(), Lock)
 
@@ -123,7 +182,8 @@ class LockTest(unittest.TestCase):
 
     def test_release_does_not_remove_lock_that_does_not_own(self):
         # other app owns lock
-        self.strategy.read_pid.return_value = 999
+        self.strategy.read.return_value = Snapshot(True, 999, 123)
+        self.current_time_provider.return_value = 123
 
         self.assertIsInstance(self.lock.release(), Lock)
 
@@ -132,18 +192,16 @@ class LockTest(unittest.TestCase):
     def test_Lock_object_acts_as_context_manager(self):
 
         # noone owns lock
-        self.strategy.read_pid.return_value = None
+        self.strategy.read.return_value = Snapshot()
 
         # lock is not outdated
         self.current_time_provider.return_value = 123
-        self.strategy.get_create_date.return_value = 123 - self.max_age // 2
 
         with self.lock as lock:
-            self.strategy.exists.return_value = True
-            self.strategy.create.assert_called_once_with(lock.pid)
+            self.strategy.create.assert_called_once_with(lock.pid, {})
 
             # current app owns lock
-            self.strategy.read_pid.return_value = self.lock.pid
+            self.strategy.read.return_value = Snapshot(True, lock.pid, 123 - self.max_age // 2)
 
             self.assertTrue(lock.has_lock)
 
@@ -151,17 +209,867 @@ class LockTest(unittest.TestCase):
 
     def test_when_entering_context_AlreadyLocked_exception_is_raised_is_lock_can_not_be_obtained(self):
 
-        # lock exists
-        self.strategy.exists.return_value = True
-
-        # other process owns lock
-        self.strategy.read_pid.return_value = 99
-
-        # lock is not outdated
+        # other process owns lock, lock is not outdated
         self.current_time_provider.return_value = 123
-        self.strategy.get_create_date.return_value = 123 - self.max_age // 2
+        self.strategy.read.return_value = Snapshot(True, 99, 123 - self.max_age // 2)
 
         with self.assertRaises(AlreadyLockedError):
             with self.lock:
                 pass
 
+
+    def test_lock_state_is_evaluated_from_single_snapshot(self):
+        self.strategy.read.return_value = Snapshot(True, 99, 123)
+        self.current_time_provider.return_value = 123
+
+        self.assertEqual(LockState.LOCKED, self.lock.get_lock_state())
+
+        self.strategy.read.assert_called_once_with()
+        self.assertEqual(0, self.strategy.exists.call_count)
+        self.assertEqual(0, self.strategy.read_pid.call_count)
+        self.assertEqual(0, self.strategy.get_create_date.call_count)
+
+    def test_get_lock_state_evaluates_given_snapshot(self):
+        self.assertEqual(LockState.UNLOCKED, self.lock.get_lock_state(Snapshot()))
+        self.assertEqual(0, self.strategy.read.call_count)
+
+    def test_get_record_state_ignores_shared_holders(self):
+        self.strategy.read_shared.return_value = (Snapshot(True, 123, 0),)
+        self.pid_owner_client.is_alive.return_value = True
+
+        self.assertEqual(LockState.SHARED, self.lock.get_lock_state(Snapshot()))
+        self.assertEqual(LockState.UNLOCKED, self.lock.get_record_state(Snapshot()))
+
+    def test_kill_owner_terminates_owner_of_given_record(self):
+        self.pid_owner_client.terminate.return_value = True
+
+        self.assertTrue(self.lock.kill_owner(Snapshot(True, 123, 0, {'start_time': '1'})))
+        self.pid_owner_client.terminate.assert_called_once_with(123, {'start_time': '1'})
+
+    def test_acquire_waits_between_tries_when_lock_is_held(self):
+        self.strategy.wait.return_value = False
+        self.current_time_provider.return_value = 123
+        self.strategy.read.return_value = Snapshot(True, 99, 123)
+
+        self.assertEqual(LockState.LOCKED, self.lock.acquire())
+
+        # one additional read comes from ownership check
+        self.assertEqual(4, self.strategy.read.call_count)
+        self.assertEqual([mock.call(2), mock.call(2)],
+                         self.delay_provider.call_args_list)
+
+    def test_acquire_lets_strategy_wait_for_lock_release(self):
+        self.strategy.wait.return_value = True
+        self.current_time_provider.return_value = 123
+        self.strategy.read.return_value = Snapshot(True, 99, 123)
+
+        self.lock.acquire()
+
+        self.assertEqual(2, self.strategy.wait.call_count)
+        self.assertEqual(0, self.delay_provider.call_count)
+
+    def test_non_blocking_acquire_tries_only_once(self):
+        self.current_time_provider.return_value = 123
+        self.strategy.read.return_value = Snapshot(True, 99, 123)
+
+        self.assertEqual(LockState.LOCKED, self.lock.acquire(blocking=False))
+
+        # one additional read comes from ownership check
+        self.assertEqual(2, self.strategy.read.call_count)
+        self.assertEqual(0, self.strategy.wait.call_count)
+
+    def test_acquire_with_timeout_retries_until_lock_is_released(self):
+        self.strategy.wait.return_value = True
+        self.current_time_provider.return_value = 123
+        self.strategy.read.side_effect = [Snapshot(True, 99, 123)] * 6 + [Snapshot()] * 2
+
+        self.assertTrue(self.lock.acquire(timeout=-1).is_owner)
+
+        self.assertEqual(5, self.strategy.wait.call_count)
+
+    def test_acquire_with_timeout_gives_up_after_deadline(self):
+        self.max_age = None
+        self.strategy.wait.return_value = True
+        self.current_time_provider.side_effect = range(100, 200)
+        self.strategy.read.return_value = Snapshot(True, 99, 123)
+
+        self.assertEqual(LockState.LOCKED, self.lock.acquire(timeout=10))
+
+        self.strategy.wait.assert_called_with(1)
+
+    def test_acquire_uses_delays_from_given_retry_policy(self):
+        self.strategy.wait.return_value = False
+        self.current_time_provider.return_value = 123
+        self.strategy.read.return_value = Snapshot(True, 99, 123)
+        policy = mock.MagicMock(RetryPolicy)
+        policy.delays.return_value = iter([0.1, 0.2])
+
+        lock = Lock(self.strategy, delay_provider=self.delay_provider,
+                    current_time_provider=self.current_time_provider,
+                    pid_owner_client=self.pid_owner_client,
+                    retry_policy=policy)
+
+        self.assertEqual(LockState.LOCKED, lock.acquire())
+        self.assertEqual([mock.call(0.1), mock.call(0.2)],
+                         self.delay_provider.call_args_list)
+
+    def test_acquire_records_number_of_attempts(self):
+        self.strategy.wait.return_value = True
+        self.current_time_provider.return_value = 123
+        lock = self.lock
+
+        self.strategy.read.side_effect = [Snapshot(True, 99, 123)] * 2 + [Snapshot()] * 2
+        lock.acquire()
+        self.assertEqual(2, lock.last_attempts)
+
+        self.strategy.read.side_effect = None
+        self.strategy.read.return_value = Snapshot(True, 99, 123)
+        lock.acquire()
+        self.assertEqual(3, lock.last_attempts)
+
+        self.assertEqual({2: 1, 3: 1}, lock.attempts)
+
+    def test_lock_state_is_SHARED_when_lock_is_held_by_shared_holders(self):
+        self.strategy.read_shared.return_value = (Snapshot(True, 99, 123),)
+        self.assertEqual(LockState.SHARED, self.lock.get_lock_state())
+
+    def test_lock_state_ignores_own_shared_entry(self):
+        lock = self.lock
+        self.strategy.read_shared.return_value = (Snapshot(True, lock.pid, 123),)
+        self.assertEqual(LockState.UNLOCKED, lock.get_lock_state())
+
+    def test_acquire_waits_for_shared_holders_to_release_lock(self):
+        self.strategy.wait.return_value = True
+        self.strategy.read_shared.side_effect = [(Snapshot(True, 99, 123),)] * 2 + [()]
+        self.strategy.create.side_effect = lambda pid, meta=None: setattr(
+            self.strategy.read, 'return_value', Snapshot(True, pid, 123)) or True
+
+        self.assertEqual(LockState.OWNER, self.lock.acquire())
+
+        self.strategy.create.assert_called_once_with(self.lock.pid, {})
+        self.assertEqual(0, self.strategy.clean.call_count)
+
+    def test_acquire_gives_lock_up_when_shared_holders_do_not_release_it(self):
+        self.strategy.read_shared.return_value = (Snapshot(True, 99, 123),)
+
+        self.assertEqual(LockState.SHARED, self.lock.acquire(blocking=False))
+
+        self.strategy.create.assert_called_once_with(self.lock.pid, {})
+        self.strategy.clean.assert_called_once_with()
+
+    def test_pending_lock_is_removed_when_acquisition_is_abandoned(self):
+        strategy = Memory('a', Store())
+        strategy.create_shared(99)
+        lock = Lock(strategy, pid_owner_client=self.pid_owner_client)
+        steps = lock.acquire_steps()
+
+        self.assertEqual(LockState.SHARED, next(steps)[0])
+        self.assertTrue(strategy.exists())
+        steps.close()
+
+        self.assertFalse(strategy.exists())
+        # reservation of current thread is released as well
+        strategy.clean_shared(99)
+        states = []
+        thread = threading.Thread(target=lambda: states.append(lock.acquire(blocking=False)))
+        thread.start()
+        thread.join()
+        self.assertEqual([LockState.OWNER], states)
+
+    def test_pending_lock_is_removed_when_acquisition_fails(self):
+        strategy = Memory('a', Store())
+        strategy.create_shared(99)
+        lock = Lock(strategy, pid_owner_client=self.pid_owner_client,
+                    delay_provider=mock.MagicMock())
+
+        holders = strategy.read_shared()
+        with mock.patch.object(strategy, 'read_shared',
+                               side_effect=[holders, holders, IOError()]):
+            self.assertRaises(IOError, lock.acquire)
+
+        self.assertFalse(strategy.exists())
+        self.assertFalse(lock.has_lock)
+
+    def test_acquire_removes_dead_shared_holders(self):
+        self.pid_owner_client.is_alive.return_value = False
+        self.strategy.read_shared.return_value = (Snapshot(True, 99, 123),)
+
+        self.assertEqual(LockState.OWNER, self.lock.acquire(blocking=False))
+
+        self.strategy.clean_shared.assert_called_once_with(99)
+
+
+class LockThreadsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.strategy = mock.MagicMock(Base)
+        self.strategy.is_valid.return_value = True
+        self.strategy.manages_liveness = False
+        self.strategy.read.return_value = Snapshot()
+        self.strategy.read_shared.return_value = ()
+        self.strategy.create.side_effect = lambda pid, meta=None: setattr(
+            self.strategy.read, 'return_value', Snapshot(True, pid, 123)) or True
+        self.strategy.clean.side_effect = lambda: setattr(
+            self.strategy.read, 'return_value', Snapshot())
+        self.strategy.wait.return_value = False
+        self.lock = Lock(self.strategy, delay_provider=mock.MagicMock(),
+                         pid_owner_client=mock.MagicMock(spec=Client, **{'identify.return_value': {}}),
+                         retry_policy=Fixed(0.01, tries=3))
+
+    def in_thread(self, func, *args):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(func(*args)))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def test_thread_that_did_not_acquire_lock_does_not_own_it(self):
+        self.lock.acquire()
+        self.strategy.read.reset_mock()
+
+        self.assertTrue(self.lock.has_lock)
+        self.assertFalse(self.in_thread(lambda: self.lock.has_lock))
+        self.assertEqual(1, self.strategy.read.call_count)
+
+    def test_lock_held_by_other_thread_is_not_acquired_without_touching_strategy(self):
+        self.lock.acquire()
+        self.strategy.read.reset_mock()
+
+        self.assertEqual(LockState.LOCKED, self.in_thread(self.lock.acquire))
+
+        self.assertEqual(0, self.strategy.read.call_count)
+        self.strategy.create.assert_called_once_with(self.lock.pid, {})
+
+    def test_release_from_other_thread_does_not_remove_lock(self):
+        self.lock.acquire()
+        self.in_thread(self.lock.release)
+
+        self.assertEqual(0, self.strategy.clean.call_count)
+        self.assertTrue(self.lock.has_lock)
+
+    def test_waiting_thread_is_woken_up_when_lock_is_released(self):
+        self.lock.acquire()
+        other = Lock(self.strategy, delay_provider=mock.MagicMock(),
+                     pid_owner_client=mock.MagicMock(spec=Client, **{'identify.return_value': {}}))
+        result = []
+        thread = threading.Thread(target=lambda: result.append(other.acquire(timeout=5)))
+        thread.start()
+        time.sleep(0.05)
+        self.lock.release()
+        thread.join()
+
+        self.assertEqual([LockState.OWNER], result)
+        self.assertEqual(0, other._delay_provider.call_count)
+
+
+class ReentrantLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.strategy = mock.MagicMock(Base)
+        self.strategy.is_valid.return_value = True
+        self.strategy.manages_liveness = False
+        self.strategy.read.return_value = Snapshot()
+        self.strategy.read_shared.return_value = ()
+        self.strategy.create.side_effect = lambda pid, meta=None: setattr(
+            self.strategy.read, 'return_value', Snapshot(True, pid, 123)) or True
+        self.strategy.fingerprint.return_value = (1, 123)
+        self.current_time_provider = mock.MagicMock(return_value=100)
+        self.verify_interval = None
+
+    @property
+    def lock(self):
+        return Lock(self.strategy, delay_provider=mock.MagicMock(),
+                    current_time_provider=self.current_time_provider,
+                    pid_owner_client=mock.MagicMock(spec=Client, **{'identify.return_value': {}}),
+                    reentrant=True, verify_interval=self.verify_interval)
+
+    def test_nested_acquire_does_not_touch_strategy(self):
+        lock = self.lock
+        lock.acquire()
+        self.strategy.read.reset_mock()
+
+        self.assertTrue(lock.acquire().is_owner)
+        self.assertTrue(lock.has_lock)
+
+        self.assertEqual(0, self.strategy.read.call_count)
+        self.assertEqual(0, self.strategy.fingerprint.call_count)
+
+    def test_lock_is_removed_when_released_as_many_times_as_acquired(self):
+        lock = self.lock
+        lock.acquire()
+        lock.acquire()
+
+        lock.release()
+        self.assertEqual(0, self.strategy.clean.call_count)
+        self.assertTrue(lock.has_lock)
+
+        lock.release()
+        self.strategy.clean.assert_called_once_with()
+
+    def test_ownership_is_verified_periodically(self):
+        self.verify_interval = 10
+        lock = self.lock
+        lock.acquire()
+        self.strategy.read.reset_mock()
+
+        self.current_time_provider.return_value = 105
+        self.assertTrue(lock.has_lock)
+        self.assertEqual(1, self.strategy.fingerprint.call_count)
+
+        self.current_time_provider.return_value = 111
+        self.assertTrue(lock.has_lock)
+        self.assertEqual(2, self.strategy.fingerprint.call_count)
+        self.assertEqual(0, self.strategy.read.call_count)
+
+    def test_replaced_lock_record_means_lock_is_lost(self):
+        self.verify_interval = 0
+        lock = self.lock
+        lock.acquire()
+
+        self.strategy.fingerprint.return_value = (2, 130)
+        self.strategy.read.return_value = Snapshot(True, 99, 130)
+
+        self.assertFalse(lock.has_lock)
+        lock.release()
+        self.assertEqual(0, self.strategy.clean.call_count)
+
+
+class LeaseLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.strategy = mock.MagicMock(Base)
+        self.strategy.is_valid.return_value = True
+        self.strategy.manages_liveness = False
+        self.strategy.read.return_value = Snapshot()
+        self.strategy.read_shared.return_value = ()
+        self.strategy.create.side_effect = lambda pid, meta=None: setattr(
+            self.strategy.read, 'return_value', Snapshot(True, pid, 100, meta)) or True
+        self.renewed = threading.Event()
+        self.strategy.renew.side_effect = lambda: self.renewed.set() or True
+        self.pid_owner_client = mock.MagicMock(spec=Client, **{'identify.return_value': {}})
+        self.pid_owner_client.is_alive.return_value = True
+        self.current_time_provider = mock.MagicMock(return_value=100)
+        self.lock = Lock(self.strategy, max_age=1000, lease=10, renew_interval=0.01,
+                         delay_provider=mock.MagicMock(),
+                         current_time_provider=self.current_time_provider,
+                         pid_owner_client=self.pid_owner_client)
+        self.addCleanup(self.lock.release)
+
+    def test_lease_is_stored_in_lock_record(self):
+        self.lock.acquire()
+        self.strategy.create.assert_called_once_with(self.lock.pid, {'lease': '10'})
+
+    def test_lease_is_renewed_while_lock_is_held(self):
+        self.lock.acquire()
+        self.assertTrue(self.renewed.wait(5))
+
+    def test_lease_is_not_renewed_after_release(self):
+        self.lock.acquire()
+        self.lock.release()
+        self.strategy.renew.reset_mock()
+        self.renewed.clear()
+
+        self.assertFalse(self.renewed.wait(0.05))
+        self.assertEqual(0, self.strategy.renew.call_count)
+
+    def test_heartbeat_is_stopped_by_release_of_lost_lock(self):
+        self.lock.acquire()
+        self.assertTrue(self.renewed.wait(5))
+        heartbeat = self.lock._heartbeat
+        # lock record broken by other process
+        self.strategy.read.return_value = Snapshot()
+
+        self.lock.release()
+
+        self.assertFalse(heartbeat.is_running)
+        self.assertEqual(0, self.strategy.clean.call_count)
+
+    def test_heartbeat_stops_once_lock_record_is_lost(self):
+        self.lock.acquire()
+        self.assertTrue(self.renewed.wait(5))
+        heartbeat = self.lock._heartbeat
+        self.strategy.read.return_value = Snapshot(True, 99, 100)
+
+        heartbeat._thread.join(5)
+
+        self.assertFalse(heartbeat.is_running)
+
+    def test_lock_is_outdated_when_lease_of_other_owner_expired(self):
+        self.strategy.read.return_value = Snapshot(True, 99, 100, {'lease': '5'})
+
+        self.current_time_provider.return_value = 104
+        self.assertEqual(LockState.LOCKED, self.lock.get_lock_state())
+
+        self.current_time_provider.return_value = 106
+        self.assertEqual(LockState.OUTDATED, self.lock.get_lock_state())
+
+    def test_lease_of_lock_record_takes_precedence_over_max_age(self):
+        lock = Lock(self.strategy, max_age=1,
+                    current_time_provider=self.current_time_provider,
+                    pid_owner_client=self.pid_owner_client)
+        self.strategy.read.return_value = Snapshot(True, 99, 100, {'lease': '50'})
+        self.current_time_provider.return_value = 110
+
+        self.assertEqual(LockState.LOCKED, lock.get_lock_state())
+
+
+class HookedLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.strategy = mock.MagicMock(Base)
+        self.strategy.is_valid.return_value = True
+        self.strategy.manages_liveness = False
+        self.strategy.read.return_value = Snapshot()
+        self.strategy.read_shared.return_value = ()
+        self.strategy.create.side_effect = lambda pid, meta=None: setattr(
+            self.strategy.read, 'return_value', Snapshot(True, pid, 100, meta)) or True
+        self.pid_owner_client = mock.MagicMock(spec=Client, **{'identify.return_value': {}})
+        self.current_time_provider = mock.MagicMock(return_value=100)
+        self.hook = mock.MagicMock(Hook)
+        self.lock = Lock(self.strategy, max_age=10, delay_provider=mock.MagicMock(),
+                         current_time_provider=self.current_time_provider,
+                         pid_owner_client=self.pid_owner_client,
+                         hooks=[self.hook])
+
+    def test_hook_is_notified_about_acquisition_and_release(self):
+        self.lock.acquire()
+        self.current_time_provider.return_value = 105
+        self.lock.release()
+
+        self.assertEqual([mock.call.acquire_started(self.lock),
+                          mock.call.state_decided(self.lock, LockState.OWNER),
+                          mock.call.acquire_finished(self.lock, LockState.OWNER, 1, 0),
+                          mock.call.released(self.lock, 5)],
+                         self.hook.method_calls)
+
+    def test_hook_is_notified_about_waiting(self):
+        self.pid_owner_client.is_alive.return_value = True
+        self.strategy.read.return_value = Snapshot(True, 99, 100)
+
+        self.assertEqual(LockState.LOCKED, self.lock.acquire())
+
+        self.assertEqual(2, self.hook.waited.call_count)
+        self.assertEqual(3, self.hook.state_decided.call_count)
+        self.hook.acquire_finished.assert_called_once_with(self.lock, LockState.LOCKED, 3, 0)
+
+    def test_hook_is_notified_about_cleanup_and_kill(self):
+        outdated = Snapshot(True, 99, 50)
+        self.strategy.read.return_value = outdated
+        self.pid_owner_client.is_alive.return_value = True
+        self.pid_owner_client.terminate.return_value = True
+
+        self.lock.acquire()
+
+        self.hook.killed.assert_called_once_with(self.lock, outdated, True)
+        self.hook.cleaned.assert_called_once_with(self.lock, outdated)
+
+    def test_hook_is_notified_about_failed_acquisition(self):
+        self.strategy.create.side_effect = None
+        self.strategy.create.return_value = False
+
+        self.assertRaises(CouldNotCreateLockError, self.lock.acquire)
+
+        self.assertEqual(None, self.hook.acquire_finished.call_args[0][1])
+
+    def test_lock_without_hooks_does_not_wrap_acquisition(self):
+        lock = Lock(self.strategy, pid_owner_client=self.pid_owner_client)
+        self.assertEqual('_acquire_steps', lock.acquire_steps().__name__)
+
+
+class FencingLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.strategy = mock.MagicMock(Base)
+        self.strategy.is_valid.return_value = True
+        self.strategy.manages_liveness = False
+        self.strategy.read.return_value = Snapshot()
+        self.strategy.read_shared.return_value = ()
+        self.strategy.create.side_effect = lambda pid, meta=None: setattr(
+            self.strategy.read, 'return_value', Snapshot(True, pid, 100, meta)) or True
+        self.strategy.clean.side_effect = lambda: setattr(
+            self.strategy.read, 'return_value', Snapshot())
+        tokens = [7, 8]
+        # token is issued only for record held by given pid
+        self.strategy.issue_token.side_effect = lambda pid: tokens.pop(0) if \
+            self.strategy.read.return_value.pid == pid else None
+        self.pid_owner_client = mock.MagicMock(spec=Client, **{'identify.return_value': {}})
+        self.lock = Lock(self.strategy, delay_provider=mock.MagicMock(),
+                         pid_owner_client=self.pid_owner_client, fencing=True)
+
+    def test_token_is_issued_once_lock_record_is_created(self):
+        self.assertTrue(self.lock.acquire().is_owner)
+
+        self.strategy.create.assert_called_once_with(self.lock.pid, {})
+        self.strategy.issue_token.assert_called_once_with(self.lock.pid)
+        self.assertEqual(7, self.lock.token)
+
+    def test_contender_whose_record_is_broken_before_token_is_issued_is_not_owner(self):
+        store = Store()
+        strategy, other = Memory('a', store), Memory('a', store)
+        create = strategy.create
+
+        def stalled_create(pid, meta=None):
+            created = create(pid, meta)
+            # record of stalled contender is broken and taken over
+            other.clean()
+            other.create(999)
+            self.assertEqual(1, other.issue_token(999))
+            return created
+
+        lock = Lock(strategy, pid_owner_client=self.pid_owner_client, fencing=True)
+        with mock.patch.object(strategy, 'create', side_effect=stalled_create):
+            self.assertEqual(LockState.LOCKED, lock.acquire(blocking=False))
+        self.assertIsNone(lock.token)
+        self.assertEqual(999, other.read_pid())
+
+        other.clean()
+        self.assertTrue(lock.acquire(blocking=False).is_owner)
+        self.assertEqual(2, lock.token)
+
+    def test_each_acquisition_gets_new_token(self):
+        self.lock.acquire()
+        self.lock.release()
+        self.assertIsNone(self.lock.token)
+
+        self.lock.acquire()
+        self.assertEqual(8, self.lock.token)
+
+    def test_token_is_kept_by_reentrant_acquisition(self):
+        lock = Lock(self.strategy, pid_owner_client=self.pid_owner_client,
+                    reentrant=True, fencing=True)
+        lock.acquire()
+        lock.acquire()
+
+        self.assertEqual(7, lock.token)
+        self.assertEqual(1, self.strategy.issue_token.call_count)
+
+    def test_token_is_not_visible_to_other_threads(self):
+        self.lock.acquire()
+        tokens = []
+        thread = threading.Thread(target=lambda: tokens.append(self.lock.token))
+        thread.start()
+        thread.join()
+
+        self.assertEqual([None], tokens)
+
+    def test_token_is_not_issued_without_fencing(self):
+        lock = Lock(self.strategy, pid_owner_client=self.pid_owner_client)
+        lock.acquire()
+
+        self.assertFalse(self.strategy.issue_token.called)
+        self.assertIsNone(lock.token)
+
+
+class FairLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.strategy = Memory('a', Store())
+        # strategy.wait would block for real
+        self.strategy.wait = mock.MagicMock(return_value=False)
+        self.strategy.wait_dequeued = mock.MagicMock(return_value=False)
+        self.alive = set([123, 456])
+        self.pid_owner_client = mock.MagicMock(spec=Client, **{'identify.return_value': {}})
+        self.pid_owner_client.is_alive.side_effect = lambda pid, meta=None: pid in self.alive
+        self.delay_provider = mock.MagicMock()
+        self.lock = Lock(self.strategy, delay_provider=self.delay_provider,
+                         pid_owner_client=self.pid_owner_client, fair=True)
+
+    def test_lock_is_acquired_right_away_when_nobody_waits(self):
+        self.assertTrue(self.lock.acquire().is_owner)
+
+        self.assertEqual((), self.strategy.read_queue())
+        self.assertFalse(self.delay_provider.called)
+
+    def test_free_lock_is_not_taken_over_from_waiters(self):
+        self.strategy.enqueue(123)
+
+        self.assertEqual(LockState.LOCKED, self.lock.acquire(blocking=False))
+        self.assertFalse(self.strategy.exists())
+
+    def test_waiter_joins_queue_once_and_leaves_it_when_giving_up(self):
+        self.strategy.create(123)
+        queues = []
+        self.delay_provider.side_effect = lambda delay: queues.append(self.strategy.read_queue())
+
+        self.assertEqual(LockState.LOCKED, self.lock.acquire())
+
+        self.assertEqual(2, len(queues))
+        self.assertEqual([1, 1], [ticket for ((ticket, _),) in queues])
+        self.assertEqual(self.lock.pid, queues[0][0][1].pid)
+        self.assertEqual((), self.strategy.read_queue())
+
+    def test_waiter_gets_lock_once_waiters_ahead_of_it_are_served(self):
+        self.strategy.enqueue(123)
+        self.strategy.enqueue(456)
+        self.delay_provider.side_effect = lambda delay: self.strategy.dequeue(
+            self.strategy.read_queue()[0][0])
+
+        self.assertTrue(self.lock.acquire().is_owner)
+
+        # turn in queue is checked without waiting for whole retry delay
+        self.assertEqual(2, self.lock.last_attempts)
+        self.assertEqual([mock.call(0.05)] * 2, self.delay_provider.call_args_list)
+        self.assertEqual((), self.strategy.read_queue())
+        # nothing to wait for but turn in queue
+        self.assertFalse(self.strategy.wait.called)
+
+    def test_waiter_behind_others_wakes_once_waiter_ahead_leaves_queue(self):
+        self.strategy.enqueue(123)
+        self.strategy.enqueue(456)
+        self.strategy.wait_dequeued.side_effect = lambda ticket, timeout: (
+            self.strategy.dequeue(1), self.strategy.dequeue(ticket))
+        lock = Lock(self.strategy, retry_policy=Fixed(5, tries=2),
+                    delay_provider=self.delay_provider,
+                    pid_owner_client=self.pid_owner_client, fair=True)
+
+        self.assertTrue(lock.acquire().is_owner)
+
+        self.strategy.wait_dequeued.assert_called_once_with(2, 5)
+        self.assertFalse(self.delay_provider.called)
+
+    def test_waiter_checks_only_waiter_directly_ahead_of_it(self):
+        for pid in (123, 789, 456):
+            self.strategy.enqueue(pid)
+        self.pid_owner_client.is_alive.reset_mock()
+
+        self.assertEqual(LockState.LOCKED, self.lock.acquire(blocking=False))
+
+        self.pid_owner_client.is_alive.assert_called_once_with(456, mock.ANY)
+        # dead waiter further ahead is left to its successor
+        self.assertEqual([123, 789, 456], [snapshot.pid for _, snapshot
+                                           in self.strategy.read_queue()])
+
+    def test_steps_of_waiter_behind_others_are_sliced(self):
+        self.strategy.enqueue(123)
+        lock = Lock(self.strategy, retry_policy=Fixed(0.2, tries=2),
+                    pid_owner_client=self.pid_owner_client, fair=True)
+
+        delays = [delay for _, delay in lock.acquire_steps()]
+
+        self.assertEqual(None, delays.pop())
+        self.assertGreater(len(delays), 2)
+        self.assertAlmostEqual(0.2, sum(delays))
+        self.assertFalse(self.strategy.wait_dequeued.called)
+
+    def test_waiter_behind_others_waits_whole_delay_in_slices(self):
+        self.strategy.enqueue(123)
+        lock = Lock(self.strategy, retry_policy=Fixed(0.2, tries=2),
+                    delay_provider=self.delay_provider,
+                    pid_owner_client=self.pid_owner_client, fair=True)
+
+        self.assertEqual(LockState.LOCKED, lock.acquire())
+
+        self.assertEqual(2, lock.last_attempts)
+        delays = [delay for ((delay,), _) in self.delay_provider.call_args_list]
+        self.assertGreater(len(delays), 2)
+        self.assertLessEqual(max(delays), 0.1)
+        self.assertAlmostEqual(0.2, sum(delays))
+
+    def test_strategy_without_queue_is_rejected_right_away(self):
+        strategy = mock.MagicMock(Base)
+        strategy.queues_waiters = False
+
+        self.assertRaises(NotImplementedError, Lock, strategy, fair=True)
+        Lock(strategy)
+
+    def test_first_waiter_waits_for_lock_release(self):
+        self.strategy.create(123)
+        self.strategy.enqueue(456)
+        self.strategy.wait.side_effect = lambda timeout: self.strategy.clean() or True
+        self.delay_provider.side_effect = lambda delay: self.strategy.dequeue(1)
+
+        self.assertTrue(self.lock.acquire().is_owner)
+
+        self.assertEqual(1, self.delay_provider.call_count)
+        self.assertEqual(1, self.strategy.wait.call_count)
+
+    def test_tickets_of_dead_waiters_are_removed(self):
+        self.strategy.enqueue(789)
+
+        self.assertTrue(self.lock.acquire(blocking=False).is_owner)
+        self.assertEqual((), self.strategy.read_queue())
+
+    def test_ticket_is_removed_when_acquisition_is_abandoned(self):
+        self.strategy.create(123)
+        steps = self.lock.acquire_steps()
+
+        self.assertEqual(LockState.LOCKED, next(steps)[0])
+        self.assertEqual(1, len(self.strategy.read_queue()))
+        steps.close()
+        self.assertEqual((), self.strategy.read_queue())
+
+    def test_waiters_are_served_in_order_of_arrival(self):
+        self.strategy.create(123)
+        owners = []
+
+        def wait(lock, name):
+            self.assertTrue(lock.acquire(timeout=5).is_owner)
+            owners.append(name)
+            lock.release()
+
+        threads = []
+        for name in range(3):
+            lock = Lock(self.strategy, pid_owner_client=self.pid_owner_client, fair=True,
+                        retry_policy=Fixed(0.01, None), delay_provider=time.sleep)
+            threads.append(threading.Thread(target=wait, args=(lock, name)))
+            threads[-1].start()
+            # next waiter arrives once previous one has joined the queue
+            while len(self.strategy.read_queue()) <= name:
+                time.sleep(0.001)
+        self.strategy.clean()
+
+        for thread in threads:
+            thread.join()
+        self.assertEqual([0, 1, 2], owners)
+
+
+class LockForkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.strategy = mock.MagicMock(Base)
+        self.strategy.is_valid.return_value = True
+        self.strategy.manages_liveness = False
+        self.strategy.read.return_value = Snapshot()
+        self.strategy.read_shared.return_value = ()
+        self.strategy.create.side_effect = lambda pid, meta=None: setattr(
+            self.strategy.read, 'return_value', Snapshot(True, pid, 123)) or True
+        self.lock = Lock(self.strategy, delay_provider=mock.MagicMock(),
+                         pid_owner_client=mock.MagicMock(spec=Client, **{'identify.return_value': {}}),
+                         reentrant=True)
+
+    def in_child(self, func):
+        pid = os.fork()
+        if pid == 0: # pragma: no cover
+            try:
+                os._exit(0 if func() else 1)
+            except:
+                os._exit(2)
+        return os.waitpid(pid, 0)[1] == 0
+
+    def test_child_process_has_its_own_pid(self):
+        parent_pid = self.lock.pid
+        self.assertTrue(self.in_child(lambda: self.lock.pid == os.getpid() != parent_pid))
+
+    def test_child_process_does_not_own_lock_inherited_from_parent(self):
+        self.lock.acquire()
+        self.assertTrue(self.in_child(lambda: not self.lock.has_lock))
+
+    def test_child_process_does_not_release_lock_inherited_from_parent(self):
+        self.lock.acquire()
+
+        def release():
+            self.lock.release()
+            return self.strategy.clean.call_count == 0
+        self.assertTrue(self.in_child(release))
+
+    def test_child_process_may_acquire_lock_on_its_own(self):
+        self.lock.acquire()
+
+        def acquire():
+            self.strategy.read.return_value = Snapshot()
+            self.lock.acquire()
+            self.lock.release()
+            return self.strategy.clean.call_count == 1
+        self.assertTrue(self.in_child(acquire))
+
+
+class SharedLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.strategy = mock.MagicMock(Base)
+        self.strategy.is_valid.return_value = True
+        self.strategy.manages_liveness = False
+        self.strategy.create_shared.return_value = True
+        self.strategy.read.return_value = Snapshot()
+        self.strategy.read_shared.return_value = ()
+        self.delay_provider = mock.MagicMock()
+        self.pid_owner_client = mock.MagicMock(spec=Client, **{'identify.return_value': {}})
+        self.current_time_provider = mock.MagicMock()
+        self.max_age = 10
+
+    @property
+    def lock(self):
+        return SharedLock(self.strategy, max_age=self.max_age,
+                          delay_provider=self.delay_provider,
+                          current_time_provider=self.current_time_provider,
+                          pid_owner_client=self.pid_owner_client)
+
+    def own(self, pid):
+        self.strategy.read_shared.return_value = (Snapshot(True, pid, 123),)
+
+    def test_acquire_joins_other_shared_holders(self):
+        lock = self.lock
+        self.strategy.create_shared.side_effect = lambda pid, meta=None: self.own(pid) or True
+        self.strategy.read_shared.return_value = (Snapshot(True, 99, 123),)
+
+        self.assertEqual(LockState.OWNER, lock.acquire())
+
+        self.strategy.create_shared.assert_called_once_with(lock.pid, {})
+        self.assertEqual(0, self.strategy.create.call_count)
+        self.assertTrue(lock.has_lock)
+
+    def test_acquire_returns_LOCKED_when_exclusive_lock_is_held(self):
+        self.strategy.read.return_value = Snapshot(True, 99, 123)
+        self.current_time_provider.return_value = 123
+
+        self.assertEqual(LockState.LOCKED, self.lock.acquire(blocking=False))
+        self.assertEqual(0, self.strategy.create_shared.call_count)
+
+    def test_acquire_backs_off_when_exclusive_lock_appears_meanwhile(self):
+        self.current_time_provider.return_value = 123
+        self.strategy.read.side_effect = [Snapshot()] * 2 + [Snapshot(True, 99, 123)]
+
+        lock = self.lock
+        self.assertEqual(LockState.LOCKED, lock.acquire(blocking=False))
+
+        self.strategy.clean_shared.assert_called_once_with(lock.pid)
+
+    def test_acquire_joins_when_current_process_holds_exclusive_lock(self):
+        lock = self.lock
+        self.strategy.read.return_value = Snapshot(True, lock.pid, 123)
+
+        self.assertEqual(LockState.OWNER, lock.acquire(blocking=False))
+        self.strategy.create_shared.assert_called_once_with(lock.pid, {})
+
+    def test_acquire_called_multiple_times_locks_only_once(self):
+        lock = self.lock
+        self.assertTrue(lock.acquire().is_owner)
+        self.own(lock.pid)
+        self.assertTrue(lock.acquire().is_owner)
+
+        self.strategy.create_shared.assert_called_once_with(lock.pid, {})
+
+    def test_acquire_raises_exception_when_lock_can_be_obtained_but_failed_to_create(self):
+        self.strategy.create_shared.return_value = False
+        self.assertRaises(CouldNotCreateLockError, self.lock.acquire)
+
+    def test_release_removes_lock(self):
+        lock = self.lock
+        self.own(lock.pid)
+
+        self.assertIsInstance(lock.release(), Lock)
+
+        self.strategy.clean_shared.assert_called_once_with(lock.pid)
+        self.assertEqual(0, self.strategy.clean.call_count)
+
+    def test_Lock_object_acts_as_context_manager(self):
+        with self.lock as lock:
+            self.strategy.create_shared.assert_called_once_with(lock.pid, {})
+            self.own(lock.pid)
+            self.assertTrue(lock.has_lock)
+
+        self.strategy.clean_shared.assert_called_once_with(lock.pid)
+
+    def test_lock_state_is_UNLOCKED_when_lock_is_held_by_other_shared_holders(self):
+        self.own(99)
+        self.assertEqual(LockState.UNLOCKED, self.lock.get_lock_state())
+
+    def test_shared_holder_owns_lock_while_exclusive_lock_is_awaited(self):
+        lock = self.lock
+        self.own(lock.pid)
+        self.current_time_provider.return_value = 123
+        self.strategy.read.return_value = Snapshot(True, 99, 123)
+
+        self.assertTrue(lock.has_lock)
+        lock.release()
+        self.strategy.clean_shared.assert_called_once_with(lock.pid)
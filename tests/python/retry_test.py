@@ -0,0 +1,85 @@
+# encoding: utf-8
+""" Tests for pylock.retry module """
+from pylock._compat import mock
+import unittest
+import itertools
+
+from pylock.retry import Fixed, Exponential, DecorrelatedJitter, Deadline
+
+
+def take(policy, count=10):
+    return list(itertools.islice(policy.delays(), count))
+
+
+class FixedTest(unittest.TestCase):
+
+    def test_delays_are_the_same_for_each_try(self):
+        self.assertEqual([2, 2], take(Fixed(2, tries=3)))
+
+    def test_unlimited_tries(self):
+        self.assertEqual([1] * 10, take(Fixed(1, tries=None)))
+
+    def test_single_try_does_not_retry(self):
+        self.assertEqual([], take(Fixed(1, tries=1)))
+
+
+class ExponentialTest(unittest.TestCase):
+
+    def test_delay_grows_exponentially_up_to_max_delay(self):
+        policy = Exponential(base=1, factor=2, max_delay=10, jitter=False)
+        self.assertEqual([1, 2, 4, 8, 10, 10], take(policy, 6))
+
+    def test_jitter_randomizes_delay(self):
+        random_provider = mock.MagicMock(return_value=0.5)
+        policy = Exponential(base=1, factor=2, max_delay=10,
+                             random_provider=random_provider)
+        self.assertEqual([0.5, 1, 2], take(policy, 3))
+
+    def test_delays_are_limited_by_tries(self):
+        self.assertEqual(2, len(take(Exponential(tries=3))))
+
+    def test_delay_stays_at_max_delay_when_waiting_forever(self):
+        policy = Exponential(base=0.05, factor=2, max_delay=5, jitter=False)
+        self.assertEqual([5] * 100, take(policy, 1200)[-100:])
+
+    def test_deadline_waiting_forever_keeps_drawing_delays(self):
+        policy = Deadline(-1, Exponential(jitter=False), lambda: 0)
+        self.assertEqual(5, take(policy, 1200)[-1])
+
+
+class DecorrelatedJitterTest(unittest.TestCase):
+
+    def test_delay_is_picked_between_base_and_three_times_previous_delay(self):
+        random_provider = mock.MagicMock(side_effect=lambda low, high: high)
+        policy = DecorrelatedJitter(base=1, max_delay=20,
+                                    random_provider=random_provider)
+
+        self.assertEqual([3, 9, 20, 20], take(policy, 4))
+        self.assertEqual(mock.call(1, 9), random_provider.call_args_list[1])
+
+    def test_delays_are_limited_by_tries(self):
+        self.assertEqual(4, len(take(DecorrelatedJitter(tries=5))))
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.current_time_provider = mock.MagicMock(return_value=100)
+
+    def test_delays_are_clipped_to_time_left(self):
+        self.current_time_provider.side_effect = [100, 101, 105, 109, 110]
+        policy = Deadline(10, Fixed(2, tries=None), self.current_time_provider)
+        self.assertEqual([2, 2, 1], take(policy))
+
+    def test_last_delay_is_repeated_when_wrapped_policy_runs_out_of_tries(self):
+        policy = Deadline(10, Fixed(2, tries=2), self.current_time_provider)
+        self.assertEqual([2, 2, 2], take(policy, 3))
+
+    def test_policy_without_retries_falls_back_to_default_delay(self):
+        policy = Deadline(10, Fixed(1, tries=1), self.current_time_provider)
+        self.assertEqual([2, 2], take(policy, 2))
+
+    def test_negative_timeout_waits_forever(self):
+        policy = Deadline(-1, Fixed(1, tries=None), self.current_time_provider)
+        self.assertEqual([1] * 10, take(policy))
+        self.assertEqual(0, self.current_time_provider.call_count)
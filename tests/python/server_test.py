@@ -0,0 +1,115 @@
+# encoding: utf-8
+""" Tests for pylock.server module """
+from pylock._compat import mock
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+from pylock.server import LockServer
+from pylock.strategy import Snapshot
+from pylock.strategy.remote import LockClient, RemoteError
+
+
+class LockServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('pylock_test_server')
+        self.path = os.path.join(self.directory, 'pylock.sock')
+        self.current_time_provider = mock.MagicMock(return_value=123)
+        self.server = LockServer(self.path, self.current_time_provider).start(0.01)
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.server.shutdown()
+        shutil.rmtree(self.directory)
+
+    def client(self, **options):
+        client = LockClient(self.path, **options)
+        self.clients.append(client)
+        return client
+
+    def test_locks_of_client_are_released_when_it_disconnects(self):
+        first, second = self.client(), self.client()
+        first.lock('a').create(1)
+        first.lock('b').create_shared(1)
+        first.lock('b').enqueue(1)
+        second.lock('c').create(2)
+
+        first.close()
+
+        deadline = time.time() + 5
+        while len(second.held()) > 1 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual({'c': Snapshot(True, 2, 123)}, second.held())
+        self.assertEqual((), second.lock('b').read_shared())
+        self.assertEqual((), second.lock('b').read_queue())
+
+    def test_locks_are_kept_while_any_connection_of_client_is_open(self):
+        client = self.client(pool_size=0)
+        client.lock('a').create(1)
+
+        # connection used by request is closed right away
+        self.assertTrue(client.lock('a').exists())
+        self.assertTrue(self.client().lock('a').exists())
+
+    def test_requests_are_pipelined(self):
+        client = self.client()
+
+        results = client.call_many([{'op': 'create', 'name': 'a', 'pid': 1},
+                                    {'op': 'create', 'name': 'a', 'pid': 2},
+                                    {'op': 'fingerprint', 'name': 'a'}])
+
+        self.assertEqual([True, False, 1], results)
+
+    def test_invalid_requests_are_rejected(self):
+        client = self.client()
+
+        self.assertRaises(RemoteError, client.call, 'connect', session='x')
+        self.assertRaises(RemoteError, client.call, 'create', name='a')
+        # connection stays usable
+        self.assertTrue(client.lock('a').create(1))
+
+    def test_tokens_keep_growing_after_restart(self):
+        self.current_time_provider.return_value = 1
+        lock = self.client().lock('a')
+        lock.create(1)
+        token = lock.issue_token(1)
+        self.assertEqual(1000001, token)
+        self.server.shutdown()
+
+        self.server = LockServer(self.path, self.current_time_provider).start(0.01)
+        self.current_time_provider.return_value = 2
+        lock = self.client().lock('a')
+        lock.create(1)
+        self.assertLess(token, lock.issue_token(1))
+
+    def test_tcp_socket_is_supported(self):
+        with LockServer(('127.0.0.1', 0)).start(0.01) as server:
+            client = LockClient(server.address)
+            try:
+                self.assertTrue(client.lock('a').create(1))
+                self.assertEqual(1, client.lock('a').read_pid())
+            finally:
+                client.close()
+
+    def test_socket_is_removed_on_shutdown(self):
+        self.server.shutdown()
+        self.assertFalse(os.path.exists(self.path))
+        self.server = LockServer(self.path)
+
+    def test_stale_socket_is_replaced(self):
+        self.server.shutdown()
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.path)
+        stale.close()
+
+        self.server = LockServer(self.path).start(0.01)
+        self.assertTrue(self.client().lock('a').create(1))
+
+    def test_second_server_is_refused(self):
+        self.assertRaises(OSError, LockServer, self.path)
@@ -3,11 +3,15 @@
 
 import errno
 import os
+import shutil
 import time
 from pylock._compat import mock
 import unittest
 import tempfile
+import threading
 
+from pylock import CouldNotCreateLockError, _inotify
+from pylock.strategy import Snapshot
 from pylock.strategy.file import File
 
 
@@ -20,10 +24,13 @@ class FileTest(unittest.TestCase):
         self.strategy = File(self.path, self.atomic_writer)
 
     def tearDown(self):
-        try:
-            os.remove(self.path)
-        except:
-            pass
+        for path in (self.path, self.path + '.token'):
+            try:
+                os.remove(path)
+            except:
+                pass
+        shutil.rmtree(self.path + '.shared', ignore_errors=True)
+        shutil.rmtree(self.path + '.queue', ignore_errors=True)
 
     def test_exists_checks_if_file_exists(self):
         self.assertTrue(self.strategy.exists())
@@ -34,6 +41,11 @@ class FileTest(unittest.TestCase):
         self.strategy.create('foo_pid')
         self.atomic_writer.assert_called_once_with(self.path, 'foo_pid')
 
+    def test_create_writes_process_identity_after_pid(self):
+        self.strategy.create(123, {'start_time': '42', 'boot_id': 'abc'})
+        self.atomic_writer.assert_called_once_with(self.path,
+                                                   '123\nboot_id=abc\nstart_time=42')
+
     def test_create_suppresses_any_exceptions(self):
         self.atomic_writer.side_effect = IOError()
         self.strategy.create('bar_pid')
@@ -44,6 +56,48 @@ class FileTest(unittest.TestCase):
         self.atomic_writer.side_effect = RuntimeError()
         self.strategy.create('bar_pid')
 
+    def test_create_reports_lockfile_which_can_never_be_created(self):
+        for code in (errno.ENOENT, errno.EACCES, errno.EROFS):
+            self.atomic_writer.side_effect = OSError(code, os.strerror(code))
+            with self.assertRaises(CouldNotCreateLockError) as context:
+                self.strategy.create('bar_pid')
+            self.assertTrue(context.exception.permanent)
+
+        self.atomic_writer.side_effect = OSError(errno.EEXIST, 'exists')
+        self.assertFalse(self.strategy.create('bar_pid'))
+
+    def test_issued_tokens_grow_across_lockfiles(self):
+        strategy = File(self.path)
+        os.remove(self.path)
+        self.assertIsNone(strategy.issue_token(123))
+        strategy.create(123, {'start_time': '42'})
+        self.assertIsNone(strategy.issue_token(456))
+
+        self.assertEqual(1, strategy.issue_token(123))
+        self.assertEqual({'start_time': '42', 'token': '1'}, strategy.read().meta)
+
+        strategy.clean()
+        strategy.create(456)
+        self.assertEqual(2, File(self.path).issue_token(456))
+        with open(self.path + '.token') as stream:
+            self.assertEqual('2', stream.read())
+
+    def test_token_is_not_issued_when_lockfile_is_replaced_meanwhile(self):
+        strategy = File(self.path)
+        os.remove(self.path)
+        strategy.create(123)
+        next_token = strategy._next_token
+
+        def replace():
+            strategy.clean()
+            strategy.create(456)
+            return next_token()
+
+        with mock.patch.object(strategy, '_next_token', side_effect=replace):
+            self.assertIsNone(strategy.issue_token(123))
+        self.assertEqual({}, strategy.read().meta)
+        self.assertEqual(2, strategy.issue_token(456))
+
     def test_clean_removes_lock_file(self):
         self.assertTrue(self.strategy.exists())
         self.strategy.clean()
@@ -75,6 +129,30 @@ class FileTest(unittest.TestCase):
             stream.write('asd')
         self.assertIsNone(self.strategy.read_pid())
 
+    def test_read_returns_snapshot_of_lock_file(self):
+        with open(self.path, 'w') as stream:
+            stream.write('123\nfoo=bar\n')
+
+        snapshot = self.strategy.read()
+
+        self.assertTrue(snapshot.exists)
+        self.assertEqual(123, snapshot.pid)
+        self.assertEqual(os.stat(self.path).st_mtime, snapshot.create_date)
+        self.assertEqual({'foo': 'bar'}, snapshot.meta)
+
+    def test_read_returns_empty_snapshot_when_file_does_not_exist(self):
+        self.strategy.clean()
+        self.assertEqual(Snapshot(), self.strategy.read())
+
+    def test_read_returns_snapshot_without_pid_when_file_does_not_contain_integer(self):
+        with open(self.path, 'w') as stream:
+            stream.write('asd')
+
+        snapshot = self.strategy.read()
+
+        self.assertTrue(snapshot.exists)
+        self.assertIsNone(snapshot.pid)
+
     def test_get_create_date_returns_time_when_pid_file_was_created(self):
         self.assertLessEqual(time.time() - self.strategy.get_create_date(), 1)
 
@@ -82,3 +160,218 @@ class FileTest(unittest.TestCase):
     def test_get_create_date_returns_0_when_OSError_occurs(self, os_mock):
         os_mock.stat.side_effect = OSError(errno.EPERM, 'EPERM')
         self.assertEqual(0, self.strategy.get_create_date())
+
+    @unittest.skipUnless(_inotify.is_available(), 'inotify is not available')
+    def test_wait_returns_as_soon_as_lock_file_is_removed(self):
+        timer = threading.Timer(0.05, os.remove, [self.path])
+        timer.start()
+        start = time.time()
+
+        self.assertTrue(self.strategy.wait(5))
+
+        self.assertLess(time.time() - start, 1)
+        timer.join()
+
+    @unittest.skipUnless(_inotify.is_available(), 'inotify is not available')
+    def test_wait_returns_immediately_when_lock_file_is_missing(self):
+        os.remove(self.path)
+        start = time.time()
+
+        self.assertTrue(self.strategy.wait(5))
+
+        self.assertLess(time.time() - start, 1)
+
+    @unittest.skipUnless(_inotify.is_available(), 'inotify is not available')
+    def test_wait_ignores_changes_of_other_files(self):
+        (fd, other) = tempfile.mkstemp('.pid', 'pylock_test_lockfile')
+        os.close(fd)
+        timer = threading.Timer(0.01, os.remove, [other])
+        timer.start()
+
+        self.assertTrue(self.strategy.wait(0.2))
+
+        self.assertTrue(self.strategy.exists())
+        timer.join()
+
+    def test_lock_file_is_looked_up_relative_to_given_directory_descriptor(self):
+        dir_fd = os.open(os.path.dirname(self.path), os.O_RDONLY)
+        try:
+            strategy = File(self.path, self.atomic_writer, dir_fd=dir_fd)
+            with open(self.path, 'w') as stream:
+                stream.write('123')
+
+            self.assertTrue(strategy.exists())
+            self.assertEqual(123, strategy.read().pid)
+            self.assertGreater(strategy.get_create_date(), 0)
+
+            strategy.clean()
+            self.assertFalse(strategy.exists())
+        finally:
+            os.close(dir_fd)
+
+    def test_lock_file_is_created_relative_to_given_directory_descriptor(self):
+        dir_fd = os.open(os.path.dirname(self.path), os.O_RDONLY)
+        try:
+            strategy = File(self.path, self.atomic_writer, dir_fd=dir_fd)
+            self.assertTrue(strategy.create('foo_pid'))
+        finally:
+            os.close(dir_fd)
+
+        self.atomic_writer.assert_called_once_with(os.path.basename(self.path), 'foo_pid',
+                                                   dir_fd=dir_fd)
+
+    def test_queue_and_shared_holders_are_kept_relative_to_given_directory_descriptor(self):
+        directory = tempfile.mkdtemp('pylock_test_dir_fd')
+        dir_fd = os.open(directory, os.O_RDONLY)
+        moved = directory + '.moved'
+        # path of directory is not resolved once it has been opened
+        os.rename(directory, moved)
+        try:
+            strategy = File(os.path.join(directory, 'a.pid'), dir_fd=dir_fd)
+
+            self.assertTrue(strategy.create(123))
+            self.assertEqual(1, strategy.issue_token(123))
+            ticket = strategy.enqueue(456)
+            self.assertTrue(strategy.create_shared(789))
+            self.assertEqual(['a.pid', 'a.pid.queue', 'a.pid.shared', 'a.pid.token'],
+                             sorted(os.listdir(moved)))
+            self.assertEqual(123, strategy.read().pid)
+            self.assertEqual([456], [snapshot.pid for _, snapshot in strategy.read_queue()])
+            self.assertEqual([789], [snapshot.pid for snapshot in strategy.read_shared()])
+
+            strategy.dequeue(ticket)
+            strategy.clean_shared(789)
+            strategy.clean()
+            self.assertEqual((), strategy.read_queue())
+            self.assertEqual((), strategy.read_shared())
+            self.assertFalse(os.path.exists(os.path.join(moved, 'a.pid')))
+        finally:
+            os.close(dir_fd)
+            shutil.rmtree(moved)
+
+    def test_read_shared_returns_empty_tuple_when_nobody_holds_shared_lock(self):
+        self.assertEqual((), self.strategy.read_shared())
+
+    def test_create_shared_registers_shared_lock_holders(self):
+        self.assertTrue(self.strategy.create_shared(123))
+        self.assertTrue(self.strategy.create_shared(456))
+
+        holders = sorted(self.strategy.read_shared())
+
+        self.assertEqual([123, 456], [holder.pid for holder in holders])
+        self.assertTrue(all(holder.exists for holder in holders))
+        self.assertLessEqual(time.time() - holders[0].create_date, 1)
+
+    def test_read_shared_returns_identity_of_shared_lock_holders(self):
+        self.strategy.create_shared(123, {'start_time': '42'})
+
+        (snapshot,) = self.strategy.read_shared()
+        self.assertEqual(123, snapshot.pid)
+        self.assertEqual({'start_time': '42'}, snapshot.meta)
+
+    def test_clean_shared_unregisters_shared_lock_holder(self):
+        self.strategy.create_shared(123)
+        self.strategy.create_shared(456)
+
+        self.strategy.clean_shared(123)
+        self.strategy.clean_shared(789)
+
+        self.assertEqual([456], [holder.pid for holder in self.strategy.read_shared()])
+
+    def test_shared_lock_holders_do_not_affect_exclusive_lock_file(self):
+        os.remove(self.path)
+        self.strategy.create_shared(123)
+        self.assertFalse(self.strategy.exists())
+
+    def test_read_queue_returns_empty_tuple_when_nobody_waits(self):
+        self.assertEqual((), self.strategy.read_queue())
+
+    def test_enqueue_writes_ticket_files_in_order(self):
+        strategy = File(self.path)
+        self.assertEqual(1, strategy.enqueue(123, {'start_time': '42'}))
+        self.assertEqual(2, strategy.enqueue(456))
+
+        queue = strategy.read_queue()
+
+        self.assertEqual([1, 2], [ticket for ticket, _ in queue])
+        self.assertEqual([123, 456], [snapshot.pid for _, snapshot in queue])
+        self.assertEqual({'start_time': '42'}, queue[0][1].meta)
+        self.assertTrue(os.path.exists(os.path.join(self.path + '.queue', '2')))
+
+    def test_enqueue_takes_next_ticket_when_other_waiter_is_faster(self):
+        def write(path, content):
+            if not self.atomic_writer.call_args_list[1:]:
+                # other waiter takes the same ticket in the meantime
+                open(path, 'w').close()
+                raise OSError(errno.EEXIST, 'exists')
+        self.atomic_writer.side_effect = write
+
+        self.assertEqual(2, self.strategy.enqueue(123))
+        self.assertEqual(os.path.join(self.path + '.queue', '1'),
+                         self.atomic_writer.call_args_list[0][0][0])
+
+    def test_dequeue_removes_ticket_file(self):
+        strategy = File(self.path)
+        strategy.enqueue(123)
+        strategy.enqueue(456)
+
+        strategy.dequeue(1)
+        strategy.dequeue(3)
+
+        self.assertEqual([2], [ticket for ticket, _ in strategy.read_queue()])
+
+    def test_read_ahead_opens_only_ticket_directly_ahead(self):
+        strategy = File(self.path)
+        for pid in (123, 456, 789):
+            strategy.enqueue(pid)
+
+        with mock.patch('os.open', side_effect=os.open) as open_mock:
+            self.assertEqual(456, strategy.read_ahead(3)[1].pid)
+        self.assertEqual(1, open_mock.call_count)
+
+        self.assertEqual(3, strategy.read_ahead(None)[0])
+        self.assertIsNone(strategy.read_ahead(1))
+        strategy.dequeue(2)
+        self.assertEqual(1, strategy.read_ahead(3)[0])
+
+    @unittest.skipUnless(_inotify.is_available(), 'inotify is not available')
+    def test_wait_dequeued_returns_as_soon_as_ticket_file_is_removed(self):
+        strategy = File(self.path)
+        strategy.enqueue(123)
+        strategy.enqueue(456)
+        timer = threading.Timer(0.05, strategy.dequeue, [1])
+        timer.start()
+        self.addCleanup(timer.join)
+        start = time.time()
+
+        self.assertTrue(strategy.wait_dequeued(1, 5))
+
+        self.assertLess(time.time() - start, 1)
+        # removal of other tickets is ignored
+        self.assertTrue(strategy.wait_dequeued(1, 0))
+        self.assertTrue(strategy.wait_dequeued(2, 0.1))
+        self.assertEqual([2], [ticket for ticket, _ in strategy.read_queue()])
+
+    def test_renew_updates_modification_time_of_lock_file(self):
+        os.utime(self.path, (1, 1))
+
+        self.assertTrue(self.strategy.renew())
+        self.assertGreater(self.strategy.get_create_date(), time.time() - 60)
+
+    def test_renew_returns_False_when_lock_file_does_not_exist(self):
+        os.remove(self.path)
+        self.assertFalse(self.strategy.renew())
+
+    def test_fingerprint_changes_when_lock_file_is_replaced(self):
+        fingerprint = self.strategy.fingerprint()
+        self.assertEqual(fingerprint, self.strategy.fingerprint())
+
+        (fd, other) = tempfile.mkstemp('.pid', 'pylock_test_lockfile')
+        os.close(fd)
+        os.rename(other, self.path)
+
+        self.assertNotEqual(fingerprint, self.strategy.fingerprint())
+
+    def test_fingerprint_is_None_when_lock_file_does_not_exist(self):
+        os.remove(self.path)
+        self.assertIsNone(self.strategy.fingerprint())
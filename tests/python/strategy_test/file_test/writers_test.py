@@ -1,42 +1,105 @@
 # encoding: utf-8
 """ Tests for pylock.strategy.file.writers module """
 
+import errno
 import os
+import shutil
+import stat
 import unittest
 import tempfile
 
+from pylock._compat import mock
+from pylock.strategy.file import writers
 from pylock.strategy.file.writers import atomic_write
 
-try:
-    import atomicwrites
-    has_atomic_writes = True
-except ImportError:
-    has_atomic_writes = False
 
 class AtomicWriteTest(unittest.TestCase):
 
     def setUp(self):
-        (_, self.path) = tempfile.mkstemp('.pid', 'pylock_test_atomic_write')
+        self.directory = tempfile.mkdtemp('pylock_test_atomic_write')
+        self.path = os.path.join(self.directory, 'lock.pid')
+        # support of anonymous files is remembered once probed
+        self.patcher = mock.patch.object(writers, '_O_TMPFILE', getattr(os, 'O_TMPFILE', None))
+        self.patcher.start()
 
     def tearDown(self):
-        try:
-            os.remove(self.path)
-        except:
-            pass
+        self.patcher.stop()
+        shutil.rmtree(self.directory)
 
-    @unittest.skipUnless(has_atomic_writes, 'atomicwrites package is missing')
-    def test_when_atomicwrites_package_is_present_and_file_does_not_exist_data_is_written(self):
-        os.remove(self.path)
-        atomic_write(self.path, 'foo')
+    def assertWritten(self, data):
         with open(self.path, 'r') as stream:
-            self.assertEqual('foo', stream.readline())
+            self.assertEqual(data, stream.read())
+        # no temporary files are left behind
+        self.assertEqual(['lock.pid'], os.listdir(self.directory))
 
-    @unittest.skipUnless(has_atomic_writes, 'atomicwrites package is missing')
-    def test_when_atomicwrites_package_is_present_and_file_exists_data_are_not_written(self):
-        with self.assertRaises(OSError):
+    def test_when_file_does_not_exist_data_is_written(self):
+        atomic_write(self.path, 'foo\nstart_time=1')
+        self.assertWritten('foo\nstart_time=1')
+
+    def test_when_file_exists_data_are_not_written(self):
+        atomic_write(self.path, 'foo')
+        with self.assertRaises(OSError) as context:
             atomic_write(self.path, 'bar')
+        self.assertEqual(errno.EEXIST, context.exception.errno)
+        self.assertWritten('foo')
+
+    def test_data_is_written_without_fsync(self):
+        with mock.patch('os.fsync') as fsync:
+            atomic_write(self.path, 'foo', fsync=False)
+        self.assertFalse(fsync.called)
+        self.assertWritten('foo')
+
+    def test_data_and_directory_are_flushed_by_default(self):
+        writers._O_TMPFILE = None
+        with mock.patch('os.fsync') as fsync:
+            atomic_write(self.path, 'foo')
+        self.assertEqual(2, fsync.call_count)
+
+    def test_anonymous_file_is_linked_into_place_when_supported(self):
+        if not writers._link_anonymous(self.directory, self.path, b'foo', False):
+            self.skipTest('anonymous files are not supported')
+        self.assertWritten('foo')
+        self.assertRaises(OSError, writers._link_anonymous,
+                          self.directory, self.path, b'bar', False)
+
+    def test_temporary_file_is_used_when_anonymous_files_are_not_supported(self):
+        writers._O_TMPFILE = None
+        atomic_write(self.path, 'foo')
+        self.assertRaises(OSError, atomic_write, self.path, 'bar')
+        self.assertWritten('foo')
+
+    def test_file_is_readable_to_everybody(self):
+        writers._O_TMPFILE = None
+        atomic_write(self.path, 'foo')
+        self.assertEqual(0o644, stat.S_IMODE(os.stat(self.path).st_mode))
+
+    def test_temporary_file_is_used_when_filesystem_rejects_anonymous_files(self):
+        writers._O_TMPFILE = 0o20000000
+        real_open = os.open
+
+        def open_(path, flags, *args):
+            if flags & writers._O_TMPFILE:
+                raise OSError(errno.EOPNOTSUPP, 'not supported')
+            return real_open(path, flags, *args)
 
-    @unittest.skipIf(has_atomic_writes, 'atomicwrites package is missing')
-    def test_when_atomicwrites_package_is_no_present_NotImplementedError_is_raised(self):
-        self.assertRaises(NotImplementedError, atomic_write, self.path, 'baz')
+        with mock.patch('os.open', side_effect=open_):
+            atomic_write(self.path, 'foo')
+        self.assertWritten('foo')
+
+    def test_file_is_written_relative_to_directory_descriptor(self):
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            atomic_write('lock.pid', 'foo', dir_fd=dir_fd)
+            self.assertRaises(OSError, atomic_write, 'lock.pid', 'bar', dir_fd=dir_fd)
+            self.assertWritten('foo')
+
+            os.remove(self.path)
+            writers._O_TMPFILE = None
+            atomic_write('lock.pid', 'bar', dir_fd=dir_fd)
+            self.assertRaises(OSError, atomic_write, 'lock.pid', 'baz', dir_fd=dir_fd)
+            self.assertWritten('bar')
+        finally:
+            os.close(dir_fd)
 
+    def test_errors_are_raised(self):
+        self.assertRaises(OSError, atomic_write, os.path.join(self.path, 'missing', 'a'), 'foo')
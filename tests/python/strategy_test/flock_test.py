@@ -0,0 +1,151 @@
+# encoding: utf-8
+""" Tests for pylock.strategy.flock module """
+
+from pylock._compat import mock
+import os
+import subprocess
+import sys
+import unittest
+import tempfile
+import threading
+import time
+
+from pylock import Lock, SharedLock, _inotify
+from pylock.pid_owner_client import Client
+from pylock.states import LockState
+from pylock.strategy import Snapshot
+from pylock.strategy.flock import Flock
+
+
+class FlockTest(unittest.TestCase):
+
+    def setUp(self):
+        (fd, self.path) = tempfile.mkstemp('.pid', 'pylock_test_flock')
+        os.close(fd)
+        self.strategy = Flock(self.path)
+        self.other = Flock(self.path)
+
+    def tearDown(self):
+        self.strategy.clean()
+        self.other.clean()
+        for path in (self.path, self.path + '.token'):
+            try:
+                os.remove(path)
+            except:
+                pass
+
+    def test_tokens_are_issued_to_lock_holder_only(self):
+        self.assertIsNone(self.strategy.issue_token(123))
+        self.strategy.create(123)
+        self.assertIsNone(self.other.issue_token(123))
+        self.assertIsNone(self.strategy.issue_token(456))
+
+        self.assertEqual(1, self.strategy.issue_token(123))
+        self.assertEqual({'token': '1'}, self.other.read().meta)
+
+        self.strategy.clean()
+        self.other.create(456)
+        self.assertEqual(2, self.other.issue_token(456))
+
+    def test_read_returns_empty_snapshot_when_nobody_holds_lock(self):
+        with open(self.path, 'w') as stream:
+            stream.write('123')
+        self.assertEqual(Snapshot(), self.strategy.read())
+
+    def test_read_returns_empty_snapshot_when_file_does_not_exist(self):
+        os.remove(self.path)
+        self.assertEqual(Snapshot(), self.strategy.read())
+        self.assertFalse(self.strategy.exists())
+
+    def test_create_obtains_lock_and_writes_pid(self):
+        self.assertTrue(self.strategy.create(123))
+
+        snapshot = self.other.read()
+        self.assertTrue(snapshot.exists)
+        self.assertEqual(123, snapshot.pid)
+        self.assertEqual(123, self.strategy.read().pid)
+
+    def test_create_fails_when_lock_is_held_by_other_instance(self):
+        self.assertTrue(self.strategy.create(123))
+        self.assertFalse(self.other.create(456))
+        self.assertEqual(123, self.other.read().pid)
+
+    def test_create_creates_missing_lock_file(self):
+        os.remove(self.path)
+        self.assertTrue(self.strategy.create(123))
+        self.assertTrue(self.other.exists())
+
+    def test_clean_releases_lock_but_keeps_file(self):
+        self.strategy.create(123)
+        self.strategy.clean()
+
+        self.assertFalse(self.other.exists())
+        self.assertTrue(os.path.exists(self.path))
+        self.assertTrue(self.other.create(456))
+
+    def test_clean_does_not_release_lock_held_by_other_instance(self):
+        self.strategy.create(123)
+        self.other.clean()
+        self.assertTrue(self.other.exists())
+
+    def test_strategy_manages_liveness(self):
+        self.assertTrue(self.strategy.manages_liveness)
+
+    def test_lock_held_by_process_of_unknown_pid_is_respected(self):
+        # holder has not written its pid yet (or it is not visible here)
+        for content in ('', '99999999'):
+            script = ('import fcntl, os, sys; fd = os.open({0!r}, os.O_RDWR); '
+                      'fcntl.flock(fd, fcntl.LOCK_EX); os.ftruncate(fd, 0); '
+                      'os.write(fd, {1!r}.encode()); print(); sys.stdout.flush(); '
+                      'sys.stdin.read()').format(self.path, content)
+            holder = subprocess.Popen([sys.executable, '-c', script],
+                                      stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            try:
+                holder.stdout.readline()
+                client = mock.MagicMock(spec=Client, **{'identify.return_value': {}})
+                lock = Lock(Flock(self.path), pid_owner_client=client)
+
+                self.assertEqual(LockState.LOCKED, lock.acquire(blocking=False))
+                self.assertFalse(client.is_alive.called)
+            finally:
+                holder.stdin.close()
+                holder.wait()
+
+    def test_shared_and_fair_locks_are_not_supported(self):
+        self.assertRaises(NotImplementedError, Lock, self.strategy, fair=True)
+        self.assertRaises(NotImplementedError, SharedLock(self.strategy).acquire)
+
+    def test_lock_is_released_when_owner_process_dies(self):
+        pid = os.fork()
+        if pid == 0: # pragma: no cover
+            Flock(self.path).create(os.getpid())
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.assertFalse(self.strategy.exists())
+        self.assertTrue(self.strategy.create(123))
+
+    def test_child_process_does_not_release_lock_held_by_parent(self):
+        self.strategy.create(123)
+
+        pid = os.fork()
+        if pid == 0: # pragma: no cover
+            self.strategy.clean()
+            os._exit(0 if self.strategy.create(456) is False else 1)
+        self.assertEqual(0, os.waitpid(pid, 0)[1])
+
+        self.assertEqual(123, self.other.read().pid)
+        self.assertFalse(self.other.create(789))
+
+    @unittest.skipUnless(_inotify.is_available(), 'inotify is not available')
+    def test_wait_returns_as_soon_as_owner_releases_lock(self):
+        self.other.create(456)
+        timer = threading.Timer(0.05, self.other.clean)
+        timer.start()
+        start = time.time()
+
+        self.assertTrue(self.strategy.wait(5))
+
+        self.assertLess(time.time() - start, 1)
+        self.assertTrue(self.strategy.create(123))
+        timer.join()
@@ -0,0 +1,42 @@
+# encoding: utf-8
+""" Tests for pylock.strategy.memory module """
+import unittest
+
+from pylock import Lock
+from pylock.strategy.memory import Memory, Store
+
+from strategy_mixin import StrategyTestMixin
+
+
+class MemoryTest(StrategyTestMixin, unittest.TestCase):
+
+    renewal_keeps_fingerprint = False
+    supports_shared_locks = True
+
+    def create_strategies(self):
+        self.store = Store()
+        return (Memory('a', self.store, self.current_time_provider),
+                Memory('a', self.store, self.current_time_provider))
+
+    def test_tokens_of_different_locks_are_independent(self):
+        self.strategy.create(99)
+        self.assertEqual(1, self.strategy.issue_token(99))
+
+        Memory('b', self.store).create(99)
+        self.assertEqual(1, Memory('b', self.store).issue_token(99))
+
+    def test_locks_of_different_names_or_stores_are_independent(self):
+        self.strategy.create(99)
+        self.assertFalse(Memory('b', self.store).exists())
+        self.assertFalse(Memory('a', Store()).exists())
+        self.assertNotEqual(self.strategy.key, Memory('a', Store()).key)
+        self.assertEqual(self.strategy.key, self.other.key)
+
+    def test_fencing_token_is_stored_in_lock_record(self):
+        lock = Lock(Memory('f', self.store), fencing=True)
+
+        with lock:
+            self.assertEqual(1, lock.token)
+            self.assertEqual('1', Memory('f', self.store).read().meta['token'])
+        with lock:
+            self.assertEqual(2, lock.token)
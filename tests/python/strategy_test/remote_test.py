@@ -0,0 +1,124 @@
+# encoding: utf-8
+""" Tests for pylock.strategy.remote module """
+from pylock._compat import mock
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from pylock import Lock
+from pylock.server import LockServer
+from pylock.strategy.remote import LockClient, RemoteError
+
+from strategy_mixin import StrategyTestMixin
+
+
+class RemoteTest(StrategyTestMixin, unittest.TestCase):
+
+    supports_shared_locks = True
+
+    def create_strategies(self):
+        self.directory = tempfile.mkdtemp('pylock_test_remote')
+        self.path = os.path.join(self.directory, 'pylock.sock')
+        self.server = LockServer(self.path, self.current_time_provider).start(0.01)
+        self.client = LockClient(self.path)
+        self.other_client = LockClient(self.path)
+        return self.client.lock('a'), self.other_client.lock('a')
+
+    def tearDown(self):
+        self.client.close()
+        self.other_client.close()
+        self.server.shutdown()
+        shutil.rmtree(self.directory)
+
+    def test_strategy_manages_liveness(self):
+        self.assertTrue(self.strategy.manages_liveness)
+
+    def test_create_many_creates_all_records_or_none(self):
+        self.other_client.lock('c').create(1)
+
+        self.assertTrue(self.client.create_many(['a', 'b'], 99))
+        self.assertFalse(self.client.create_many(['x', 'c', 'y'], 99))
+
+        self.assertEqual(['a', 'b', 'c'], sorted(self.client.held()))
+        self.client.clean_many(['a', 'b'])
+        self.assertEqual(['c'], sorted(self.client.held()))
+
+    def test_large_batch_does_not_deadlock_client_and_server(self):
+        names = ['lock{0}'.format(index) for index in range(20000)]
+
+        self.assertTrue(self.client.create_many(names, 99))
+
+        self.assertEqual(20000, len(self.client.held()))
+        self.client.clean_many(names)
+        self.assertEqual({}, self.client.held())
+
+    def test_request_times_out_when_server_does_not_respond(self):
+        path = os.path.join(self.directory, 'silent.sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(2)
+
+        def serve():
+            connections = []
+            # anchor connection and connection serving requests
+            for _ in range(2):
+                connection, _ = listener.accept()
+                connections.append(connection)
+                stream = connection.makefile('rb')
+                # session is accepted, requests are never answered
+                stream.readline()
+                connection.sendall(b'{"result": null}\n')
+            time.sleep(0.5)
+            for connection in connections:
+                connection.close()
+        thread = threading.Thread(target=serve)
+        thread.start()
+        client = LockClient(path, timeout=0.1)
+        try:
+            self.assertRaises(RemoteError, client.lock('a').read)
+        finally:
+            client.close()
+            thread.join()
+            listener.close()
+
+    def test_connections_are_reused(self):
+        with mock.patch.object(self.client, '_connect', wraps=self.client._connect) as connect:
+            for _ in range(3):
+                self.strategy.read()
+        # anchor connection and single connection serving requests
+        self.assertEqual(2, connect.call_count)
+
+    def test_child_process_uses_own_session(self):
+        self.strategy.read()
+
+        pid = os.fork()
+        if pid == 0: # pragma: no cover
+            ok = self.client.lock('b').create(os.getpid())
+            os._exit(0 if ok else 1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, status)
+        # lock of child is released when it exits (once server notices it)
+        deadline = time.time() + 5
+        while self.client.lock('b').exists() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(self.client.lock('b').exists())
+
+    def test_lock_is_not_obtained_by_other_process(self):
+        lock = Lock(self.client.lock('b'))
+
+        with lock:
+            self.assertTrue(lock.has_lock)
+
+            pid = os.fork()
+            if pid == 0: # pragma: no cover
+                other = Lock(LockClient(self.path).lock('b'))
+                os._exit(1 if other.acquire(blocking=False).is_owner else 0)
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(0, status)
+        self.assertFalse(lock.has_lock)
+
@@ -0,0 +1,49 @@
+# encoding: utf-8
+""" Tests for pylock.strategy.shm module """
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylock.strategy.shm import SharedMemory, CAPACITY
+
+from strategy_mixin import StrategyTestMixin
+
+
+class SharedMemoryTest(StrategyTestMixin, unittest.TestCase):
+
+    def create_strategies(self):
+        self.directory = tempfile.mkdtemp('pylock_test_shm')
+        return (SharedMemory('a', self.directory, self.current_time_provider),
+                SharedMemory('a', self.directory, self.current_time_provider))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_create_rejects_records_exceeding_capacity(self):
+        self.assertRaises(ValueError, self.strategy.create, 99, {'a': 'x' * CAPACITY})
+
+    def test_issuing_token_keeps_fingerprint(self):
+        self.strategy.create(99)
+        fingerprint = self.strategy.fingerprint()
+
+        self.strategy.issue_token(99)
+        self.assertEqual(fingerprint, self.other.fingerprint())
+
+    def test_invalid_names_are_rejected(self):
+        self.assertRaises(ValueError, SharedMemory, '', self.directory)
+        self.assertRaises(ValueError, SharedMemory, 'a/b', self.directory)
+
+    def test_record_is_shared_with_other_processes(self):
+        self.strategy.create(99)
+
+        pid = os.fork()
+        if pid == 0: # pragma: no cover
+            other = SharedMemory('a', self.directory)
+            ok = other.read_pid() == 99 and not other.create(os.getpid())
+            other.clean()
+            os._exit(0 if ok else 1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, status)
+        self.assertFalse(self.strategy.exists())
@@ -0,0 +1,141 @@
+# encoding: utf-8
+""" Tests for pylock.strategy.sqlite module """
+from pylock._compat import mock
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from pylock import Lock
+from pylock.strategy import Snapshot
+from pylock.strategy.sqlite import LockDatabase
+
+from strategy_mixin import StrategyTestMixin
+
+
+class LockDatabaseTest(StrategyTestMixin, unittest.TestCase):
+
+    supports_shared_locks = True
+
+    def create_strategies(self):
+        self.directory = tempfile.mkdtemp('pylock_test_sqlite')
+        self.path = os.path.join(self.directory, 'locks.db')
+        self.database = LockDatabase(self.path, current_time_provider=self.current_time_provider)
+        return (self.database.lock('a'),
+                LockDatabase(self.path, current_time_provider=self.current_time_provider).lock('a'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_create_many_creates_all_records(self):
+        self.assertTrue(self.database.create_many(['a', 'b', 'c'], 99))
+
+        self.assertEqual(['a', 'b', 'c'], sorted(self.database.held()))
+
+    def test_create_many_creates_nothing_when_any_lock_is_held(self):
+        self.database.lock('b').create(1)
+
+        self.assertFalse(self.database.create_many(['a', 'b', 'c'], 99))
+
+        self.assertEqual(['b'], sorted(self.database.held()))
+        self.assertEqual(1, self.database.lock('b').read_pid())
+
+    def test_create_many_takes_over_stale_records(self):
+        self.database.lock('b').create(1)
+        self.database.lock('c').create(2)
+        is_stale = mock.MagicMock(side_effect=lambda snapshot: snapshot.pid == 1)
+
+        self.assertFalse(self.database.create_many(['a', 'b', 'c'], 99, is_stale=is_stale))
+        self.assertEqual({'b': 1, 'c': 2}, dict((name, snapshot.pid) for name, snapshot
+                                                in self.database.held().items()))
+
+        self.database.lock('c').clean()
+        self.assertTrue(self.database.create_many(['a', 'b', 'c'], 99, is_stale=is_stale))
+        self.assertEqual({'a': 99, 'b': 99, 'c': 99}, dict(
+            (name, snapshot.pid) for name, snapshot in self.database.held().items()))
+        is_stale.assert_called_with(Snapshot(True, 1, 123))
+
+    def test_create_many_is_rolled_back_when_stale_record_check_fails(self):
+        self.database.lock('b').create(1)
+        is_stale = mock.MagicMock(side_effect=RuntimeError)
+
+        self.assertRaises(RuntimeError, self.database.create_many, ['a', 'b'], 99,
+                          is_stale=is_stale)
+        self.assertEqual(['b'], sorted(self.database.held()))
+
+    def test_stale_record_taken_over_by_other_contender_is_kept(self):
+        self.strategy.create(1)
+        fingerprint = self.strategy.fingerprint()
+        # other contender takes the record over first
+        self.other.clean_stale(fingerprint)
+        self.other.create(2)
+
+        self.strategy.clean_stale(fingerprint)
+
+        self.assertEqual(2, self.strategy.read_pid())
+
+    def test_lock_takes_over_record_of_dead_owner(self):
+        self.strategy.create(99999999)
+        lock = Lock(self.database.lock('a'))
+
+        with lock:
+            self.assertEqual(lock.pid, self.other.read_pid())
+
+    def test_clean_many_removes_given_records(self):
+        self.database.create_many(['a', 'b', 'c'], 99)
+
+        self.database.clean_many(['a', 'c', 'd'])
+
+        self.assertEqual(['b'], sorted(self.database.held()))
+
+    def test_locks_may_be_queried_by_owner_and_age(self):
+        self.database.lock('a').create(1)
+        self.current_time_provider.return_value = 200
+        self.database.lock('b').create(2)
+        self.database.lock('c').create(1)
+
+        self.assertEqual(['a', 'c'], sorted(self.database.held_by(1)))
+        self.assertEqual({'a': Snapshot(True, 1, 123)}, self.database.older_than(150))
+
+    def test_tokens_and_queues_of_different_locks_are_independent(self):
+        self.strategy.create(99)
+        self.assertEqual(1, self.strategy.issue_token(99))
+        self.database.lock('b').create(99)
+        self.assertEqual(1, self.database.lock('b').issue_token(99))
+
+        first = self.strategy.enqueue(1)
+        self.database.lock('b').enqueue(2)
+        third = self.other.enqueue(3)
+        self.assertEqual(first, self.other.read_ahead(third)[0])
+        self.assertEqual([first, third], [ticket for ticket, _ in self.other.read_queue()])
+
+    def test_invalid_names_are_rejected(self):
+        self.assertRaises(ValueError, self.database.lock, '')
+
+    def test_each_thread_uses_own_connection(self):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(self.other.create(100)))
+        self.strategy.create(99)
+
+        thread.start()
+        thread.join()
+
+        self.assertEqual([False], results)
+
+    def test_record_is_shared_with_other_processes(self):
+        self.strategy.create(99)
+
+        pid = os.fork()
+        if pid == 0: # pragma: no cover
+            other = self.database.lock('a')
+            ok = other.read_pid() == 99 and not other.create(os.getpid())
+            other.clean()
+            ok = ok and self.database.lock('b').create(os.getpid())
+            os._exit(0 if ok else 1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, status)
+        self.assertFalse(self.strategy.exists())
+        self.assertEqual(pid, self.database.lock('b').read_pid())
+
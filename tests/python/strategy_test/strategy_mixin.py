@@ -0,0 +1,178 @@
+# encoding: utf-8
+""" Checks shared by tests of locking strategies """
+from pylock._compat import mock
+import threading
+
+from pylock import Lock, SharedLock
+from pylock.strategy import Snapshot
+
+
+class StrategyTestMixin(object):
+    """Checks every strategy keeping lock records has to pass.
+
+    Test case mixing it in creates two strategies of the same lock in
+    :meth:`create_strategies` - `strategy` and `other` (seen by another
+    client where strategy has clients) - both reading current time from
+    `current_time_provider`. Checks of optional features are skipped
+    for strategies which do not support them.
+    """
+
+    # whether renewal keeps fingerprint (record is not replaced)
+    renewal_keeps_fingerprint = True
+    # whether shared lock holders are supported
+    supports_shared_locks = False
+
+    def setUp(self):
+        super(StrategyTestMixin, self).setUp()
+        self.current_time_provider = mock.MagicMock(return_value=123)
+        self.strategy, self.other = self.create_strategies()
+
+    def create_strategies(self):
+        """ Creates strategies of the same lock
+
+        :returns: `strategy` and `other` pair
+        :rtype: tuple
+        """
+        raise NotImplementedError()
+
+    def test_read_returns_empty_snapshot_when_nobody_holds_lock(self):
+        self.assertEqual(Snapshot(), self.strategy.read())
+        self.assertFalse(self.strategy.exists())
+
+    def test_create_stores_record_visible_to_other_strategies(self):
+        self.assertTrue(self.strategy.create(99, {'start_time': '42'}))
+
+        self.assertEqual(Snapshot(True, 99, 123, {'start_time': '42'}), self.other.read())
+        self.assertEqual(99, self.other.read_pid())
+        self.assertEqual(123, self.other.get_create_date())
+
+    def test_create_fails_when_record_exists(self):
+        self.strategy.create(99)
+        self.assertFalse(self.other.create(100))
+        self.assertEqual(99, self.strategy.read_pid())
+
+    def test_clean_removes_record(self):
+        self.strategy.create(99)
+        self.other.clean()
+        self.assertFalse(self.strategy.exists())
+
+    def test_renew_updates_create_date(self):
+        self.assertFalse(self.strategy.renew())
+        self.strategy.create(99)
+        self.current_time_provider.return_value = 200
+
+        self.assertTrue(self.strategy.renew())
+        self.assertEqual(200, self.other.get_create_date())
+
+    def test_fingerprint_changes_when_record_is_replaced_but_not_renewed(self):
+        if not self.renewal_keeps_fingerprint:
+            self.skipTest('fingerprint changes along with create date')
+        missing = self.strategy.fingerprint()
+        self.strategy.create(99)
+        fingerprint = self.strategy.fingerprint()
+        self.assertNotEqual(missing, fingerprint)
+
+        self.current_time_provider.return_value = 200
+        self.strategy.renew()
+        self.assertEqual(fingerprint, self.other.fingerprint())
+
+        self.strategy.clean()
+        self.strategy.create(99)
+        self.assertNotEqual(fingerprint, self.other.fingerprint())
+
+    def test_tokens_are_issued_to_lock_holder_only(self):
+        self.assertIsNone(self.strategy.issue_token(99))
+        self.strategy.create(99)
+        self.assertIsNone(self.other.issue_token(100))
+
+        first = self.strategy.issue_token(99)
+        self.assertEqual({'token': str(first)}, self.other.read().meta)
+
+        self.strategy.clean()
+        self.assertIsNone(self.strategy.issue_token(99))
+        self.other.create(100)
+        self.assertEqual(first + 1, self.other.issue_token(100))
+
+    def test_wait_returns_as_soon_as_record_is_removed(self):
+        if not self.strategy.wait(0):
+            self.skipTest('strategy does not wait for lock release')
+        self.strategy.create(99)
+        timer = threading.Timer(0.05, self.other.clean)
+        timer.start()
+        self.addCleanup(timer.join)
+
+        self.assertTrue(self.strategy.wait(5))
+        self.assertFalse(self.strategy.exists())
+
+    def test_shared_holders_are_registered_and_removed(self):
+        if not self.supports_shared_locks:
+            self.skipTest('strategy does not support shared locks')
+        self.assertTrue(self.strategy.create_shared(1, {'start_time': '1'}))
+        self.other.create_shared(2)
+
+        self.assertEqual([Snapshot(True, 1, 123, {'start_time': '1'}), Snapshot(True, 2, 123)],
+                         sorted(self.other.read_shared()))
+
+        self.strategy.clean_shared(1)
+        self.other.clean_shared(2)
+        self.assertEqual((), self.strategy.read_shared())
+
+    def test_waiters_are_queued_in_order(self):
+        if not self.strategy.queues_waiters:
+            self.skipTest('strategy does not queue waiters')
+        first = self.strategy.enqueue(1, {'start_time': '1'})
+        second = self.other.enqueue(2)
+
+        self.assertLess(first, second)
+        self.assertEqual(((first, Snapshot(True, 1, 123, {'start_time': '1'})),
+                          (second, Snapshot(True, 2, 123))), self.other.read_queue())
+
+        self.other.dequeue(first)
+        self.assertEqual([second], [ticket for ticket, _ in self.strategy.read_queue()])
+        self.assertLess(second, self.strategy.enqueue(3))
+
+    def test_read_ahead_returns_waiter_directly_ahead(self):
+        if not self.strategy.queues_waiters:
+            self.skipTest('strategy does not queue waiters')
+        first = self.strategy.enqueue(1)
+        second = self.other.enqueue(2)
+        third = self.other.enqueue(3, {'start_time': '1'})
+
+        self.assertEqual((second, Snapshot(True, 2, 123)), self.other.read_ahead(third))
+        self.assertEqual((third, Snapshot(True, 3, 123, {'start_time': '1'})),
+                         self.other.read_ahead(None))
+        self.assertIsNone(self.other.read_ahead(first))
+
+        self.strategy.dequeue(second)
+        self.assertEqual(first, self.other.read_ahead(third)[0])
+
+    def test_wait_dequeued_returns_once_waiter_leaves_queue(self):
+        if not self.strategy.queues_waiters or not self.strategy.wait_dequeued(0, 0):
+            self.skipTest('strategy does not wait for waiters')
+        first = self.strategy.enqueue(1)
+        second = self.strategy.enqueue(2)
+        timer = threading.Timer(0.05, self.other.dequeue, [first])
+        timer.start()
+        self.addCleanup(timer.join)
+
+        self.assertTrue(self.strategy.wait_dequeued(first, 5))
+        self.assertEqual([second], [ticket for ticket, _ in self.strategy.read_queue()])
+
+    def test_strategy_works_with_lock(self):
+        lock = Lock(self.strategy)
+
+        with lock:
+            self.assertTrue(lock.has_lock)
+            self.assertEqual(lock.pid, self.other.read_pid())
+        self.assertFalse(lock.has_lock)
+        self.assertFalse(self.other.exists())
+
+    def test_strategy_works_with_shared_lock(self):
+        if not self.supports_shared_locks:
+            self.skipTest('strategy does not support shared locks')
+        lock = SharedLock(self.strategy)
+
+        with lock:
+            self.assertTrue(lock.has_lock)
+            self.assertEqual([lock.pid], [holder.pid for holder in self.other.read_shared()])
+        self.assertEqual((), self.other.read_shared())
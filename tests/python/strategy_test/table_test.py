@@ -0,0 +1,137 @@
+# encoding: utf-8
+""" Tests for pylock.strategy.table module """
+from pylock._compat import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from pylock.strategy import Snapshot
+from pylock.strategy.table import LockTable, TableFullError
+
+from strategy_mixin import StrategyTestMixin
+
+
+class LockTableTest(StrategyTestMixin, unittest.TestCase):
+
+    def create_strategies(self):
+        self.directory = tempfile.mkdtemp('pylock_test_table')
+        self.path = os.path.join(self.directory, 'locks.table')
+        self.table = LockTable(self.path, slots=8, current_time_provider=self.current_time_provider)
+        return (self.table.lock('a'),
+                LockTable(self.path, current_time_provider=self.current_time_provider).lock('a'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_create_rejects_records_exceeding_record_size(self):
+        self.assertRaises(ValueError, self.strategy.create, 99, {'a': 'x' * 256})
+
+    def test_clean_frees_slot(self):
+        self.strategy.create(99)
+        self.strategy.clean()
+        self.assertTrue(self.other.create(100))
+
+    def test_locks_do_not_interfere(self):
+        names = ['lock{0}'.format(index) for index in range(8)]
+        for index, name in enumerate(names):
+            self.assertTrue(self.table.lock(name).create(index))
+
+        for index, name in enumerate(names):
+            self.assertEqual(index, self.table.lock(name).read_pid())
+
+        self.table.lock('lock3').clean()
+        self.assertFalse(self.table.lock('lock3').exists())
+        self.assertEqual(4, self.table.lock('lock4').read_pid())
+
+    def test_create_raises_when_table_is_full(self):
+        for index in range(8):
+            self.table.lock('lock{0}'.format(index)).create(index)
+
+        self.assertRaises(TableFullError, self.table.lock('other').create, 99)
+
+    def test_freed_slots_are_reused(self):
+        for index in range(8):
+            self.table.lock('lock{0}'.format(index)).create(index)
+        self.table.lock('lock5').clean()
+
+        self.assertTrue(self.table.lock('other').create(99))
+        self.assertEqual(99, self.table.lock('other').read_pid())
+        self.assertFalse(self.table.lock('lock5').exists())
+
+    def test_released_lock_keeps_its_slot(self):
+        table = self.table._file
+        with mock.patch.object(type(table), 'assign', autospec=True,
+                               side_effect=type(table).assign) as assign:
+            for _ in range(5):
+                self.assertTrue(self.strategy.create(99))
+                self.strategy.clean()
+
+        self.assertEqual(1, assign.call_count)
+
+    def test_slots_of_released_locks_are_reclaimed(self):
+        held = [self.table.lock('held{0}'.format(index)) for index in range(3)]
+        for index, strategy in enumerate(held):
+            strategy.create(index)
+
+        for index in range(3000):
+            strategy = self.table.lock('lock{0}'.format(index))
+            self.assertTrue(strategy.create(99))
+            strategy.clean()
+
+        table = self.table._file
+        used = [slot for slot in range(table.slots) if table.header_of(slot)[0]]
+        # released locks are reclaimed once three quarters of slots are used
+        self.assertLessEqual(len(used), 6)
+        for index, strategy in enumerate(held):
+            self.assertEqual(index, self.table.lock('held{0}'.format(index)).read_pid())
+            self.assertEqual(index, strategy.read_pid())
+
+    def test_held_returns_all_held_locks(self):
+        self.table.lock('a').create(1)
+        self.table.lock('b').create(2)
+        self.table.lock('c').create(3)
+        self.table.lock('c').clean()
+
+        held = self.table.held()
+
+        self.assertEqual(['a', 'b'], sorted(held))
+        self.assertEqual(2, held['b'].pid)
+
+    def test_issued_tokens_grow_across_all_locks_of_table(self):
+        self.strategy.create(99)
+        fingerprint = self.strategy.fingerprint()
+        self.assertEqual(1, self.strategy.issue_token(99))
+        self.assertEqual(Snapshot(True, 99, 123, {'token': '1'}), self.other.read())
+        self.assertEqual(fingerprint, self.other.fingerprint())
+
+        self.table.lock('b').create(99)
+        self.assertEqual(2, self.table.lock('b').issue_token(99))
+
+    def test_invalid_names_are_rejected(self):
+        self.assertRaises(ValueError, self.table.lock, '')
+        self.assertRaises(ValueError, self.table.lock, 'x' * 65)
+
+    def test_other_files_are_rejected(self):
+        path = os.path.join(self.directory, 'other')
+        with open(path, 'wb') as f:
+            f.write(b'x' * 64)
+
+        self.assertRaises(ValueError, LockTable(path).lock('a').read)
+
+    def test_record_is_shared_with_other_processes(self):
+        self.strategy.create(99)
+
+        pid = os.fork()
+        if pid == 0: # pragma: no cover
+            other = LockTable(self.path).lock('a')
+            ok = other.read_pid() == 99 and not other.create(os.getpid())
+            other.clean()
+            ok = ok and LockTable(self.path).lock('b').create(os.getpid())
+            os._exit(0 if ok else 1)
+
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(0, status)
+        self.assertFalse(self.strategy.exists())
+        self.assertEqual(pid, self.table.lock('b').read_pid())
+
@@ -0,0 +1,116 @@
+# encoding: utf-8
+""" Tests for pylock.sweeper module """
+from pylock._compat import mock
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+from pylock.pid_owner_client import Client
+from pylock.states import LockState
+from pylock.sweeper import Sweeper
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', ''])
+    process.wait()
+    return process.pid
+
+
+class SweeperTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp('pylock_test_sweeper')
+        self.client = mock.MagicMock(spec=Client)
+        self.alive = set([os.getppid()])
+        self.client.is_alive_many.side_effect = lambda pids, metas: dict(
+            (pid, pid in self.alive) for pid in pids)
+        self.client.terminate.return_value = True
+        self.current_time_provider = mock.MagicMock(return_value=os.path.getmtime(self.directory))
+        self.sweeper = Sweeper(self.directory, max_age=60, pid_owner_client=self.client,
+                               current_time_provider=self.current_time_provider)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        with open(os.path.join(self.directory, name), 'w') as stream:
+            stream.write(content)
+
+    def test_sweep_removes_orphaned_locks_only(self):
+        self.write('live.pid', str(os.getppid()))
+        self.write('orphan.pid', str(dead_pid()))
+        self.write('other.txt', str(dead_pid()))
+
+        report = self.sweeper.sweep()
+
+        self.assertEqual({'live': LockState.LOCKED, 'orphan': LockState.ORPHANED},
+                         report.states)
+        self.assertEqual(['orphan'], report.removed)
+        self.assertEqual(['live.pid', 'other.txt'], sorted(os.listdir(self.directory)))
+
+    def test_sweep_checks_liveness_in_single_batch(self):
+        self.write('a.pid', '1\nstart_time=42')
+        self.write('b.pid', '2')
+
+        self.sweeper.sweep()
+
+        self.client.is_alive_many.assert_called_once_with(
+            frozenset([1, 2]), {1: {'start_time': '42'}, 2: {}})
+        self.assertEqual(0, self.client.is_alive.call_count)
+
+    def test_sweep_only_reports_outdated_locks_by_default(self):
+        self.write('old.pid', str(os.getppid()))
+        self.current_time_provider.return_value += 120
+
+        report = self.sweeper.sweep()
+
+        self.assertEqual({'old': LockState.OUTDATED}, report.states)
+        self.assertEqual([], report.removed)
+        self.assertEqual(0, self.client.terminate.call_count)
+
+    def test_sweep_terminates_owners_of_outdated_locks_when_asked_to(self):
+        self.write('old.pid', str(os.getppid()))
+        self.current_time_provider.return_value += 120
+        sweeper = Sweeper(self.directory, max_age=60, kill=True, pid_owner_client=self.client,
+                          current_time_provider=self.current_time_provider)
+
+        self.assertEqual(['old'], sweeper.sweep().removed)
+        self.client.terminate.assert_called_once_with(os.getppid(), {})
+
+    def test_sweep_keeps_outdated_lock_when_owner_could_not_be_terminated(self):
+        self.write('old.pid', str(os.getppid()))
+        self.current_time_provider.return_value += 120
+        self.client.terminate.return_value = False
+        sweeper = Sweeper(self.directory, max_age=60, kill=True, pid_owner_client=self.client,
+                          current_time_provider=self.current_time_provider)
+
+        self.assertEqual([], sweeper.sweep().removed)
+        self.assertEqual(['old.pid'], os.listdir(self.directory))
+
+    def test_sweep_removes_orphaned_shared_holders(self):
+        os.mkdir(os.path.join(self.directory, 'a.pid.shared'))
+        self.write('a.pid.shared/{0}'.format(os.getppid()), '')
+        self.write('a.pid.shared/{0}'.format(dead_pid()), '')
+
+        report = self.sweeper.sweep()
+
+        self.assertEqual({}, report.states)
+        self.assertEqual([str(os.getppid())],
+                         os.listdir(os.path.join(self.directory, 'a.pid.shared')))
+
+    def test_run_sweeps_until_stopped(self):
+        stop = threading.Event()
+        reports = []
+
+        def callback(report):
+            reports.append(report)
+            if len(reports) == 2:
+                stop.set()
+
+        self.sweeper.run(0, stop, callback)
+
+        self.assertEqual(2, len(reports))